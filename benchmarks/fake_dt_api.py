@@ -0,0 +1,154 @@
+# Local stand-in for Deep Town stats API (dtat.hampl.space) serving synthetic or recorded payloads
+# Run standalone with `python -m benchmarks.fake_dt_api --port 8089` and set data_manager.dt_api_url to `http://127.0.0.1:8089`
+
+import argparse
+import asyncio
+import dataclasses
+import datetime
+import json
+import os
+import random
+from typing import Optional, Dict, List
+from aiohttp import web
+
+@dataclasses.dataclass
+class FakeDTApiOptions:
+  number_of_guilds: int = 1000
+  players_per_guild: int = 40 # Payload size, every guild has between half and full number of players
+  latency_ms: float = 50.0
+  latency_jitter_ms: float = 20.0
+  error_rate: float = 0.0 # Ratio of guild requests answered with HTTP 500
+  change_rate: float = 1.0 # Ratio of guild requests returning changed contributions
+  payload_dir: Optional[str] = None # Folder with recorded `guilds.json` and `guild_<id>.json` responses
+  seed: int = 0
+
+class FakeDTApi:
+  def __init__(self, options: FakeDTApiOptions):
+    self.options = options
+    self.random = random.Random(options.seed)
+    self.started_at = datetime.datetime.now(datetime.UTC).replace(microsecond=0)
+
+    self.guild_requests = 0
+    self.guild_list_requests = 0
+    self.errors = 0
+
+    self.recorded_guilds: Dict[int, dict] = {}
+    self.recorded_guild_list: Optional[dict] = None
+    if options.payload_dir is not None:
+      self._load_recorded_payloads(options.payload_dir)
+
+    self.guild_ids: List[int] = list(self.recorded_guilds.keys()) if self.recorded_guilds else list(range(1, options.number_of_guilds + 1))
+    self.guild_versions: Dict[int, int] = {guild_id: 0 for guild_id in self.guild_ids}
+
+  def _load_recorded_payloads(self, payload_dir: str):
+    for filename in os.listdir(payload_dir):
+      with open(os.path.join(payload_dir, filename), "r", encoding="utf-8") as f:
+        if filename == "guilds.json":
+          self.recorded_guild_list = json.load(f)
+        elif filename.startswith("guild_") and filename.endswith(".json"):
+          payload = json.load(f)
+          self.recorded_guilds[int(payload["id"])] = payload
+
+  def create_app(self) -> web.Application:
+    app = web.Application()
+    app.router.add_get("/data/guilds", self.get_guilds)
+    app.router.add_get("/data/guild/{guild_id}", self.get_guild)
+    return app
+
+  async def _simulate_latency(self):
+    latency = self.options.latency_ms + self.random.uniform(-self.options.latency_jitter_ms, self.options.latency_jitter_ms)
+    if latency > 0:
+      await asyncio.sleep(latency / 1000)
+
+  @staticmethod
+  def _json_response(payload: dict) -> web.Response:
+    # Real API returns json with text/html content type
+    return web.Response(text=json.dumps(payload), content_type="text/html")
+
+  async def get_guilds(self, _request: web.Request) -> web.Response:
+    self.guild_list_requests += 1
+    await self._simulate_latency()
+
+    if self.recorded_guild_list is not None:
+      return self._json_response(self.recorded_guild_list)
+    return self._json_response({"data": [[guild_id, f"Guild {guild_id}"] for guild_id in self.guild_ids]})
+
+  async def get_guild(self, request: web.Request) -> web.Response:
+    self.guild_requests += 1
+    await self._simulate_latency()
+
+    guild_id = int(request.match_info["guild_id"])
+    if guild_id not in self.guild_versions:
+      return web.Response(status=404)
+
+    if self.random.random() < self.options.error_rate:
+      self.errors += 1
+      return web.Response(status=500)
+
+    if self.random.random() < self.options.change_rate:
+      self.guild_versions[guild_id] += 1
+
+    if guild_id in self.recorded_guilds:
+      payload = self.recorded_guilds[guild_id]
+      if self.guild_versions[guild_id] > 0:
+        payload = json.loads(json.dumps(payload))
+        for player in payload["players"]["data"]:
+          player[-1] = (player[-1] or 0) + self.guild_versions[guild_id]
+      return self._json_response(payload)
+
+    return self._json_response(self.generate_guild_payload(guild_id, self.guild_versions[guild_id]))
+
+  def generate_guild_payload(self, guild_id: int, version: int) -> dict:
+    # Same guild always has same players, contributions grow with version
+    guild_random = random.Random(guild_id * 7919 + self.options.seed)
+    number_of_players = guild_random.randint(max(self.options.players_per_guild // 2, 1), max(self.options.players_per_guild, 1))
+    last_online = (self.started_at - datetime.timedelta(hours=guild_random.randint(0, 48))).strftime("%a, %d %b %Y %H:%M:%S GMT")
+
+    players = []
+    for player_index in range(number_of_players):
+      player_id = guild_id * 1000 + player_index
+      buildings = [guild_random.randint(0, 10) for _ in range(8)]
+      players.append([player_id, f"Player {player_id}", last_online, guild_random.randint(1, 150), guild_random.randint(1, 120), *buildings, guild_random.randint(0, 5000) + version])
+
+    return {"id": guild_id, "name": f"Guild {guild_id}", "level": guild_random.randint(1, 30), "players": {"data": players}}
+
+async def start_server(api: FakeDTApi, host: str="127.0.0.1", port: int=8089) -> web.AppRunner:
+  runner = web.AppRunner(api.create_app(), access_log=None)
+  await runner.setup()
+  await web.TCPSite(runner, host, port).start()
+  return runner
+
+def add_options_arguments(parser: argparse.ArgumentParser):
+  defaults = FakeDTApiOptions()
+  parser.add_argument("--guilds", type=int, default=defaults.number_of_guilds, help="Number of synthetic guilds")
+  parser.add_argument("--players", type=int, default=defaults.players_per_guild, help="Maximum number of players in synthetic guild")
+  parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms)
+  parser.add_argument("--latency-jitter-ms", type=float, default=defaults.latency_jitter_ms)
+  parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="Ratio of guild requests failing with HTTP 500")
+  parser.add_argument("--change-rate", type=float, default=defaults.change_rate, help="Ratio of guild requests with changed data")
+  parser.add_argument("--payload-dir", default=None, help="Folder with recorded guilds.json and guild_<id>.json responses")
+  parser.add_argument("--seed", type=int, default=defaults.seed)
+
+def options_from_arguments(args: argparse.Namespace) -> FakeDTApiOptions:
+  return FakeDTApiOptions(args.guilds, args.players, args.latency_ms, args.latency_jitter_ms, args.error_rate, args.change_rate, args.payload_dir, args.seed)
+
+async def serve_forever(api: FakeDTApi, host: str, port: int):
+  runner = await start_server(api, host, port)
+  print(f"Fake DT API listening on http://{host}:{port} with {len(api.guild_ids)} guilds")
+  try:
+    while True:
+      await asyncio.sleep(3600)
+  finally:
+    await runner.cleanup()
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Local stand-in for Deep Town stats API")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=8089)
+  add_options_arguments(parser)
+  args = parser.parse_args()
+
+  try:
+    asyncio.run(serve_forever(FakeDTApi(options_from_arguments(args)), args.host, args.port))
+  except KeyboardInterrupt:
+    pass
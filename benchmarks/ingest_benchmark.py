@@ -0,0 +1,138 @@
+# End-to-end benchmark of guild data ingest, runs crawl runs of DTDataDownloader against local fake DT API and scratch database
+# Usage from repository root: `python -m benchmarks.ingest_benchmark --guilds 2000 --rounds 2 --writers 2`
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+import types
+import toml
+
+from benchmarks import fake_dt_api
+
+def parse_arguments() -> argparse.Namespace:
+  parser = argparse.ArgumentParser(description="End-to-end benchmark of Deep Town guild data ingest")
+  parser.add_argument("--database", default=None, help="Connect string of scratch database, temporary sqlite database by default (it's wiped before benchmark)")
+  parser.add_argument("--api-url", default=None, help="Use already running API instead of starting local fake one")
+  parser.add_argument("--port", type=int, default=8089, help="Port of local fake API")
+  parser.add_argument("--rounds", type=int, default=2, help="Number of crawls of all guilds, following rounds exercise unchanged data path when change rate is below 1")
+  parser.add_argument("--concurrency", type=int, default=16)
+  parser.add_argument("--writers", type=int, default=1)
+  parser.add_argument("--batch-size", type=int, default=20)
+  parser.add_argument("--queue-size", type=int, default=100)
+  parser.add_argument("--async-engine", action="store_true", help="Use native asyncio database engine for writers")
+  parser.add_argument("--rate", type=float, default=1000.0, help="Initial and maximum request rate of rate limiter")
+  fake_dt_api.add_options_arguments(parser)
+  return parser.parse_args()
+
+def create_scratch_config(args: argparse.Namespace, directory: str) -> str:
+  """
+  Config is loaded on import from path in first command line argument, so benchmark has to create it before importing anything from bot
+  """
+  scratch_config = toml.load("config/config.template.toml")
+  scratch_config["base"]["database_connect_string"] = args.database if args.database is not None else f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+  scratch_config["base"]["database_async_engine"] = args.async_engine
+  scratch_config["base"]["log_to_file"] = False
+  scratch_config["data_manager"]["dt_api_url"] = args.api_url if args.api_url is not None else f"http://127.0.0.1:{args.port}"
+  scratch_config["data_manager"]["crawler_concurrency"] = args.concurrency
+  scratch_config["data_manager"]["crawler_writers"] = args.writers
+  scratch_config["data_manager"]["crawler_write_batch_size"] = args.batch_size
+  scratch_config["data_manager"]["crawler_queue_size"] = args.queue_size
+  scratch_config["rate_limiter"]["initial_rate"] = args.rate
+  scratch_config["rate_limiter"]["max_rate"] = args.rate
+
+  path = os.path.join(directory, "config.toml")
+  with open(path, "w", encoding="utf-8") as f:
+    toml.dump(scratch_config, f)
+  return path
+
+class StatementCounter:
+  def __init__(self, *engines):
+    from sqlalchemy import event
+
+    self.statements = 0
+    for engine in engines:
+      event.listen(engine, "before_cursor_execute", self.count)
+
+  def count(self, *_args):
+    self.statements += 1
+
+def get_peak_rss_mb() -> float:
+  peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports kilobytes, macOS bytes
+  return peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+async def run_benchmark(args: argparse.Namespace):
+  import database
+  from config import config
+  from core_extensions.dt_data_downloader import DTDataDownloader
+  from database import dt_crawl_run_repo, session_maker
+  from database.tables.dt_crawl_run import CrawlRunKind
+  from features.dt_guild_crawler import DTGuildCrawler
+  from features.rate_limiter import AdaptiveRateLimiter
+
+  database.base.metadata.drop_all(database.engine)
+  database.init_tables()
+  engines = [database.engine]
+  if database.async_session_maker is not None:
+    engines.append(database.async_session_maker.kw["bind"].sync_engine)
+  statement_counter = StatementCounter(*engines)
+
+  fake_api, runner = None, None
+  if args.api_url is None:
+    fake_api = fake_dt_api.FakeDTApi(fake_dt_api.options_from_arguments(args))
+    runner = await fake_dt_api.start_server(fake_api, "127.0.0.1", args.port)
+
+  rate_limiter = AdaptiveRateLimiter(config.rate_limiter.initial_rate, config.rate_limiter.min_rate, config.rate_limiter.max_rate,
+                                     config.rate_limiter.additive_increase, config.rate_limiter.multiplicative_decrease,
+                                     config.rate_limiter.latency_spike_factor, config.rate_limiter.error_window_size,
+                                     config.rate_limiter.min_retry_delay_seconds, config.rate_limiter.max_retry_delay_seconds)
+  crawler = DTGuildCrawler(config.data_manager.crawler_concurrency, rate_limiter,
+                           config.data_manager.crawler_writers, config.data_manager.crawler_write_batch_size, config.data_manager.crawler_queue_size)
+
+  # Crawl runs use only crawler of bot, no connection to discord is needed
+  downloader = DTDataDownloader(types.SimpleNamespace(dt_guild_crawler=crawler, dt_api_rate_limiter=rate_limiter))
+
+  try:
+    guild_ids = await crawler.get_ids_of_all_guilds()
+    if not guild_ids:
+      print("Failed to get list of guilds")
+      return
+
+    print(f"Benchmarking ingest of {len(guild_ids)} guilds, {config.data_manager.crawler_concurrency} fetchers, {crawler.writers} writers, "
+          f"write batch {config.data_manager.crawler_write_batch_size}, database {database.engine.dialect.name}{' (async engine)' if database.async_session_maker is not None else ''}")
+
+    for round_index in range(max(args.rounds, 1)):
+      with session_maker() as session:
+        run = await dt_crawl_run_repo.create_run(session, CrawlRunKind.ALL_GUILDS, guild_ids)
+
+        statements_before = statement_counter.statements
+        start_time = time.monotonic()
+        stats = await downloader.process_crawl_run(session, run)
+        elapsed = time.monotonic() - start_time
+        statements = statement_counter.statements - statements_before
+
+      print(f"Round {round_index + 1}: {stats.pulled} guilds ({stats.unchanged} unchanged, {len(stats.failed_ids)} failed) in {elapsed:.1f}s\n"
+            f"  {stats.pulled / elapsed if elapsed > 0 else 0.0:.1f} guilds/s\n"
+            f"  {statements / max(stats.total, 1):.1f} DB statements per guild ({statements} total)\n"
+            f"  p95 write latency {stats.get_write_latency_percentile(95) * 1000:.1f}ms per batch, p50 {stats.get_write_latency_percentile(50) * 1000:.1f}ms\n"
+            f"  peak RSS {get_peak_rss_mb():.0f}MB\n"
+            f"  {stats.pipeline_summary}\n"
+            f"  rate limiter {rate_limiter}")
+
+    if fake_api is not None:
+      print(f"Fake API served {fake_api.guild_requests} guild requests ({fake_api.errors} errors)")
+  finally:
+    await crawler.close()
+    if runner is not None:
+      await runner.cleanup()
+
+if __name__ == "__main__":
+  import asyncio
+
+  arguments = parse_arguments()
+  with tempfile.TemporaryDirectory() as scratch_directory:
+    sys.argv = [sys.argv[0], create_scratch_config(arguments, scratch_directory)]
+    asyncio.run(run_benchmark(arguments))
@@ -0,0 +1,114 @@
+# Benchmark of keystroke latency of user autocomplete answered from in-memory name search index
+# Usage from repository root: `python -m benchmarks.name_search_benchmark --users 1000000 --baseline`
+# Every sampled name is typed one character at a time and each prefix of it is searched as one keystroke
+
+import argparse
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from typing import List
+
+import toml
+
+SYLLABLES = ["ka", "ro", "mi", "zen", "tor", "lu", "va", "shi", "dra", "gon", "el", "nix", "qu", "bo", "rex", "ly", "fa", "tan", "mor", "pi"]
+
+def parse_arguments() -> argparse.Namespace:
+  parser = argparse.ArgumentParser(description="Benchmark of keystroke latency of name search index")
+  parser.add_argument("--users", type=int, default=1_000_000, help="Number of indexed usernames")
+  parser.add_argument("--names", type=int, default=200, help="Number of typed names, every prefix of name is one keystroke")
+  parser.add_argument("--limit", type=int, default=25, help="Number of returned matches")
+  parser.add_argument("--baseline", action="store_true", help="Measure also database ilike search on temporary sqlite database with the same users")
+  parser.add_argument("--seed", type=int, default=1)
+  return parser.parse_args()
+
+def generate_usernames(count: int, rng: random.Random) -> List[str]:
+  usernames = []
+  for _ in range(count):
+    name = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+    if rng.random() < 0.5:
+      name = name.capitalize()
+    if rng.random() < 0.4:
+      name += str(rng.randint(0, 9999))
+    usernames.append(name)
+  return usernames
+
+def get_keystrokes(usernames: List[str], args: argparse.Namespace, rng: random.Random) -> List[str]:
+  keystrokes = []
+  for name in rng.sample(usernames, min(args.names, len(usernames))):
+    # Half of names is typed from middle to measure substring matches
+    start = rng.randint(0, max(len(name) - 4, 0)) if rng.random() < 0.5 else 0
+    keystrokes.extend(name[start:end] for end in range(start + 1, len(name) + 1))
+  return keystrokes
+
+def print_latencies(title: str, latencies: List[float]):
+  latencies = sorted(latencies)
+  def percentile(value: float) -> float:
+    return latencies[min(int(len(latencies) * value), len(latencies) - 1)] * 1e6
+  print(f"{title}: {len(latencies)} keystrokes, p50 {percentile(0.5):.0f} µs, p95 {percentile(0.95):.0f} µs, p99 {percentile(0.99):.0f} µs, max {latencies[-1] * 1e6:.0f} µs")
+
+def run_index_benchmark(usernames: List[str], keystrokes: List[str], args: argparse.Namespace):
+  from features.name_search_index import NameSearchIndex
+
+  rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  start_time = time.perf_counter()
+  index = NameSearchIndex()
+  index.add_many(enumerate(usernames, start=1))
+  print(f"Index of {len(index)} users built in {time.perf_counter() - start_time:.1f}s, peak memory grew by {(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024:.0f} MiB")
+
+  latencies = []
+  for keystroke in keystrokes:
+    start_time = time.perf_counter()
+    index.search(keystroke, args.limit)
+    latencies.append(time.perf_counter() - start_time)
+  print_latencies("Name search index", latencies)
+
+  start_time = time.perf_counter()
+  for user_id in range(1, 1001):
+    index.set(user_id, usernames[user_id - 1] + "x")
+  print(f"Rename of user in index takes {(time.perf_counter() - start_time) / 1000 * 1e6:.0f} µs")
+
+def run_baseline_benchmark(usernames: List[str], keystrokes: List[str], args: argparse.Namespace, directory: str):
+  scratch_config = toml.load("config/config.template.toml")
+  scratch_config["base"]["database_connect_string"] = f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+  scratch_config["base"]["log_to_file"] = False
+  config_path = os.path.join(directory, "config.toml")
+  with open(config_path, "w", encoding="utf-8") as f:
+    toml.dump(scratch_config, f)
+  sys.argv = [sys.argv[0], config_path]
+
+  import asyncio
+  from sqlalchemy import insert
+  import database
+  from database import dt_user_repo
+  from database.tables.dt_user import DTUser
+
+  database.init_tables()
+  with database.session_maker() as session:
+    for start in range(0, len(usernames), 50_000):
+      session.execute(insert(DTUser), [{"id": user_id, "username": name, "level": 1, "depth": 1} for user_id, name in enumerate(usernames[start:start + 50_000], start=start + 1)])
+    session.commit()
+
+    async def measure() -> List[float]:
+      latencies = []
+      # Database search is much slower, only part of keystrokes is measured
+      for keystroke in keystrokes[:max(len(keystrokes) // 10, 1)]:
+        start_time = time.perf_counter()
+        await dt_user_repo.get_all_users(session, keystroke, args.limit)
+        latencies.append(time.perf_counter() - start_time)
+      return latencies
+
+    print_latencies(f"Database ilike search ({database.engine.dialect.name})", asyncio.run(measure()))
+
+if __name__ == "__main__":
+  arguments = parse_arguments()
+  random_generator = random.Random(arguments.seed)
+  generated_usernames = generate_usernames(arguments.users, random_generator)
+  typed_keystrokes = get_keystrokes(generated_usernames, arguments, random_generator)
+
+  run_index_benchmark(generated_usernames, typed_keystrokes, arguments)
+  if arguments.baseline:
+    with tempfile.TemporaryDirectory() as scratch_directory:
+      run_baseline_benchmark(generated_usernames, typed_keystrokes, arguments, scratch_directory)
@@ -0,0 +1,105 @@
+# Benchmark of hot repository functions on sync sessions run in threads and on native asyncio sessions
+# Usage from repository root: `python -m benchmarks.repo_benchmark --iterations 2000 --concurrency 8`
+# Async engine requires asyncpg (postgresql) or aiosqlite (sqlite) package
+
+import argparse
+import contextlib
+import datetime
+import os
+import sys
+import tempfile
+import time
+import toml
+
+def parse_arguments() -> argparse.Namespace:
+  parser = argparse.ArgumentParser(description="Benchmark of hot repository functions on sync and async database engine")
+  parser.add_argument("--database", default=None, help="Connect string of scratch database, temporary sqlite database by default (it's wiped before benchmark)")
+  parser.add_argument("--iterations", type=int, default=1000, help="Calls of each function per mode")
+  parser.add_argument("--concurrency", type=int, default=4, help="Number of concurrent callers, each with its own session")
+  parser.add_argument("--players", type=int, default=40, help="Players in guild data written by generate_or_update_event_participations")
+  return parser.parse_args()
+
+def create_scratch_config(args: argparse.Namespace, directory: str) -> str:
+  scratch_config = toml.load("config/config.template.toml")
+  scratch_config["base"]["database_connect_string"] = args.database if args.database is not None else f"sqlite:///{os.path.join(directory, 'benchmark.db')}"
+  scratch_config["base"]["log_to_file"] = False
+
+  path = os.path.join(directory, "config.toml")
+  with open(path, "w", encoding="utf-8") as f:
+    toml.dump(scratch_config, f)
+  return path
+
+async def run_benchmark(args: argparse.Namespace):
+  import asyncio
+  import random
+  import database
+  from config import config
+  from database import dt_guild_repo, dt_crawl_run_repo, dt_blacklist_repo, event_participation_repo
+  from database.tables.dt_crawl_run import CrawlRunKind
+  from utils import dt_helpers
+
+  database.base.metadata.drop_all(database.engine)
+  database.init_tables()
+
+  async_session_maker = database.create_async_session_maker(config.base.database_connect_string)
+  number_of_guilds = max(args.concurrency, 1) * 10
+
+  with database.session_maker() as session:
+    run = await dt_crawl_run_repo.create_run(session, CrawlRunKind.ALL_GUILDS, range(1, number_of_guilds + 1))
+
+  def create_guild_data(guild_id: int) -> dt_helpers.DTGuildData:
+    last_online = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    players = [dt_helpers.DTUserData(f"Player {player_id}", player_id, 50, 50, last_online, random.randint(0, 5000), 1, 1, 1, 1, 1, 1, 1, 1)
+               for player_id in range(guild_id * 1000, guild_id * 1000 + args.players)]
+    return dt_helpers.DTGuildData(f"Guild {guild_id}", guild_id, 10, players)
+
+  async def get_fingerprint(session, index: int):
+    await dt_guild_repo.get_guild_data_fingerprint(session, index % number_of_guilds + 1)
+
+  async def is_on_blacklist(session, index: int):
+    dt_blacklist_repo.blacklist_cache.invalidate()
+    await dt_blacklist_repo.is_on_blacklist(session, dt_blacklist_repo.BlacklistType.GUILD, index)
+
+  async def mark_item_done(session, index: int):
+    await dt_crawl_run_repo.mark_item_done(session, run.id, index % number_of_guilds + 1)
+
+  async def generate_or_update_event_participations(session, index: int):
+    await event_participation_repo.generate_or_update_event_participations(session, create_guild_data(index % number_of_guilds + 1))
+
+  functions = [("get_guild_data_fingerprint", get_fingerprint, args.iterations),
+               ("is_on_blacklist (cache reload)", is_on_blacklist, args.iterations),
+               ("mark_item_done", mark_item_done, args.iterations),
+               ("generate_or_update_event_participations", generate_or_update_event_participations, max(args.iterations // 10, 1))]
+
+  async def measure(session_factory, function, iterations: int) -> float:
+    counter = iter(range(iterations))
+
+    async def caller():
+      async with session_factory() as session:
+        for index in counter:
+          await function(session, index)
+
+    start_time = time.monotonic()
+    await asyncio.gather(*[caller() for _ in range(max(args.concurrency, 1))])
+    return iterations / (time.monotonic() - start_time)
+
+  @contextlib.asynccontextmanager
+  async def sync_session():
+    with database.session_maker() as session:
+      yield session
+
+  print(f"Database {database.engine.dialect.name}, {args.concurrency} concurrent callers")
+  for name, function, iterations in functions:
+    sync_rate = await measure(sync_session, function, iterations)
+    async_rate = await measure(async_session_maker, function, iterations)
+    print(f"{name}: thread per statement {sync_rate:.0f} calls/s, async engine {async_rate:.0f} calls/s ({async_rate / sync_rate:.2f}x)")
+
+  await async_session_maker.kw["bind"].dispose()
+
+if __name__ == "__main__":
+  import asyncio
+
+  arguments = parse_arguments()
+  with tempfile.TemporaryDirectory() as scratch_directory:
+    sys.argv = [sys.argv[0], create_scratch_config(arguments, scratch_directory)]
+    asyncio.run(run_benchmark(arguments))
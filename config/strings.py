@@ -48,6 +48,16 @@ class Strings(metaclass=Formatable):
 
   system_git_pull_description = "Pull latest version of bot from git repository"
 
+  system_database_executor_description = "Show waiting for and execution of database calls per calling function"
+  system_database_executor_reset_param_description = "Reset collected stats after showing them"
+  system_database_executor_no_calls = "No database calls recorded"
+
+  system_database_profile_description = "Show database statements of functions with highest total time and p95 latency"
+  system_database_profile_window_param_description = "Time window in minutes"
+  system_database_profile_limit_param_description = "Number of shown functions"
+  system_database_profile_disabled = "Query profiler is disabled in config"
+  system_database_profile_no_statements = "No database statements recorded in last `{minutes}` minutes"
+
   # Errors
   error_command_syntax_error = "Unknown syntax of command"
   error_unknown_command = "Unknown command - use /help for help"
@@ -132,13 +142,30 @@ class Strings(metaclass=Formatable):
 
   data_manager_update_all_guilds_description = "Update data of all guilds in database"
   data_manager_update_all_guilds_success_with_periodic_update = "Data update started"
-  data_manager_update_all_guilds_success_without_periodic_update = "Updated data of `{guild_num}` guilds"
+  data_manager_update_all_guilds_success_without_periodic_update = "Updated data of `{guild_num}` guilds (`{guilds_per_second:.2f}` guilds/s)"
   data_manager_update_all_guilds_failed_without_periodic_update = "No guilds ids for update from server"
 
   data_manager_update_tracked_guilds_description = "Update data of tracked guilds in database"
-  data_manager_update_tracked_guilds_success = "Updated data of `{guild_num}` guilds"
+  data_manager_update_tracked_guilds_success = "Updated data of `{guild_num}` guilds (`{guilds_per_second:.2f}` guilds/s)"
   data_manager_update_tracked_guilds_failed = "No guilds ids for update from database"
 
+  data_manager_update_run_already_running = "Data update run `{run_id}` is already running"
+
+  data_manager_update_progress_description = "Show progress and throughput of last data update runs"
+  data_manager_update_progress_no_runs = "No data update runs recorded"
+
+  data_manager_archive_year_description = "Archive event participations of closed year to compressed file"
+  data_manager_archive_year_year_param_description = "Event year to archive"
+  data_manager_archive_year_not_closed = "Only years before current event year `{current_year}` can be archived"
+  data_manager_archive_year_already_archived = "Event year `{year}` is already archived"
+  data_manager_archive_year_success = "Archived `{count}` participations of event year `{year}` to `{path}`"
+
+  data_manager_restore_year_description = "Restore archived event participations of year"
+  data_manager_restore_year_year_param_description = "Archived event year to restore"
+  data_manager_restore_year_not_archived = "Event year `{year}` is not archived"
+  data_manager_restore_year_missing_file = "Archive file `{path}` of event year `{year}` not found"
+  data_manager_restore_year_success = "Restored `{count}` participations of event year `{year}`"
+
   data_manager_set_event_items_description = "Set Deep Town items in event"
   data_manager_set_event_items_current_level_param_description = "Current level of event"
   data_manager_set_event_items_item_name_param_description = "Event Deep Town Item {number}"
@@ -158,7 +185,7 @@ class Strings(metaclass=Formatable):
   data_manager_load_data_description = "Load manually event data"
   data_manager_load_data_no_attachments = "No attachments present"
   data_manager_load_data_loading_started = "Data loading started"
-  data_manager_load_data_loaded = "New data loaded, `{count}` rows\nIf some data are missing then file was in invalid format or data keys were missing"
+  data_manager_load_data_loaded = "New data loaded, `{count}` rows (`{rows_per_second}` rows/s), `{updated}` participations created or changed\nIf some data are missing then file was in invalid format or data keys were missing"
   data_manager_load_data_no_files = "No csv files found"
 
   data_manager_dump_guild_participation_data_description = "Dump Deep Town guild event participation data"
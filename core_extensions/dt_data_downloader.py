@@ -1,30 +1,51 @@
-import collections
 import io
+import os
 import re
 import pandas as pd
 import disnake
 from disnake.ext import tasks, commands
 import asyncio
 import datetime
+import time
 import traceback
-import copy
+from typing import Optional, List, Set, Tuple, Callable, Awaitable
 from sqlalchemy import exc
 
 from features.base_cog import Base_Cog
+from features.dt_guild_crawler import CrawlStats
+from features.dt_refresh_scheduler import DTRefreshScheduler
 from utils.logger import setup_custom_logger
 from config import config, Strings, cooldowns
-from utils import dt_helpers, command_utils, message_utils, dt_autocomplete, object_getters
-from database import dt_guild_repo, event_participation_repo, dt_blacklist_repo, tracking_settings_repo, dt_guild_member_repo, session_maker
-from database import dt_statistics_repo
+from utils import dt_helpers, command_utils, message_utils, dt_autocomplete, object_getters, string_manipulation
+from database import dt_guild_repo, event_participation_repo, dt_blacklist_repo, tracking_settings_repo, session_maker
+from database import dt_statistics_repo, dt_crawl_run_repo, event_data_import_repo, dt_guild_event_stats_repo, dt_member_stats_repo, event_participation_archive_repo, dt_event_leaderboard_repo, dt_name_search_repo
+from database.tables.dt_crawl_run import DTCrawlRun, CrawlRunKind, CrawlItemStatus
 
 logger = setup_custom_logger(__name__)
 
 guild_id_regex = re.compile(r".*_guild_id_(\d+)_.*")
 
+# Presence shows progress of refresh only for batches at least this large
+LARGE_BATCH_SIZE = 200
+
 class DTDataDownloader(Base_Cog):
   def __init__(self, bot):
     super(DTDataDownloader, self).__init__(bot, __file__)
 
+    inactive_pull_rate_hours = config.data_manager.inactive_guild_data_pull_rate_hours
+    self.refresh_scheduler = DTRefreshScheduler(datetime.timedelta(minutes=config.refresh_scheduler.hot_interval_minutes),
+                                                datetime.timedelta(hours=config.refresh_scheduler.hot_window_hours),
+                                                datetime.timedelta(minutes=config.refresh_scheduler.tracked_interval_minutes),
+                                                datetime.timedelta(hours=max(config.data_manager.data_pull_rate_hours, 1)),
+                                                datetime.timedelta(hours=inactive_pull_rate_hours) if inactive_pull_rate_hours > 0 else None)
+    self.last_guild_list_refresh = None
+    self.last_statistics_update = None
+    self.last_leaderboards_refresh = None
+    self.last_guild_ranks_refresh = None
+    self.live_leaderboards_event: Optional[Tuple[int, int]] = None
+    self.scheduled_run_id: Optional[int] = None
+    self.running_run_ids: Set[int] = set()
+
   def cog_load(self):
     if config.data_manager.clean_none_existing_guilds:
       if not self.cleanup_task.is_running():
@@ -34,6 +55,14 @@ class DTDataDownloader(Base_Cog):
       if not self.data_update_task.is_running():
         self.data_update_task.start()
 
+    if not self.resume_crawl_runs_task.is_running():
+      self.resume_crawl_runs_task.start()
+
+    if not self.backfill_aggregates_task.is_running():
+      self.backfill_aggregates_task.start()
+
+    dt_blacklist_repo.add_blacklist_listener(self.blacklist_changed)
+
   def cog_unload(self):
     if self.cleanup_task.is_running():
       self.cleanup_task.cancel()
@@ -41,8 +70,18 @@ class DTDataDownloader(Base_Cog):
     if self.data_update_task.is_running():
       self.data_update_task.cancel()
 
-    if self.inactive_guild_data_update_task.is_running():
-      self.inactive_guild_data_update_task.cancel()
+    if self.resume_crawl_runs_task.is_running():
+      self.resume_crawl_runs_task.cancel()
+
+    if self.backfill_aggregates_task.is_running():
+      self.backfill_aggregates_task.cancel()
+
+    dt_blacklist_repo.remove_blacklist_listener(self.blacklist_changed)
+
+  def blacklist_changed(self, bl_type: dt_blacklist_repo.BlacklistType, identifier: int, added: bool):
+    # Removed guilds are scheduled again with next guild list synchronization
+    if bl_type == dt_blacklist_repo.BlacklistType.GUILD and added:
+      self.refresh_scheduler.remove_guild(identifier)
 
   @command_utils.master_only_slash_command(name="data_update")
   async def data_update_commands(self, inter: disnake.CommandInteraction):
@@ -63,7 +102,7 @@ class DTDataDownloader(Base_Cog):
       if await dt_blacklist_repo.is_on_blacklist(session, dt_blacklist_repo.BlacklistType.GUILD, guild_id):
         return await message_utils.generate_error_message(inter, Strings.data_manager_update_guild_guild_on_blacklist(guild_index=guild_id))
 
-      data = await dt_helpers.get_dt_guild_data(guild_id, True)
+      data = await self.bot.dt_guild_crawler.get_dt_guild_data(guild_id, True)
       if data is None:
         return await message_utils.generate_error_message(inter, Strings.data_manager_update_guild_get_failed(identifier=guild_id))
 
@@ -78,32 +117,29 @@ class DTDataDownloader(Base_Cog):
     await inter.response.defer(with_message=True)
     message = await object_getters.get_or_fetch_message(self.bot, inter.channel, (await inter.original_response()).id)
 
-    guild_ids = await dt_helpers.get_ids_of_all_guilds()
-
-    last_update = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
-
-    if guild_ids is not None or not guild_ids:
-      await inter.send("Starting data update...")
-      pulled_data = 0
+    with session_maker() as session:
+      run = await dt_crawl_run_repo.get_unfinished_run(session, CrawlRunKind.ALL_GUILDS)
+      if run is not None and run.id in self.running_run_ids:
+        return await message_utils.generate_error_message(inter, Strings.data_manager_update_run_already_running(run_id=run.id))
 
-      with session_maker() as session:
-        for idx, guild_id in enumerate(guild_ids):
-          if await dt_blacklist_repo.is_on_blacklist(session, dt_blacklist_repo.BlacklistType.GUILD, guild_id):
-            continue
+      if run is None:
+        guild_ids = await self.bot.dt_guild_crawler.get_ids_of_all_guilds()
+        if not guild_ids:
+          return await message_utils.generate_error_message(inter, Strings.data_manager_update_all_guilds_failed_without_periodic_update)
 
-          data = await dt_helpers.get_dt_guild_data(guild_id)
-          if datetime.datetime.now(datetime.UTC).replace(tzinfo=None) - last_update > datetime.timedelta(seconds=10):
-            await message.edit(f"Guilds `{idx + 1}/{len(guild_ids)}` updated")
-            last_update = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+        blacklisted_guild_ids = set(await dt_blacklist_repo.get_blacklisted_ids(session, dt_blacklist_repo.BlacklistType.GUILD))
+        run = await dt_crawl_run_repo.create_run(session, CrawlRunKind.ALL_GUILDS, [guild_id for guild_id in guild_ids if guild_id not in blacklisted_guild_ids])
+        await inter.send("Starting data update...")
+      else:
+        await inter.send(f"Resuming unfinished data update run `{run.id}`...")
 
-          await asyncio.sleep(0.5)
-          if data is None: continue
+      async def report_progress(stats: CrawlStats):
+        await message.edit(f"Guilds `{stats.processed}/{stats.total}` updated")
 
-          await event_participation_repo.generate_or_update_event_participations(session, data)
-          pulled_data += 1
+      stats = await self.process_crawl_run(session, run, progress_callback=report_progress, progress_interval_seconds=10)
+      logger.info(f"Manual update of all guilds finished: {stats}")
 
-        return await message_utils.generate_success_message(message, Strings.data_manager_update_all_guilds_success_without_periodic_update(guild_num=pulled_data))
-    await message_utils.generate_error_message(inter, Strings.data_manager_update_all_guilds_failed_without_periodic_update)
+    await message_utils.generate_success_message(message, Strings.data_manager_update_all_guilds_success_without_periodic_update(guild_num=stats.pulled, guilds_per_second=stats.guilds_per_second))
 
   @data_update_commands.sub_command(name="tracked_guilds", description=Strings.data_manager_update_tracked_guilds_description)
   @cooldowns.huge_cooldown
@@ -113,28 +149,117 @@ class DTDataDownloader(Base_Cog):
     message = await object_getters.get_or_fetch_message(self.bot, inter.channel, (await inter.original_response()).id)
 
     with session_maker() as session:
-      guild_ids = await tracking_settings_repo.get_tracked_guild_ids(session)
+      run = await dt_crawl_run_repo.get_unfinished_run(session, CrawlRunKind.TRACKED_GUILDS)
+      if run is not None and run.id in self.running_run_ids:
+        return await message_utils.generate_error_message(inter, Strings.data_manager_update_run_already_running(run_id=run.id))
+
+      if run is None:
+        guild_ids = await tracking_settings_repo.get_tracked_guild_ids(session)
+        if not guild_ids:
+          return await message_utils.generate_error_message(inter, Strings.data_manager_update_tracked_guilds_failed)
 
-      if guild_ids is not None or not guild_ids:
+        run = await dt_crawl_run_repo.create_run(session, CrawlRunKind.TRACKED_GUILDS, guild_ids)
         await inter.send("Starting data update...")
-        pulled_data = 0
+      else:
+        await inter.send(f"Resuming unfinished data update run `{run.id}`...")
+
+      async def report_progress(stats: CrawlStats):
+        await message.edit(f"Guilds `{stats.processed}/{stats.total}` updated")
+
+      stats = await self.process_crawl_run(session, run, update=True, progress_callback=report_progress, progress_interval_seconds=10)
+      logger.info(f"Manual update of tracked guilds finished: {stats}")
 
-        last_update = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    await message_utils.generate_success_message(message, Strings.data_manager_update_tracked_guilds_success(guild_num=stats.pulled, guilds_per_second=stats.guilds_per_second))
 
-        for idx, guild_id in enumerate(guild_ids):
-          data = await dt_helpers.get_dt_guild_data(guild_id, True)
-          if datetime.datetime.now(datetime.UTC).replace(tzinfo=None) - last_update > datetime.timedelta(seconds=10):
-            await message.edit(f"Guilds `{idx + 1}/{len(guild_ids)}` updated")
-            last_update = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+  @data_update_commands.sub_command(name="progress", description=Strings.data_manager_update_progress_description)
+  @cooldowns.default_cooldown
+  @commands.is_owner()
+  async def update_progress(self, inter: disnake.CommandInteraction):
+    await inter.response.defer(with_message=True, ephemeral=True)
+
+    with session_maker() as session:
+      runs = await dt_crawl_run_repo.get_last_runs(session, 5)
+      if not runs:
+        return await message_utils.generate_error_message(inter, Strings.data_manager_update_progress_no_runs)
+
+      now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+      embed = disnake.Embed(title="Data update progress", color=disnake.Color.dark_blue())
+
+      for run in runs:
+        counts = await dt_crawl_run_repo.get_run_status_counts(session, run.id)
+        number_of_items = sum(counts.values())
+        elapsed_seconds = max(((run.finished_at if run.finished_at is not None else now) - run.started_at).total_seconds(), 1.0)
+
+        if run.finished_at is not None:
+          state = "finished"
+        elif run.id in self.running_run_ids:
+          state = "running"
+        else:
+          state = "interrupted"
 
-          await asyncio.sleep(0.5)
-          if data is None: continue
+        value = f"Started `{run.started_at.strftime('%d.%m.%Y %H:%M')}` UTC\n" \
+                f"Done `{counts[CrawlItemStatus.DONE]}/{number_of_items}`, pending `{counts[CrawlItemStatus.PENDING]}`, failed `{counts[CrawlItemStatus.FAILED]}`\n" \
+                f"Throughput `{counts[CrawlItemStatus.DONE] / elapsed_seconds:.2f}` guilds/s"
 
-          await event_participation_repo.generate_or_update_event_participations(session, data)
-          pulled_data += 1
+        last_errors = await dt_crawl_run_repo.get_last_errors(session, run.id, limit=3) if run.finished_at is None else []
+        for guild_id, attempts, last_error in last_errors:
+          value += f"\n`{guild_id}` ({attempts}x): {string_manipulation.truncate_string(str(last_error), 100)}"
 
-        return await message_utils.generate_success_message(message, Strings.data_manager_update_tracked_guilds_success(guild_num=pulled_data))
-    await message_utils.generate_error_message(inter, Strings.data_manager_update_tracked_guilds_failed)
+        embed.add_field(name=f"Run {run.id} - {run.kind} ({state})", value=string_manipulation.truncate_string(value, 1000), inline=False)
+
+    current_stats = self.bot.dt_guild_crawler.current_stats
+    if current_stats is not None:
+      embed.add_field(name="Last crawl", value=f"{current_stats}\nRate limiter: {self.bot.dt_api_rate_limiter}", inline=False)
+
+    await inter.send(embed=embed, ephemeral=True)
+
+  @data_update_commands.sub_command(name="archive_year", description=Strings.data_manager_archive_year_description)
+  @cooldowns.huge_cooldown
+  @commands.max_concurrency(1, commands.BucketType.default)
+  @commands.is_owner()
+  async def archive_year(self, inter: disnake.CommandInteraction,
+                         year: int=commands.Param(description=Strings.data_manager_archive_year_year_param_description, autocomplete=dt_autocomplete.autocomplete_event_year)):
+    await inter.response.defer(with_message=True, ephemeral=True)
+
+    current_year, _ = dt_helpers.get_event_index(datetime.datetime.now(datetime.UTC).replace(tzinfo=None))
+    if year >= current_year:
+      return await message_utils.generate_error_message(inter, Strings.data_manager_archive_year_not_closed(current_year=current_year))
+
+    with session_maker() as session:
+      if await event_participation_archive_repo.get_archived_year(session, year) is not None:
+        return await message_utils.generate_error_message(inter, Strings.data_manager_archive_year_already_archived(year=year))
+
+      start_time = time.monotonic()
+      count, path = await event_participation_archive_repo.archive_event_year(session, year, config.data_manager.participations_archive_directory)
+      logger.info(f"Archived {count} participations of event year {year} to {path} in {time.monotonic() - start_time:.1f}s")
+
+    await message_utils.generate_success_message(inter, Strings.data_manager_archive_year_success(count=count, year=year, path=path))
+
+  @data_update_commands.sub_command(name="restore_year", description=Strings.data_manager_restore_year_description)
+  @cooldowns.huge_cooldown
+  @commands.max_concurrency(1, commands.BucketType.default)
+  @commands.is_owner()
+  async def restore_year(self, inter: disnake.CommandInteraction,
+                         year: int=commands.Param(description=Strings.data_manager_restore_year_year_param_description)):
+    await inter.response.defer(with_message=True, ephemeral=True)
+
+    with session_maker() as session:
+      archived_year = await event_participation_archive_repo.get_archived_year(session, year)
+      if archived_year is None:
+        return await message_utils.generate_error_message(inter, Strings.data_manager_restore_year_not_archived(year=year))
+      if not os.path.isfile(archived_year.archive_path):
+        return await message_utils.generate_error_message(inter, Strings.data_manager_restore_year_missing_file(path=archived_year.archive_path, year=year))
+
+      start_time = time.monotonic()
+      dataframe = await event_participation_archive_repo.read_archive(archived_year.archive_path)
+      # Guilds and users blacklisted after archivation are not restored
+      dataframe = dataframe[~dataframe["guild_id"].isin(await dt_blacklist_repo.get_blacklisted_ids(session, dt_blacklist_repo.BlacklistType.GUILD))]
+      await event_participation_archive_repo.unregister_archived_year(session, year)
+      # Import commits removal of archived year together with restored participations and their recalculated statistics
+      _, count = await event_data_import_repo.import_event_data(session, dataframe, await dt_blacklist_repo.get_blacklisted_ids(session, dt_blacklist_repo.BlacklistType.USER))
+      logger.info(f"Restored {count} participations of event year {year} in {time.monotonic() - start_time:.1f}s")
+
+    await message_utils.generate_success_message(inter, Strings.data_manager_restore_year_success(count=count, year=year))
 
   @command_utils.master_only_message_command(name="Load Event Data")
   @cooldowns.long_cooldown
@@ -153,20 +278,13 @@ class DTDataDownloader(Base_Cog):
       if attachment.filename.lower().endswith(".csv"):
         csv_files.append(attachment)
 
-    last_sleep = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
-
     if csv_files:
       await inter.send("Starting data update...")
-      updated_rows = 0
+      start_time = time.monotonic()
 
       with session_maker() as session:
+        dataframes = []
         for file_idx, file in enumerate(csv_files):
-          try:
-            data = io.BytesIO(await file.read())
-            dataframe = pd.read_csv(data, sep=";")
-          except:
-            continue
-
           guild_id_results = guild_id_regex.findall(file.filename.lower())
           if len(guild_id_results) != 1 or not str(guild_id_results[0]).isnumeric():
             logger.warning(f"Failed to get guild id from file `{file.filename}`")
@@ -176,59 +294,26 @@ class DTDataDownloader(Base_Cog):
           if await dt_blacklist_repo.is_on_blacklist(session, dt_blacklist_repo.BlacklistType.GUILD, guild_id):
             continue
 
-          for row_idx, (_, row) in enumerate(dataframe.iterrows()):
-            try:
-              user_id = int(row["user_id"])
-
-              if "amount" in row.keys():
-                ammount = int(row["amount"])
-              elif "donate" in row.keys():
-                ammount = int(row["donate"])
-              else:
-                logger.warning("Donate amount not found")
-                break
-
-              if "week" in row.keys() and "year" in row.keys():
-                week = int(row["week"])
-                year = int(row["year"])
-              elif "date" in row.keys():
-                try:
-                  date = datetime.datetime.fromisoformat(row["date"])
-                  year, week = dt_helpers.get_event_index(date)
-                except:
-                  continue
-              elif "timestamp" in row.keys():
-                try:
-                  date = datetime.datetime.fromtimestamp(row["timestamp"])
-                  year, week = dt_helpers.get_event_index(date)
-                except:
-                  continue
-              else:
-                logger.warning("Invalid event identifier")
-                break
-
-              member = await dt_guild_member_repo.create_dummy_dt_guild_member(session, user_id, guild_id, year, week, ammount)
-              if member is None:
-                continue
-
-              if "username" in row.keys():
-                member.user.username = row["username"]
-
-              await event_participation_repo.get_and_update_event_participation(session, user_id, guild_id, year, week, ammount)
-              await asyncio.sleep(0.02)
-
-              if datetime.datetime.now(datetime.UTC).replace(tzinfo=None) - last_sleep >= datetime.timedelta(seconds=10):
-                await message.edit(f"Files `{file_idx + 1}/{len(csv_files)}`\nData rows `{row_idx + 1}/{dataframe.shape[0]}`")
-                last_sleep = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
-
-              updated_rows += 1
-            except Exception:
-              logger.warning(traceback.format_exc())
-
-        await event_participation_repo.run_commit_in_thread(session)
-
-      logger.info(f"Loaded {updated_rows} data rows")
-      return await message_utils.generate_success_message(message, Strings.data_manager_load_data_loaded(count=updated_rows))
+          try:
+            data = io.BytesIO(await file.read())
+            dataframe = await asyncio.to_thread(pd.read_csv, data, sep=";")
+            dataframe = await asyncio.to_thread(dt_helpers.normalize_event_data, dataframe, guild_id)
+          except Exception:
+            logger.warning(f"Failed to parse file `{file.filename}`\n{traceback.format_exc()}")
+            continue
+
+          if dataframe is not None:
+            dataframes.append(dataframe)
+          await message.edit(f"Files `{file_idx + 1}/{len(csv_files)}` parsed")
+
+        number_of_rows, updated_rows = 0, 0
+        if dataframes:
+          number_of_rows, updated_rows = await event_data_import_repo.import_event_data(session, pd.concat(dataframes, ignore_index=True),
+                                                                                        await dt_blacklist_repo.get_blacklisted_ids(session, dt_blacklist_repo.BlacklistType.USER))
+
+      elapsed = max(time.monotonic() - start_time, 1e-6)
+      logger.info(f"Loaded {number_of_rows} data rows ({updated_rows} participations changed) in {elapsed:.1f}s ({number_of_rows / elapsed:.0f} rows/s)")
+      return await message_utils.generate_success_message(message, Strings.data_manager_load_data_loaded(count=number_of_rows, updated=updated_rows, rows_per_second=f"{number_of_rows / elapsed:.0f}"))
     await message_utils.generate_error_message(inter, Strings.data_manager_load_data_no_files)
 
   @tasks.loop(hours=config.data_manager.cleanup_rate_days * 24)
@@ -237,12 +322,17 @@ class DTDataDownloader(Base_Cog):
 
     try:
       with session_maker() as session:
-        all_guild_ids = await dt_helpers.get_ids_of_all_guilds()
+        all_guild_ids = await self.bot.dt_guild_crawler.get_ids_of_all_guilds()
         if all_guild_ids is None:
           logger.error("Failed to get all ids of guilds")
         else:
           removed_guilds = await dt_guild_repo.remove_deleted_guilds(session, all_guild_ids)
           logger.info(f"Remove {removed_guilds} deleted guilds from database")
+
+        # Member counts are kept up to date by ingest, full recount fixes counts changed outside of it
+        await self.refresh_guild_standings(session, recount_members=True)
+
+        await self.ensure_participation_partitions(session)
     except exc.OperationalError as e:
       if e.connection_invalidated:
         logger.warning("Database connection failed, retrying later")
@@ -251,138 +341,224 @@ class DTDataDownloader(Base_Cog):
 
     logger.info("Cleanup finished")
 
-  @tasks.loop(hours=config.data_manager.inactive_guild_data_pull_rate_hours)
-  async def inactive_guild_data_update_task(self):
-    logger.info("Inactive DT Guild data pull starting")
-
-    for i in range(20):
-      try:
-        with session_maker() as session:
-          not_updated_guild_ids_queue = collections.deque(await dt_guild_repo.get_inactive_guild_ids(session))
-
-          if not_updated_guild_ids_queue:
-            pulled_data = 0
-            number_of_failed_updates = 0
-
-            while not_updated_guild_ids_queue:
-              not_updated_guild_ids_working = copy.deepcopy(not_updated_guild_ids_queue)
-              not_updated_guild_ids_queue.clear()
-
-              for idx, guild_id in enumerate(not_updated_guild_ids_working):
-                if await dt_blacklist_repo.is_on_blacklist(session, dt_blacklist_repo.BlacklistType.GUILD, guild_id):
-                  continue
-
-                data = await dt_helpers.get_dt_guild_data(guild_id)
-
-                await asyncio.sleep(2)
-                if data is None:
-                  not_updated_guild_ids_queue.append(guild_id)
-                  continue
-
-                await event_participation_repo.generate_or_update_event_participations(session, data)
-                pulled_data += 1
-
-              if not_updated_guild_ids_queue:
-                if number_of_failed_updates >= 10:
-                  logger.warning(f"{list(not_updated_guild_ids_queue)} inactive guilds not updated (already failed {number_of_failed_updates}x), giving up")
-                  break
-                else:
-                  logger.warning(f"{list(not_updated_guild_ids_queue)} inactive guilds not updated (already failed {number_of_failed_updates}x), retrying")
-                  number_of_failed_updates += 1
-                  await asyncio.sleep(120)
-
-            logger.info(f"Pulled data of {pulled_data} inactive DT guilds")
-            logger.info(f"New count of active guilds: {await dt_guild_repo.get_number_of_active_guilds(session)}")
-
-            await dt_statistics_repo.generate_or_update_active_statistics(session)
-            break
-      except exc.OperationalError as e:
-        if e.connection_invalidated:
-          logger.warning("Database connection failed, retrying later")
-          await asyncio.sleep(60)
-        else:
-          raise e
+  async def crawl_in_run(self, run_id: int, guild_ids: List[int], update: bool=False, max_retries: int=0,
+                         committed_callback: Optional[Callable[[dt_helpers.DTGuildData, bool], None]]=None,
+                         progress_callback: Optional[Callable[[CrawlStats], Awaitable[None]]]=None, progress_interval_seconds: float=60) -> CrawlStats:
+    """
+    Crawl guilds as part of persisted run, every guild is written as separate unit of work together with its run item status
+    """
+    async def process_guild_data(writer_session, data: dt_helpers.DTGuildData) -> bool:
+      changed = await event_participation_repo.generate_or_update_event_participations_if_changed(writer_session, data)
+      await dt_crawl_run_repo.mark_item_done(writer_session, run_id, data.id)
+      return changed
+
+    async def process_failure(writer_session, guild_id: int, error: str):
+      await dt_crawl_run_repo.mark_item_failed(writer_session, run_id, guild_id, error)
+
+    self.running_run_ids.add(run_id)
+    try:
+      return await self.bot.dt_guild_crawler.crawl(guild_ids, process_guild_data, process_failure, committed_callback, update=update, max_retries=max_retries,
+                                                    progress_callback=progress_callback, progress_interval_seconds=progress_interval_seconds)
+    finally:
+      self.running_run_ids.discard(run_id)
+
+  async def process_crawl_run(self, session, run: DTCrawlRun, update: bool=False,
+                              progress_callback: Optional[Callable[[CrawlStats], Awaitable[None]]]=None, progress_interval_seconds: float=60) -> CrawlStats:
+    """
+    Process remaining guilds of run and finish it
+    """
+    max_attempts = max(config.data_manager.crawl_run_max_attempts, 1)
+    blacklisted_guild_ids = set(await dt_blacklist_repo.get_blacklisted_ids(session, dt_blacklist_repo.BlacklistType.GUILD))
+    guild_ids = [guild_id for guild_id in await dt_crawl_run_repo.get_guild_ids_to_process(session, run.id, max_attempts) if guild_id not in blacklisted_guild_ids]
+
+    stats = await self.crawl_in_run(run.id, guild_ids, update=update, max_retries=max_attempts - 1,
+                                    progress_callback=progress_callback, progress_interval_seconds=progress_interval_seconds)
+
+    await dt_crawl_run_repo.finish_run(session, run.id)
+    await dt_crawl_run_repo.remove_old_runs(session, config.data_manager.crawl_runs_to_keep)
+    await self.refresh_live_leaderboards(session, datetime.datetime.now(datetime.UTC).replace(tzinfo=None))
+    await self.refresh_guild_standings(session)
+    return stats
+
+  @tasks.loop(count=1)
+  async def resume_crawl_runs_task(self):
+    try:
+      with session_maker() as session:
+        for kind in (CrawlRunKind.TRACKED_GUILDS, CrawlRunKind.ALL_GUILDS):
+          run = await dt_crawl_run_repo.get_unfinished_run(session, kind)
+          if run is None or run.id in self.running_run_ids: continue
 
-    logger.info("Inactive DT Guild data pull finished")
+          logger.info(f"Resuming unfinished crawl run {run.id} ({run.kind})")
+          stats = await self.process_crawl_run(session, run, update=kind == CrawlRunKind.TRACKED_GUILDS)
+          logger.info(f"Resumed crawl run {run.id} finished: {stats}")
+    except exc.OperationalError as e:
+      if e.connection_invalidated:
+        logger.warning("Database connection failed, unfinished runs will be resumed after next restart")
+      else:
+        raise e
 
-  @tasks.loop(hours=max(config.data_manager.data_pull_rate_hours, 1))
-  async def data_update_task(self):
+  @resume_crawl_runs_task.before_loop
+  async def before_resume_crawl_runs_task(self):
+    await self.bot.wait_until_ready()
     await asyncio.sleep(config.data_manager.pull_data_startup_delay_seconds)
 
-    logger.info("DT Guild data pull starting")
-    guild_ids = await dt_helpers.get_ids_of_all_guilds()
-    await asyncio.sleep(0.1)
-
-    if guild_ids is not None and guild_ids:
-      not_updated_guild_ids_queue = collections.deque(guild_ids)
-      updated_guild_ids = []
-
+  @tasks.loop(count=1)
+  async def backfill_aggregates_task(self):
+    with session_maker() as session:
+      await self.ensure_participation_partitions(session)
+      # Event ids are resolved from memory by ingest
+      await event_participation_repo.get_event_specification_cache(session)
+      # Autocomplete of users and guilds is answered from memory after this
+      await dt_name_search_repo.load_name_search_cache(session)
+      # Ranks and member counts of guilds from before they were stored or from before restart
+      await self.refresh_guild_standings(session, recount_members=True)
+
+      # Aggregates of participations created before the aggregate tables existed
+      for name, have_aggregates, rebuild_aggregates in (("guild event stats", dt_guild_event_stats_repo.have_guild_event_stats, dt_guild_event_stats_repo.rebuild_guild_event_stats),
+                                                        ("member stats", dt_member_stats_repo.have_member_stats, dt_member_stats_repo.rebuild_member_stats)):
+        if await have_aggregates(session): continue
+
+        logger.info(f"Table of {name} is empty, rebuilding it from event participations")
+        start_time = time.monotonic()
+        written = await rebuild_aggregates(session)
+        logger.info(f"Rebuilt {written} {name} in {time.monotonic() - start_time:.1f}s")
+
+  @staticmethod
+  async def ensure_participation_partitions(session):
+    # Partitions of current and next event year exist before first participation of the year is written
+    current_year, _ = dt_helpers.get_event_index(datetime.datetime.now(datetime.UTC).replace(tzinfo=None))
+    created_years = await event_participation_archive_repo.ensure_year_partitions(session, [current_year, current_year + 1])
+    if created_years:
+      logger.info(f"Created event participation partitions of years {created_years}")
+
+  @backfill_aggregates_task.before_loop
+  async def before_backfill_aggregates_task(self):
+    await self.bot.wait_until_ready()
+
+  async def rotate_scheduled_run(self, session, now: datetime.datetime):
+    """
+    Scheduled run spans one guild list cycle, unfinished run from before restart is resumed by restoring refresh times of already refreshed guilds
+    """
+    run = None
+    if self.scheduled_run_id is None:
+      run = await dt_crawl_run_repo.get_unfinished_run(session, CrawlRunKind.SCHEDULED)
+      if run is not None:
+        done_items = await dt_crawl_run_repo.get_done_items(session, run.id)
+        for guild_id, last_refresh in done_items:
+          self.refresh_scheduler.restore_refresh(guild_id, last_refresh, now)
+        logger.info(f"Resumed scheduled crawl run {run.id}, {len(done_items)} guilds already refreshed")
+    else:
+      await dt_crawl_run_repo.finish_run(session, self.scheduled_run_id)
+      await dt_crawl_run_repo.remove_old_runs(session, config.data_manager.crawl_runs_to_keep)
+
+    if run is None:
+      run = await dt_crawl_run_repo.create_run(session, CrawlRunKind.SCHEDULED)
+    self.scheduled_run_id = run.id
+
+  async def refresh_scheduled_guilds(self, session, guild_ids: List[int]) -> CrawlStats:
+    now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    refreshed_guild_ids = set()
+
+    def guild_refreshed(data: dt_helpers.DTGuildData, changed: bool):
+      refreshed_guild_ids.add(data.id)
+      self.refresh_scheduler.mark_refreshed(data.id, changed, data.is_active, datetime.datetime.now(datetime.UTC).replace(tzinfo=None))
+
+    async def report_progress(stats: CrawlStats):
+      await self.bot.change_presence(activity=disnake.Game(name=f"Updating data {(stats.processed / stats.total) * 100:.1f}%..."), status=disnake.Status.dnd)
+
+    large_batch = len(guild_ids) >= LARGE_BATCH_SIZE
+    if large_batch:
       self.bot.presence_handler.stop()
-
-      last_update = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
       await self.bot.change_presence(activity=disnake.Game(name="Updating data..."), status=disnake.Status.dnd)
 
-      number_of_guilds = len(guild_ids)
-
-      while True:
-        try:
-          with session_maker() as session:
-            number_of_failed_updates = 0
-            while not_updated_guild_ids_queue:
-              not_updated_guild_ids_working = copy.deepcopy(not_updated_guild_ids_queue)
-              not_updated_guild_ids_queue.clear()
+    try:
+      await dt_crawl_run_repo.add_run_items(session, self.scheduled_run_id, guild_ids)
 
-              for idx, guild_id in enumerate(not_updated_guild_ids_working):
-                if datetime.datetime.now(datetime.UTC).replace(tzinfo=None) - last_update >= datetime.timedelta(minutes=1):
-                  progress_percent = (len(updated_guild_ids) / number_of_guilds) * 100
-                  await self.bot.change_presence(activity=disnake.Game(name=f"Updating data {progress_percent:.1f}%..."), status=disnake.Status.dnd)
-                  last_update = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+      # Failed guilds are retried by scheduler so no retry rounds here
+      stats = await self.crawl_in_run(self.scheduled_run_id, guild_ids, committed_callback=guild_refreshed,
+                                      progress_callback=report_progress if large_batch else None, progress_interval_seconds=60)
+    finally:
+      for guild_id in guild_ids:
+        if guild_id not in refreshed_guild_ids:
+          self.refresh_scheduler.mark_failed(guild_id, now)
 
-                if guild_id in updated_guild_ids:
-                  continue
+      if large_batch:
+        self.bot.presence_handler.start()
 
-                if (await dt_blacklist_repo.is_on_blacklist(session, dt_blacklist_repo.BlacklistType.GUILD, guild_id)) or not (await dt_guild_repo.is_guild_active(session, guild_id)):
-                  continue
+    return stats
 
-                data = await dt_helpers.get_dt_guild_data(guild_id)
+  @tasks.loop(seconds=config.refresh_scheduler.tick_seconds)
+  async def data_update_task(self):
+    now = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
 
-                await asyncio.sleep(1)
-                if data is None:
-                  not_updated_guild_ids_queue.append(guild_id)
-                  continue
+    try:
+      with session_maker() as session:
+        if self.last_guild_list_refresh is None or now - self.last_guild_list_refresh >= datetime.timedelta(hours=config.refresh_scheduler.guild_list_refresh_hours):
+          all_guild_ids = await self.bot.dt_guild_crawler.get_ids_of_all_guilds()
+          if all_guild_ids:
+            blacklist = await dt_blacklist_repo.get_blacklist_cache(session)
+            all_guild_ids = [guild_id for guild_id in all_guild_ids if not blacklist.contains(dt_blacklist_repo.BlacklistType.GUILD, guild_id)]
+            self.refresh_scheduler.sync_guilds(all_guild_ids, await dt_guild_repo.get_inactive_guild_ids(session), now)
+            await self.rotate_scheduled_run(session, now)
+            self.last_guild_list_refresh = now
+            logger.info(f"Refresh scheduler synchronized with {len(self.refresh_scheduler)} DT guilds")
 
-                await event_participation_repo.generate_or_update_event_participations(session, data)
-                updated_guild_ids.append(guild_id)
+        if self.scheduled_run_id is None: return
 
-              if not_updated_guild_ids_queue:
-                if number_of_failed_updates >= 10:
-                  logger.warning(f"{list(not_updated_guild_ids_queue)} guilds not updated (already failed {number_of_failed_updates}x), giving up")
-                  break
-                else:
-                  logger.warning(f"{list(not_updated_guild_ids_queue)} guilds not updated (already failed {number_of_failed_updates}x), retrying")
-                  number_of_failed_updates += 1
-                  await asyncio.sleep(120)
+        self.refresh_scheduler.set_tracked_guilds(await tracking_settings_repo.get_tracked_guild_ids(session), now)
 
-            logger.info(f"Pulled data of {len(updated_guild_ids)} DT guilds")
+        guild_ids = self.refresh_scheduler.pop_due_guild_ids(now, config.refresh_scheduler.batch_size)
+        if not guild_ids: return
 
-            await dt_statistics_repo.generate_or_update_active_statistics(session)
+        stats = await self.refresh_scheduled_guilds(session, guild_ids)
+        logger.info(f"Scheduled refresh of DT guilds: {stats}, {self.refresh_scheduler.get_number_of_due_guilds(now)} guilds still due")
 
-          break
-        except exc.OperationalError as e:
-          if e.connection_invalidated:
-            logger.warning("Database connection failed, retrying later")
-            await asyncio.sleep(60)
-            logger.info("Retrying...")
-          else:
-            raise e
+        if self.last_leaderboards_refresh is None or now - self.last_leaderboards_refresh >= datetime.timedelta(minutes=config.data_manager.leaderboards_refresh_minutes):
+          await self.refresh_live_leaderboards(session, now)
 
-    logger.info("DT Guild data pull finished")
+        if self.last_guild_ranks_refresh is None or now - self.last_guild_ranks_refresh >= datetime.timedelta(minutes=config.data_manager.guild_ranks_refresh_minutes):
+          await self.refresh_guild_standings(session)
 
-    await asyncio.sleep(30)
-    self.bot.presence_handler.start()
+        if self.last_statistics_update is None or now - self.last_statistics_update >= datetime.timedelta(hours=1):
+          await dt_statistics_repo.generate_or_update_active_statistics(session)
+          self.last_statistics_update = now
+    except exc.OperationalError as e:
+      if e.connection_invalidated:
+        logger.warning("Database connection failed, retrying later")
+      else:
+        raise e
 
-    if not self.inactive_guild_data_update_task.is_running() and config.data_manager.inactive_guild_data_pull_rate_hours > 0:
-      self.inactive_guild_data_update_task.start()
+  async def refresh_live_leaderboards(self, session, now: datetime.datetime):
+    """
+    Rebuild leaderboards of current event, when new event started leaderboards of previous one are rebuilt last time
+    """
+    event_index = dt_helpers.get_event_index(now)
+    event_indexes = [event_index]
+    if self.live_leaderboards_event is not None and self.live_leaderboards_event != event_index:
+      event_indexes.append(self.live_leaderboards_event)
+
+    event_ids = [event_id for event_id in [await event_participation_repo.get_event_id(session, year, week) for year, week in event_indexes] if event_id is not None]
+    if event_ids:
+      start_time = time.monotonic()
+      await dt_event_leaderboard_repo.refresh_event_leaderboards(session, event_ids, commit=True)
+      logger.info(f"Refreshed leaderboards of events {event_indexes} in {time.monotonic() - start_time:.1f}s")
+    self.live_leaderboards_event = event_index
+    self.last_leaderboards_refresh = now
+
+  async def refresh_guild_standings(self, session, recount_members: bool=False):
+    """
+    Recompute level ranks of all guilds from stored levels, member counts are recounted only when requested
+    """
+    start_time = time.monotonic()
+    changed_ranks = await dt_guild_repo.refresh_guild_level_ranks(session, commit=not recount_members)
+    changed_counts = await dt_guild_repo.refresh_guild_member_counts(session, commit=True) if recount_members else 0
+    self.last_guild_ranks_refresh = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    logger.info(f"Refreshed guild standings in {time.monotonic() - start_time:.1f}s, {changed_ranks} ranks and {changed_counts} member counts changed")
+
+  @data_update_task.before_loop
+  async def before_data_update_task(self):
+    await self.bot.wait_until_ready()
+    await asyncio.sleep(config.data_manager.pull_data_startup_delay_seconds)
 
 def setup(bot):
   bot.add_cog(DTDataDownloader(bot))
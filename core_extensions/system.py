@@ -3,6 +3,7 @@
 import disnake
 from disnake.ext import commands
 import asyncio
+import datetime
 import math
 from typing import Optional
 
@@ -13,6 +14,7 @@ from features.views.paginator import EmbedView
 from features.base_bot import BaseAutoshardedBot
 from utils import command_utils, message_utils, string_manipulation
 from features.git_manipulation import Git
+import database
 
 logger = setup_custom_logger(__name__)
 
@@ -281,6 +283,65 @@ class System(Base_Cog):
       result_message, result_message_lines = string_manipulation.add_string_until_length(result_message_lines, 1900, "\n")
       await inter.send(f"Git pull result\n```diff\n{result_message}\n```")
 
+  @system_commands.sub_command_group(name="database")
+  async def database_commands(self, inter: disnake.CommandInteraction):
+    pass
+
+  @database_commands.sub_command(name="executor", description=Strings.system_database_executor_description)
+  async def database_executor(self, inter: disnake.CommandInteraction,
+                              reset: bool=commands.Param(default=False, description=Strings.system_database_executor_reset_param_description)):
+    executor = database.db_executor
+    stats = executor.get_stats()
+    if reset:
+      executor.reset_stats()
+
+    if not stats:
+      return await message_utils.generate_error_message(inter, Strings.system_database_executor_no_calls)
+
+    since = datetime.datetime.fromtimestamp(executor.started_at)
+    number_of_batches = math.ceil(len(stats) / 10)
+
+    pages = []
+    for batch_idx in range(number_of_batches):
+      embed = disnake.Embed(title="Database executor", description=f"{executor}\nCollected since {since.strftime('%d.%m.%Y %H:%M')}", color=disnake.Color.dark_blue())
+
+      for caller, caller_stats in stats[batch_idx * 10: batch_idx * 10 + 10]:
+        embed.add_field(name=string_manipulation.truncate_string(caller, 250),
+                        value=f"Calls `{caller_stats.calls}` (failed `{caller_stats.failures}`), in flight `{caller_stats.in_flight}` (max `{caller_stats.max_in_flight}`)\n"
+                              f"Queue wait avg `{caller_stats.average_queue_wait * 1000:.1f}ms` max `{caller_stats.max_queue_wait_seconds * 1000:.1f}ms` total `{caller_stats.queue_wait_seconds:.1f}s`\n"
+                              f"Execution avg `{caller_stats.average_execution * 1000:.1f}ms` max `{caller_stats.max_execution_seconds * 1000:.1f}ms` total `{caller_stats.execution_seconds:.1f}s`",
+                        inline=False)
+
+      pages.append(embed)
+
+    await EmbedView(inter.author, pages, perma_lock=True).run(inter)
+
+  @database_commands.sub_command(name="profile", description=Strings.system_database_profile_description)
+  async def database_profile(self, inter: disnake.CommandInteraction,
+                             window_minutes: int=commands.Param(default=60, min_value=1, max_value=config.query_profiler.retention_minutes, description=Strings.system_database_profile_window_param_description),
+                             limit: int=commands.Param(default=10, min_value=1, max_value=20, description=Strings.system_database_profile_limit_param_description)):
+    profiler = database.query_profiler
+    if profiler is None:
+      return await message_utils.generate_error_message(inter, Strings.system_database_profile_disabled)
+
+    window_seconds = window_minutes * 60
+    top_by_total_time = profiler.get_top_by_total_time(window_seconds, limit)
+    if not top_by_total_time:
+      return await message_utils.generate_error_message(inter, Strings.system_database_profile_no_statements(minutes=window_minutes))
+
+    pages = []
+    for title, top_functions in ((f"Top functions by total time in last {window_minutes} minutes", top_by_total_time),
+                                 (f"Top functions by p95 in last {window_minutes} minutes", profiler.get_top_by_percentile(window_seconds, limit, 95))):
+      embed = disnake.Embed(title=title, color=disnake.Color.dark_blue())
+      for caller, stats in top_functions:
+        embed.add_field(name=string_manipulation.truncate_string(caller, 250),
+                        value=f"Statements `{stats.calls}`, rows `{stats.rows}`\n"
+                              f"Total `{stats.total_seconds:.2f}s`, avg `{stats.average_seconds * 1000:.1f}ms`, p95 `{stats.get_percentile(95) * 1000:.1f}ms`, max `{stats.max_seconds * 1000:.1f}ms`",
+                        inline=False)
+      pages.append(embed)
+
+    await EmbedView(inter.author, pages, perma_lock=True).run(inter)
+
 
 def setup(bot):
   bot.add_cog(System(bot))
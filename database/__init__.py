@@ -1,25 +1,37 @@
-import asyncio
-from typing import Any
-from sqlalchemy import BigInteger, create_engine
+import contextlib
+from typing import Any, Callable, Optional, Union, AsyncIterator
+from sqlalchemy import BigInteger, create_engine, event
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.dialects import postgresql, sqlite
 import pkgutil
 import importlib
+import sys
+import time
 import traceback
 
 from config import config
+from features.db_executor import DBExecutor
+from features.query_profiler import QueryProfiler
 from utils.logger import setup_custom_logger
 
 logger = setup_custom_logger(__name__)
 
+DEFERRED_COMMIT_KEY = "deferred_commit"
+AFTER_COMMIT_CALLBACKS_KEY = "after_commit_callbacks"
+SAVEPOINT_CALLBACK_MARKS_KEY = "savepoint_callback_marks"
+
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+
 if config.base.database_connect_string is None or config.base.database_connect_string == "":
   logger.error("Database connect string is empty!")
   exit(-1)
 
 try:
   base = declarative_base()
-  engine = create_engine(config.base.database_connect_string, pool_pre_ping=True, pool_use_lifo=True, pool_size=5, max_overflow=10, pool_recycle=3600)
+  engine = create_engine(config.base.database_connect_string, pool_pre_ping=True, pool_use_lifo=True, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_recycle=3600)
 except Exception:
   logger.error(f"Failed to create database connection\n{traceback.format_exc()}")
   exit(-1)
@@ -32,14 +44,205 @@ except Exception:
   logger.error(f"Failed to create database session maker\n{traceback.format_exc()}")
   exit(-1)
 
-async def run_query_in_thread(session: Session, statement: Any, commit: bool=False):
-  result = await asyncio.to_thread(session.execute, statement)
+# Sized to connection pool so worker never waits for connection and calls over capacity wait in measurable queue
+db_executor = DBExecutor(POOL_SIZE + MAX_OVERFLOW)
+
+def get_caller_name() -> str:
+  """
+  :return: Name of function outside of this module that called database helper, for example `event_participation_repo.get_event_participation_stats`
+  """
+  frame = sys._getframe(1)
+  # Frames of context managers in this module are entered through contextlib
+  while frame is not None and frame.f_globals.get("__name__") in (__name__, "contextlib"):
+    frame = frame.f_back
+  if frame is None:
+    return "unknown"
+
+  module_name = frame.f_globals.get("__name__", "unknown")
+  return f"{module_name.removeprefix('database.')}.{frame.f_code.co_name}"
+
+query_profiler: Optional[QueryProfiler] = QueryProfiler(config.query_profiler.retention_minutes) if config.query_profiler.enabled else None
+
+def render_statement(statement: Any, params: Any=None) -> str:
+  try:
+    if params is None and hasattr(statement, "compile"):
+      return str(statement.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True}))
+  except Exception:
+    pass
+
+  rendered = str(statement)
+  if isinstance(params, list):
+    rendered += f"\n-- executed with {len(params)} parameter sets"
+  elif params is not None:
+    rendered += f"\n-- parameters: {params}"
+  return rendered
+
+def profile_statement(caller: str, statement: Any, params: Any, seconds: float, result: Any):
+  if query_profiler is None: return
+
+  # Drivers report -1 when number of rows is not known without fetching them
+  rows = getattr(result, "rowcount", -1)
+  query_profiler.record(caller, seconds, rows if rows >= 0 else None)
+
+  if 0 < config.query_profiler.slow_query_threshold_ms <= seconds * 1000:
+    logger.warning(f"Slow query in {caller} took {seconds * 1000:.0f}ms:\n{render_statement(statement, params)[:2000]}")
+
+def execute_timed(session: Session, statement: Any, params: Any=None):
+  start_time = time.perf_counter()
+  result = session.execute(statement, params)
+  return result, time.perf_counter() - start_time
+
+def get_async_connect_string(connect_string: str) -> str:
+  """
+  Connect string with asyncio driver of same database
+  """
+  dialect, rest = connect_string.split("://", 1)
+  dialect = dialect.split("+", 1)[0]
+  if dialect in ("postgresql", "postgres"):
+    return f"postgresql+asyncpg://{rest}"
+  if dialect == "sqlite":
+    return f"sqlite+aiosqlite://{rest}"
+  raise NotImplementedError(f"Async engine not supported for dialect {dialect}")
+
+def create_async_session_maker(connect_string: str) -> async_sessionmaker:
+  async_engine = create_async_engine(get_async_connect_string(connect_string), pool_pre_ping=True, pool_use_lifo=True, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_recycle=3600)
+  return async_sessionmaker(async_engine, expire_on_commit=False)
+
+# Native asyncio engine used by sessions of high throughput writers, sync engine is still used by everything else
+# because rest of the bot relies on lazy loading of relationships which is not available in async sessions
+async_session_maker: Optional[async_sessionmaker] = None
+if config.base.database_async_engine:
+  try:
+    async_session_maker = create_async_session_maker(config.base.database_connect_string)
+  except Exception:
+    logger.error(f"Failed to create async database engine\n{traceback.format_exc()}")
+    exit(-1)
+
+@contextlib.asynccontextmanager
+async def writer_session() -> AsyncIterator[Union[Session, AsyncSession]]:
+  """
+  Session for high throughput writers, AsyncSession when async engine is enabled otherwise sync session
+  Repository functions work with both of them
+  """
+  if async_session_maker is not None:
+    async with async_session_maker() as session:
+      yield session
+  else:
+    with session_maker() as session:
+      yield session
+
+async def run_query_in_thread(session: Union[Session, AsyncSession], statement: Any, commit: bool=False, params: Any=None):
+  caller = get_caller_name()
+  if isinstance(session, AsyncSession):
+    start_time = time.perf_counter()
+    result = await session.execute(statement, params)
+    duration = time.perf_counter() - start_time
+  else:
+    # Timed in worker so time spent waiting for free worker is not included
+    result, duration = await db_executor.run(caller, execute_timed, session, statement, params)
+  profile_statement(caller, statement, params, duration, result)
+
   if commit:
     await run_commit_in_thread(session)
   return result
 
-async def run_commit_in_thread(session: Session):
-  await asyncio.to_thread(session.commit)
+async def run_commit_in_thread(session: Union[Session, AsyncSession]):
+  if session.info.get(DEFERRED_COMMIT_KEY, False):
+    # Session is part of batched transaction, changes are only flushed and commited by owner of the batch
+    if isinstance(session, AsyncSession):
+      await session.flush()
+    else:
+      await db_executor.run(get_caller_name(), session.flush)
+  else:
+    if isinstance(session, AsyncSession):
+      await session.commit()
+    else:
+      await db_executor.run(get_caller_name(), session.commit)
+
+async def run_rollback_in_thread(session: Union[Session, AsyncSession]):
+  if isinstance(session, AsyncSession):
+    await session.rollback()
+  else:
+    await db_executor.run(get_caller_name(), session.rollback)
+
+@contextlib.asynccontextmanager
+async def batched_transaction(session: Union[Session, AsyncSession]):
+  """
+  Defer commits of repository functions so multiple units of work share one transaction
+  """
+  session.info[DEFERRED_COMMIT_KEY] = True
+  try:
+    yield session
+  except BaseException:
+    session.info.pop(DEFERRED_COMMIT_KEY, None)
+    await run_rollback_in_thread(session)
+    raise
+
+  session.info.pop(DEFERRED_COMMIT_KEY, None)
+  await run_commit_in_thread(session)
+
+@contextlib.asynccontextmanager
+async def savepoint(session: Union[Session, AsyncSession]):
+  """
+  Unit of work inside batched transaction, on error only its own changes are rolled back
+  """
+  if isinstance(session, AsyncSession):
+    nested_transaction = await session.begin_nested()
+    try:
+      yield session
+    except BaseException:
+      await nested_transaction.rollback()
+      raise
+    await nested_transaction.commit()
+    return
+
+  caller = get_caller_name()
+  nested_transaction = await db_executor.run(caller, session.begin_nested)
+  try:
+    yield session
+  except BaseException:
+    await db_executor.run(caller, nested_transaction.rollback)
+    raise
+  await db_executor.run(caller, nested_transaction.commit)
+
+def call_after_commit(session: Union[Session, AsyncSession], callback: Callable[[], None]):
+  """
+  Call callback when changes made so far in session are commited, immediately when session is not in transaction
+  Callback is discarded when transaction is rolled back or when it was registered in savepoint that is rolled back
+  """
+  if not session.in_transaction():
+    callback()
+    return
+  session.info.setdefault(AFTER_COMMIT_CALLBACKS_KEY, []).append(callback)
+
+@event.listens_for(Session, "after_transaction_create")
+def mark_savepoint_callbacks(session: Session, transaction):
+  if transaction.nested:
+    session.info.setdefault(SAVEPOINT_CALLBACK_MARKS_KEY, {})[transaction] = len(session.info.get(AFTER_COMMIT_CALLBACKS_KEY, []))
+
+@event.listens_for(Session, "after_commit")
+def run_after_commit_callbacks(session: Session):
+  # Released savepoint is not commited yet, its callbacks wait for commit of whole transaction
+  if session.in_nested_transaction(): return
+
+  for callback in session.info.pop(AFTER_COMMIT_CALLBACKS_KEY, []):
+    callback()
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_after_commit_callbacks(session: Session, previous_transaction):
+  if previous_transaction.nested:
+    mark = session.info.get(SAVEPOINT_CALLBACK_MARKS_KEY, {}).pop(previous_transaction, None)
+    if mark is not None:
+      del session.info.get(AFTER_COMMIT_CALLBACKS_KEY, [])[mark:]
+  elif previous_transaction.parent is None:
+    session.info.pop(AFTER_COMMIT_CALLBACKS_KEY, None)
+
+@event.listens_for(Session, "after_transaction_end")
+def clear_after_commit_callbacks(session: Session, transaction):
+  # Session closed without commit or rollback
+  if transaction.parent is None:
+    session.info.pop(AFTER_COMMIT_CALLBACKS_KEY, None)
+    session.info.pop(SAVEPOINT_CALLBACK_MARKS_KEY, None)
 
 async def add_items(session: Session, items):
   for item in items:
@@ -47,6 +250,16 @@ async def add_items(session: Session, items):
   await run_commit_in_thread(session)
   return items
 
+def insert_on_conflict(table: Any):
+  """
+  Insert statement of current database dialect supporting ON CONFLICT clauses
+  """
+  if engine.dialect.name == "postgresql":
+    return postgresql.insert(table)
+  if engine.dialect.name == "sqlite":
+    return sqlite.insert(table)
+  raise NotImplementedError(f"Upsert not supported for dialect {engine.dialect.name}")
+
 BigIntegerType = BigInteger()
 BigIntegerType = BigIntegerType.with_variant(postgresql.BIGINT(), 'postgresql')
 BigIntegerType = BigIntegerType.with_variant(sqlite.INTEGER(), 'sqlite')
@@ -1,18 +1,95 @@
-from typing import Optional, List
+import asyncio
+from typing import Optional, List, Iterable, Set, Dict, Callable
 
 from sqlalchemy import select, delete
 
 from database import run_query_in_thread, run_commit_in_thread
 from database.tables.dt_blacklist import BlacklistType, DTBlacklistItem
 
+class BlacklistCache:
+  """
+  Process wide copy of blacklist, loaded on first use and invalidated on every change made through this repository
+  """
+  def __init__(self):
+    self.identifiers: Optional[Dict[BlacklistType, Set[int]]] = None
+    # Incremented on every invalidation so load that raced with change of blacklist doesn't store outdated identifiers
+    self.generation = 0
+    self.listeners: List[Callable[[BlacklistType, int, bool], None]] = []
+    self.lock = asyncio.Lock()
+
+  @property
+  def loaded(self) -> bool:
+    return self.identifiers is not None
+
+  async def load(self, session):
+    async with self.lock:
+      while self.identifiers is None:
+        generation = self.generation
+        result = await run_query_in_thread(session, select(DTBlacklistItem.bl_type, DTBlacklistItem.identifier))
+        identifiers = {bl_type: set() for bl_type in BlacklistType}
+        for bl_type, identifier in result.all():
+          identifiers[bl_type].add(identifier)
+
+        # Blacklist changed while query was running, result can miss the change so it's loaded again
+        if generation == self.generation:
+          self.identifiers = identifiers
+
+  def invalidate(self):
+    self.generation += 1
+    self.identifiers = None
+
+  def contains(self, bl_type: BlacklistType, identifier: int) -> bool:
+    if self.identifiers is None:
+      raise RuntimeError("Blacklist cache is not loaded")
+    return identifier in self.identifiers[BlacklistType(bl_type)]
+
+  def get_identifiers(self, bl_type: BlacklistType) -> Set[int]:
+    if self.identifiers is None:
+      raise RuntimeError("Blacklist cache is not loaded")
+    return set(self.identifiers[BlacklistType(bl_type)])
+
+  def notify(self, bl_type: BlacklistType, identifier: int, added: bool):
+    self.invalidate()
+    for listener in self.listeners:
+      listener(BlacklistType(bl_type), identifier, added)
+
+blacklist_cache = BlacklistCache()
+
+async def get_blacklist_cache(session) -> BlacklistCache:
+  """
+  :return: Loaded blacklist cache for O(1) membership checks without database queries
+  """
+  if not blacklist_cache.loaded:
+    await blacklist_cache.load(session)
+  return blacklist_cache
+
+def add_blacklist_listener(listener: Callable[[BlacklistType, int, bool], None]):
+  """
+  :param listener: Called with type, identifier and True when item was added or False when it was removed
+  """
+  blacklist_cache.listeners.append(listener)
+
+def remove_blacklist_listener(listener: Callable[[BlacklistType, int, bool], None]):
+  if listener in blacklist_cache.listeners:
+    blacklist_cache.listeners.remove(listener)
+
 async def get_blacklist_item(session, bl_type: BlacklistType, identifier: int) -> Optional[DTBlacklistItem]:
   statement = select(DTBlacklistItem).filter(DTBlacklistItem.bl_type == BlacklistType(bl_type), DTBlacklistItem.identifier == identifier)
   result = await run_query_in_thread(session, statement)
   return result.scalar_one_or_none()
 
 async def is_on_blacklist(session, bl_type: BlacklistType, identifier: int) -> bool:
-  result = await run_query_in_thread(session, select(DTBlacklistItem.identifier).filter(DTBlacklistItem.bl_type == BlacklistType(bl_type), DTBlacklistItem.identifier == identifier))
-  return result.scalar_one_or_none() is not None
+  return (await get_blacklist_cache(session)).contains(bl_type, identifier)
+
+async def get_blacklisted_ids(session, bl_type: BlacklistType) -> List[int]:
+  return list((await get_blacklist_cache(session)).get_identifiers(bl_type))
+
+async def filter_blacklisted_ids(session, bl_type: BlacklistType, identifiers: Iterable[int]) -> Set[int]:
+  """
+  :return: Subset of identifiers that are on blacklist
+  """
+  cache = await get_blacklist_cache(session)
+  return {identifier for identifier in identifiers if cache.contains(bl_type, identifier)}
 
 async def get_blacklist_items(session, bl_type: Optional[BlacklistType]=None) -> List[DTBlacklistItem]:
   if bl_type is not None:
@@ -29,9 +106,13 @@ async def create_blacklist_item(session, bl_type: BlacklistType, identifier: int
   item = DTBlacklistItem(bl_type=BlacklistType(bl_type), identifier=identifier, additional_data=additional_data)
   session.add(item)
   await run_commit_in_thread(session)
+  blacklist_cache.notify(bl_type, identifier, True)
 
   return item
 
 async def remove_blacklist_item(session, bl_type: BlacklistType, identifier: int) -> bool:
   result = await run_query_in_thread(session, delete(DTBlacklistItem).filter(DTBlacklistItem.bl_type == BlacklistType(bl_type), DTBlacklistItem.identifier == identifier), commit=True)
-  return result.rowcount > 0
+  if result.rowcount > 0:
+    blacklist_cache.notify(bl_type, identifier, False)
+    return True
+  return False
@@ -0,0 +1,95 @@
+import datetime
+from typing import Optional, List, Tuple, Dict, Iterable
+from sqlalchemy import select, update, delete, func, insert
+
+from database import run_query_in_thread, run_commit_in_thread
+from database.tables.dt_crawl_run import DTCrawlRun, DTCrawlRunItem, CrawlRunKind, CrawlItemStatus
+
+async def get_run(session, run_id: int) -> Optional[DTCrawlRun]:
+  result = await run_query_in_thread(session, select(DTCrawlRun).filter(DTCrawlRun.id == run_id))
+  return result.scalar_one_or_none()
+
+async def get_last_runs(session, limit: int=5) -> List[DTCrawlRun]:
+  result = await run_query_in_thread(session, select(DTCrawlRun).order_by(DTCrawlRun.id.desc()).limit(limit))
+  return result.scalars().all()
+
+async def get_unfinished_run(session, kind: CrawlRunKind) -> Optional[DTCrawlRun]:
+  result = await run_query_in_thread(session, select(DTCrawlRun).filter(DTCrawlRun.kind == CrawlRunKind(kind), DTCrawlRun.finished_at == None).order_by(DTCrawlRun.id.desc()).limit(1))
+  return result.scalar_one_or_none()
+
+async def create_run(session, kind: CrawlRunKind, guild_ids: Iterable[int]=()) -> DTCrawlRun:
+  run = DTCrawlRun(kind=CrawlRunKind(kind))
+  session.add(run)
+  await run_commit_in_thread(session)
+
+  await add_run_items(session, run.id, guild_ids)
+  return run
+
+async def add_run_items(session, run_id: int, guild_ids: Iterable[int]):
+  """
+  Add guilds to run as pending, guilds already present in run are set back to pending
+  """
+  guild_ids = list(dict.fromkeys(guild_ids))
+  if not guild_ids: return
+
+  result = await run_query_in_thread(session, select(DTCrawlRunItem.guild_id).filter(DTCrawlRunItem.run_id == run_id, DTCrawlRunItem.guild_id.in_(guild_ids)))
+  existing_ids = set(result.scalars().all())
+
+  if existing_ids:
+    await run_query_in_thread(session, update(DTCrawlRunItem).filter(DTCrawlRunItem.run_id == run_id, DTCrawlRunItem.guild_id.in_(existing_ids)).values(status=CrawlItemStatus.PENDING))
+
+  new_ids = [guild_id for guild_id in guild_ids if guild_id not in existing_ids]
+  if new_ids:
+    await run_query_in_thread(session, insert(DTCrawlRunItem), params=[{"run_id": run_id, "guild_id": guild_id, "status": CrawlItemStatus.PENDING, "attempts": 0} for guild_id in new_ids])
+
+  await run_commit_in_thread(session)
+
+async def get_guild_ids_to_process(session, run_id: int, max_attempts: int) -> List[int]:
+  """
+  :return: IDs of pending guilds and failed guilds that have not exhausted their attempts
+  """
+  result = await run_query_in_thread(session, select(DTCrawlRunItem.guild_id).filter(DTCrawlRunItem.run_id == run_id,
+                                                                                     (DTCrawlRunItem.status == CrawlItemStatus.PENDING) | ((DTCrawlRunItem.status == CrawlItemStatus.FAILED) & (DTCrawlRunItem.attempts < max_attempts))))
+  return result.scalars().all()
+
+async def get_done_items(session, run_id: int) -> List[Tuple[int, datetime.datetime]]:
+  """
+  :return: guild id, time of last successful refresh
+  """
+  result = await run_query_in_thread(session, select(DTCrawlRunItem.guild_id, DTCrawlRunItem.updated_at).filter(DTCrawlRunItem.run_id == run_id, DTCrawlRunItem.status == CrawlItemStatus.DONE))
+  return result.all()
+
+async def mark_item_done(session, run_id: int, guild_id: int, commit: bool=True):
+  await run_query_in_thread(session, update(DTCrawlRunItem).filter(DTCrawlRunItem.run_id == run_id, DTCrawlRunItem.guild_id == guild_id).values(status=CrawlItemStatus.DONE, attempts=DTCrawlRunItem.attempts + 1, last_error=None), commit=commit)
+
+async def mark_item_failed(session, run_id: int, guild_id: int, error: Optional[str], commit: bool=True):
+  await run_query_in_thread(session, update(DTCrawlRunItem).filter(DTCrawlRunItem.run_id == run_id, DTCrawlRunItem.guild_id == guild_id).values(status=CrawlItemStatus.FAILED, attempts=DTCrawlRunItem.attempts + 1, last_error=error), commit=commit)
+
+async def finish_run(session, run_id: int):
+  await run_query_in_thread(session, update(DTCrawlRun).filter(DTCrawlRun.id == run_id).values(finished_at=datetime.datetime.now(datetime.UTC).replace(tzinfo=None)), commit=True)
+
+async def get_run_status_counts(session, run_id: int) -> Dict[CrawlItemStatus, int]:
+  result = await run_query_in_thread(session, select(DTCrawlRunItem.status, func.count()).filter(DTCrawlRunItem.run_id == run_id).group_by(DTCrawlRunItem.status))
+  counts = {status: 0 for status in CrawlItemStatus}
+  counts.update({status: count for status, count in result.all()})
+  return counts
+
+async def get_last_errors(session, run_id: int, limit: int=5) -> List[Tuple[int, int, str]]:
+  """
+  :return: guild id, attempts, last error
+  """
+  result = await run_query_in_thread(session, select(DTCrawlRunItem.guild_id, DTCrawlRunItem.attempts, DTCrawlRunItem.last_error).filter(DTCrawlRunItem.run_id == run_id, DTCrawlRunItem.status == CrawlItemStatus.FAILED).order_by(DTCrawlRunItem.updated_at.desc()).limit(limit))
+  return result.all()
+
+async def remove_old_runs(session, keep: int) -> int:
+  """
+  Remove finished runs except of last `keep` ones
+  """
+  kept_ids = select(DTCrawlRun.id).order_by(DTCrawlRun.id.desc()).limit(max(keep, 0)).scalar_subquery()
+  old_run_ids = (await run_query_in_thread(session, select(DTCrawlRun.id).filter(DTCrawlRun.finished_at != None, DTCrawlRun.id.not_in(kept_ids)))).scalars().all()
+  if not old_run_ids: return 0
+
+  # Items removed explicitly because sqlite does not enforce cascades by default
+  await run_query_in_thread(session, delete(DTCrawlRunItem).filter(DTCrawlRunItem.run_id.in_(old_run_ids)))
+  result = await run_query_in_thread(session, delete(DTCrawlRun).filter(DTCrawlRun.id.in_(old_run_ids)), commit=True)
+  return result.rowcount
@@ -0,0 +1,75 @@
+# Cached numbers of active and all Deep Town guilds and users for presence messages and daily statistics
+
+import asyncio
+import dataclasses
+import datetime
+from typing import Optional
+from sqlalchemy import select, func
+
+from config import config
+from database import run_query_in_thread
+from database.tables.dt_guild import DTGuild
+from database.tables.dt_user import DTUser
+
+@dataclasses.dataclass(frozen=True)
+class EntityCounters:
+  active_guilds: int
+  active_users: int
+  all_guilds: int
+  all_users: int
+
+def get_user_activity_threshold() -> datetime.datetime:
+  """
+  :return: Users online after this time are active
+  """
+  return datetime.datetime.now(datetime.UTC).replace(tzinfo=None) - datetime.timedelta(days=config.data_manager.activity_days_threshold)
+
+class EntityCountersCache:
+  """
+  Process wide counters, recounted when they are older than configured age or after guilds or users were removed
+  """
+  def __init__(self):
+    self.counters: Optional[EntityCounters] = None
+    self.counted_at: Optional[datetime.datetime] = None
+    self.lock = asyncio.Lock()
+
+  def is_fresh(self, now: datetime.datetime) -> bool:
+    return self.counters is not None and now - self.counted_at < datetime.timedelta(minutes=config.data_manager.entity_counters_max_age_minutes)
+
+  async def refresh(self, session) -> EntityCounters:
+    # All four numbers in one statement, active users are counted separately so only range of last online index is read
+    guilds = select(func.count().label("all"), func.count().filter(DTGuild.is_active == True).label("active")).select_from(DTGuild).subquery()
+    active_users = select(func.count()).select_from(DTUser).filter(DTUser.last_online > get_user_activity_threshold()).scalar_subquery()
+    all_users = select(func.count()).select_from(DTUser).scalar_subquery()
+
+    active_guilds, active_users, all_guilds, all_users = (await run_query_in_thread(session, select(guilds.c.active, active_users, guilds.c.all, all_users))).one()
+    self.counters = EntityCounters(active_guilds, active_users, all_guilds, all_users)
+    self.counted_at = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    return self.counters
+
+  async def get(self, session) -> EntityCounters:
+    if self.is_fresh(datetime.datetime.now(datetime.UTC).replace(tzinfo=None)):
+      return self.counters
+
+    async with self.lock:
+      if self.is_fresh(datetime.datetime.now(datetime.UTC).replace(tzinfo=None)):
+        return self.counters
+      return await self.refresh(session)
+
+  def invalidate(self):
+    self.counters = None
+    self.counted_at = None
+
+entity_counters_cache = EntityCountersCache()
+
+async def get_entity_counters(session, recount: bool=False) -> EntityCounters:
+  """
+  :param recount: Count entities even when cached counters are still fresh
+  """
+  if recount:
+    async with entity_counters_cache.lock:
+      return await entity_counters_cache.refresh(session)
+  return await entity_counters_cache.get(session)
+
+def invalidate_entity_counters():
+  entity_counters_cache.invalidate()
@@ -17,8 +17,8 @@ async def get_event_item_lottery_by_constrained(session, author_id: int, guild_i
 
 async def get_next_event_item_lottery_by_constrained(session, author_id: int, guild_id: int) -> Optional[DTEventItemLottery]:
   next_year, next_week = dt_helpers.get_event_index(datetime.datetime.now(datetime.UTC).replace(tzinfo=None) + datetime.timedelta(days=7))
-  event_specification = await event_participation_repo.get_or_create_event_specification(session, next_year, next_week)
-  return await get_event_item_lottery_by_constrained(session, author_id, guild_id, event_specification.event_id)
+  event_id = await event_participation_repo.get_or_create_event_id(session, next_year, next_week)
+  return await get_event_item_lottery_by_constrained(session, author_id, guild_id, event_id)
 
 async def event_lotery_exist(session, guild_id: int, author_id: int, event_id: int) -> bool:
   result = await run_query_in_thread(session, select(DTEventItemLottery.id).filter(DTEventItemLottery.guild_id == str(guild_id), DTEventItemLottery.author_id == str(author_id), DTEventItemLottery.event_id == event_id))
@@ -30,14 +30,14 @@ async def create_event_item_lottery(session, author: disnake.Member, channel: Un
                                     reward_item_g2: Optional[dt_items_repo.DTItem]=None, item_g2_amount: int=0,
                                     reward_item_g1: Optional[dt_items_repo.DTItem]=None, item_g1_amount: int=0) -> Optional[DTEventItemLottery]:
   year, week = dt_helpers.get_event_index(datetime.datetime.now(datetime.UTC).replace(tzinfo=None) + datetime.timedelta(days=7))
-  event_specification = await event_participation_repo.get_or_create_event_specification(session, year, week)
+  event_id = await event_participation_repo.get_or_create_event_id(session, year, week)
 
-  if await event_lotery_exist(session, author.guild.id, author.id, event_specification.event_id):
+  if await event_lotery_exist(session, author.guild.id, author.id, event_id):
     return None
 
   await discord_objects_repo.get_or_create_discord_member(session, author, True)
 
-  item = DTEventItemLottery(author_id=str(author.id), guild_id=str(author.guild.id), lottery_channel_id=str(channel.id), event_id=event_specification.event_id,
+  item = DTEventItemLottery(author_id=str(author.id), guild_id=str(author.guild.id), lottery_channel_id=str(channel.id), event_id=event_id,
                             guessed_4_reward_item_name=reward_item_g4.name if reward_item_g4 is not None else None, guessed_4_item_reward_amount=item_g4_amount if reward_item_g4 is not None else 0,
                             guessed_3_reward_item_name=reward_item_g3.name if reward_item_g3 is not None else None, guessed_3_item_reward_amount=item_g3_amount if reward_item_g3 is not None else 0,
                             guessed_2_reward_item_name=reward_item_g2.name if reward_item_g2 is not None else None, guessed_2_item_reward_amount=item_g2_amount if reward_item_g2 is not None else 0,
@@ -81,9 +81,9 @@ async def make_next_event_guess(session, author: disnake.Member, items: List[dt_
     return None
 
   year, week = dt_helpers.get_event_index(datetime.datetime.now(datetime.UTC).replace(tzinfo=None) + datetime.timedelta(days=7))
-  event_specification = await event_participation_repo.get_or_create_event_specification(session, year, week)
+  event_id = await event_participation_repo.get_or_create_event_id(session, year, week)
 
-  guess = await get_guess(session, author.guild.id, author.id, event_specification.event_id)
+  guess = await get_guess(session, author.guild.id, author.id, event_id)
 
   if guess is not None:
     # Guess already made so remove old items
@@ -91,7 +91,7 @@ async def make_next_event_guess(session, author: disnake.Member, items: List[dt_
   else:
     await discord_objects_repo.get_or_create_discord_member(session, author, True)
 
-    guess = DTEventItemLotteryGuess(guild_id=str(author.guild.id), author_id=str(author.id), event_id=event_specification.event_id)
+    guess = DTEventItemLotteryGuess(guild_id=str(author.guild.id), author_id=str(author.id), event_id=event_id)
     session.add(guess)
     await run_commit_in_thread(session)
 
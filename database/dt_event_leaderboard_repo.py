@@ -0,0 +1,124 @@
+# Snapshots of event leaderboards with precomputed ranks, rebuilt in one set-based statement per leaderboard
+
+from typing import Optional, List, Tuple, Iterable, Union
+from sqlalchemy import select, delete, func, Select
+from sqlalchemy.orm import aliased
+
+from database import run_query_in_thread, run_commit_in_thread, insert_on_conflict
+from database.tables.dt_event_leaderboard import DTEventUserRank, DTEventGuildRank
+from database.tables.dt_guild_event_stats import DTGuildEventStats
+from database.tables.event_participation import EventParticipation, EventSpecification
+from database.tables.event_participation_archive import ArchivedEventYear
+from database.tables.dt_guild import DTGuild
+from database.tables.dt_user import DTUser
+
+async def replace_ranks(session, table, event_id: int, columns: List[str], ranking: Select):
+  """
+  Overwrite ranks of event by upsert so concurrent rebuilds of same leaderboard don't conflict on primary key, ranks after the last one are removed
+  """
+  statement = insert_on_conflict(table).from_select(["event_id", "rank"] + columns, ranking)
+  result = await run_query_in_thread(session, statement.on_conflict_do_update(index_elements=[table.event_id, table.rank], set_={column: statement.excluded[column] for column in columns}))
+  await run_query_in_thread(session, delete(table).filter(table.event_id == event_id, table.rank > result.rowcount))
+
+async def refresh_event_leaderboards(session, event_ids: Union[Iterable[int], Select], commit: bool=False) -> int:
+  """
+  Rebuild users and guilds leaderboards of events, leaderboards of events in archived years are kept as they are
+  Guilds leaderboard is ranked from dt_guild_event_stats so they have to be refreshed first
+
+  :param event_ids: Ids of events or select of them
+  :return: Number of rebuilt event leaderboards
+  """
+  rows = (await run_query_in_thread(session, select(EventSpecification.event_id, EventSpecification.event_year)
+                                    .filter(EventSpecification.event_id.in_(event_ids if isinstance(event_ids, Select) else list(event_ids)), EventSpecification.event_year.not_in(select(ArchivedEventYear.event_year))))).all()
+
+  for event_id, event_year in rows:
+    user_total = func.sum(EventParticipation.amount)
+    users_ranking = select(EventParticipation.event_id, func.row_number().over(order_by=(user_total.desc(), EventParticipation.dt_user_id, EventParticipation.dt_guild_id)),
+                           EventParticipation.dt_user_id, EventParticipation.dt_guild_id, user_total)\
+      .filter(EventParticipation.event_year == event_year, EventParticipation.event_id == event_id)\
+      .group_by(EventParticipation.event_id, EventParticipation.dt_user_id, EventParticipation.dt_guild_id)
+
+    guilds_ranking = select(DTGuildEventStats.event_id, func.row_number().over(order_by=(DTGuildEventStats.total.desc(), DTGuildEventStats.dt_guild_id)),
+                            DTGuildEventStats.dt_guild_id, DTGuildEventStats.total, DTGuildEventStats.top_amount)\
+      .filter(DTGuildEventStats.event_id == event_id)
+
+    await replace_ranks(session, DTEventUserRank, event_id, ["dt_user_id", "dt_guild_id", "total"], users_ranking)
+    await replace_ranks(session, DTEventGuildRank, event_id, ["dt_guild_id", "total", "top_amount"], guilds_ranking)
+
+  if commit:
+    await run_commit_in_thread(session)
+  return len(rows)
+
+async def get_event_id_without_leaderboard(session, year: int, week: int) -> Optional[int]:
+  """
+  :return: Id of existing event with participations whose leaderboards were never built, otherwise None
+  """
+  event_id = (await run_query_in_thread(session, select(EventSpecification.event_id).filter(EventSpecification.event_year == year, EventSpecification.event_week == week))).scalar_one_or_none()
+  if event_id is None: return None
+
+  if (await run_query_in_thread(session, select(DTEventGuildRank.rank).filter(DTEventGuildRank.event_id == event_id).limit(1))).first() is not None:
+    return None
+  if (await run_query_in_thread(session, select(EventParticipation.event_id).filter(EventParticipation.event_year == year, EventParticipation.event_id == event_id).limit(1))).first() is None:
+    return None
+  return event_id
+
+async def ensure_event_leaderboards(session, year: int, week: int):
+  """
+  Build leaderboards of past event on first read, events before snapshots existed are not backfilled upfront
+  """
+  event_id = await get_event_id_without_leaderboard(session, year, week)
+  if event_id is not None:
+    await refresh_event_leaderboards(session, [event_id], commit=True)
+
+async def get_users_leaderboard(session, year: int, week: int, limit: int=10, offset: int=0) -> List[Tuple[str, str, int]]:
+  """
+  :return: List[Tuple[username, guild name, total]] ordered by rank
+  """
+  await ensure_event_leaderboards(session, year, week)
+  return (await run_query_in_thread(session, select(DTUser.username, DTGuild.name, DTEventUserRank.total)
+                                    .select_from(DTEventUserRank)
+                                    .join(EventSpecification, EventSpecification.event_id == DTEventUserRank.event_id)
+                                    .join(DTUser, DTUser.id == DTEventUserRank.dt_user_id)
+                                    .join(DTGuild, DTGuild.id == DTEventUserRank.dt_guild_id)
+                                    .filter(EventSpecification.event_year == year, EventSpecification.event_week == week)
+                                    .order_by(DTEventUserRank.rank)
+                                    .offset(offset)
+                                    .limit(limit))).all()
+
+async def get_guild_leaderboard(session, year: int, week: int, limit: int=10, offset: int=0) -> List[Tuple[str, int, int]]:
+  """
+  :return: List[Tuple[guild name, total, top donor amount]] ordered by rank
+  """
+  await ensure_event_leaderboards(session, year, week)
+  return (await run_query_in_thread(session, select(DTGuild.name, DTEventGuildRank.total, DTEventGuildRank.top_amount)
+                                    .select_from(DTEventGuildRank)
+                                    .join(EventSpecification, EventSpecification.event_id == DTEventGuildRank.event_id)
+                                    .join(DTGuild, DTGuild.id == DTEventGuildRank.dt_guild_id)
+                                    .filter(EventSpecification.event_year == year, EventSpecification.event_week == week)
+                                    .order_by(DTEventGuildRank.rank)
+                                    .offset(offset)
+                                    .limit(limit))).all()
+
+async def get_user_rank(session, user_id: int, year: int, week: int) -> Optional[Tuple[int, int, int]]:
+  """
+  :return: rank, total, number of ranked users or None when user have no participation in event
+  """
+  await ensure_event_leaderboards(session, year, week)
+  last_rank = aliased(DTEventUserRank)
+  return (await run_query_in_thread(session, select(DTEventUserRank.rank, DTEventUserRank.total,
+                                                    select(func.max(last_rank.rank)).filter(last_rank.event_id == DTEventUserRank.event_id).scalar_subquery())
+                                    .join(EventSpecification, EventSpecification.event_id == DTEventUserRank.event_id)
+                                    .filter(EventSpecification.event_year == year, EventSpecification.event_week == week, DTEventUserRank.dt_user_id == user_id)
+                                    .order_by(DTEventUserRank.rank)
+                                    .limit(1))).first()
+
+async def get_guild_rank(session, guild_id: int, year: int, week: int) -> Optional[Tuple[int, int, int]]:
+  """
+  :return: rank, total, number of ranked guilds or None when guild have no participation in event
+  """
+  await ensure_event_leaderboards(session, year, week)
+  last_rank = aliased(DTEventGuildRank)
+  return (await run_query_in_thread(session, select(DTEventGuildRank.rank, DTEventGuildRank.total,
+                                                    select(func.max(last_rank.rank)).filter(last_rank.event_id == DTEventGuildRank.event_id).scalar_subquery())
+                                    .join(EventSpecification, EventSpecification.event_id == DTEventGuildRank.event_id)
+                                    .filter(EventSpecification.event_year == year, EventSpecification.event_week == week, DTEventGuildRank.dt_guild_id == guild_id))).first()
@@ -0,0 +1,143 @@
+# Per guild per event aggregates of event participations, refreshed in same transaction as participations of the guild are written
+
+import itertools
+import statistics
+from typing import Optional, List, Tuple, Iterable, Union, Any
+from sqlalchemy import select, delete, insert, Select
+
+from database import run_query_in_thread, run_commit_in_thread
+from database.tables.dt_guild_event_stats import DTGuildEventStats
+from database.tables.event_participation import EventParticipation, EventSpecification
+from database.tables.event_participation_archive import ArchivedEventYear
+from database.tables.dt_guild import DTGuild
+from database.tables.dt_user import DTUser
+from utils.logger import setup_custom_logger
+
+logger = setup_custom_logger(__name__)
+
+INSERT_CHUNK_SIZE = 5_000
+REBUILD_GUILD_BATCH_SIZE = 500
+
+IdsFilter = Optional[Union[Iterable[int], Select]]
+
+def calculate_stats(guild_id: int, event_id: int, participations: List[Tuple[int, int]]) -> dict:
+  """
+  :param participations: List[Tuple[user id, amount]] of guild in event
+  :return: Values of DTGuildEventStats row
+  """
+  amounts = [amount for _, amount in participations]
+  nonzero_amounts = [amount for amount in amounts if amount > 0]
+  # Highest amount wins, lowest user id breaks ties so result doesn't depend on order of rows
+  top_user_id, top_amount = min(participations, key=lambda participation: (-participation[1], participation[0]))
+
+  return {"dt_guild_id": guild_id, "event_id": event_id,
+          "total": sum(amounts), "average": statistics.mean(amounts), "median": statistics.median(amounts),
+          "nonzero_average": statistics.mean(nonzero_amounts) if nonzero_amounts else 0, "nonzero_median": statistics.median(nonzero_amounts) if nonzero_amounts else 0,
+          "nonzero_count": len(nonzero_amounts), "member_count": len(amounts),
+          "top_user_id": top_user_id, "top_amount": top_amount}
+
+def _ids_filter(column, ids: IdsFilter) -> Any:
+  return column.in_(ids if isinstance(ids, Select) else list(ids))
+
+async def refresh_guild_event_stats(session, guild_ids: IdsFilter=None, event_ids: IdsFilter=None, event_years: Optional[Iterable[int]]=None, commit: bool=False) -> int:
+  """
+  Recalculate aggregates of selected guilds and events from their participations, groups without participations are removed
+  Aggregates of events in archived years are kept as they are
+
+  :param guild_ids: Ids of guilds or select of them, all guilds when None
+  :param event_ids: Ids of events or select of them, all events when None
+  :param event_years: Years of selected events, only narrows scanned participations (partition pruning)
+  :return: Number of written aggregate rows
+  """
+  participation_filters, stats_filters = [], [DTGuildEventStats.event_id.not_in(select(EventSpecification.event_id).join(ArchivedEventYear, ArchivedEventYear.event_year == EventSpecification.event_year))]
+  if event_years is not None:
+    participation_filters.append(EventParticipation.event_year.in_(list(event_years)))
+  if guild_ids is not None:
+    participation_filters.append(_ids_filter(EventParticipation.dt_guild_id, guild_ids))
+    stats_filters.append(_ids_filter(DTGuildEventStats.dt_guild_id, guild_ids))
+  if event_ids is not None:
+    participation_filters.append(_ids_filter(EventParticipation.event_id, event_ids))
+    stats_filters.append(_ids_filter(DTGuildEventStats.event_id, event_ids))
+
+  rows = (await run_query_in_thread(session, select(EventParticipation.dt_guild_id, EventParticipation.event_id, EventParticipation.dt_user_id, EventParticipation.amount)
+                                    .filter(*participation_filters)
+                                    .order_by(EventParticipation.dt_guild_id, EventParticipation.event_id))).all()
+
+  stats = [calculate_stats(guild_id, event_id, [(row[2], row[3]) for row in group])
+           for (guild_id, event_id), group in itertools.groupby(rows, key=lambda row: (row[0], row[1]))]
+
+  await run_query_in_thread(session, delete(DTGuildEventStats).filter(*stats_filters))
+  for start in range(0, len(stats), INSERT_CHUNK_SIZE):
+    await run_query_in_thread(session, insert(DTGuildEventStats), params=stats[start:start + INSERT_CHUNK_SIZE])
+
+  if commit:
+    await run_commit_in_thread(session)
+  return len(stats)
+
+async def have_guild_event_stats(session) -> bool:
+  return (await run_query_in_thread(session, select(DTGuildEventStats.dt_guild_id).limit(1))).first() is not None
+
+async def rebuild_guild_event_stats(session) -> int:
+  """
+  Recalculate aggregates of all guilds, each batch of guilds is committed separately
+
+  :return: Number of written aggregate rows
+  """
+  guild_ids = (await run_query_in_thread(session, select(DTGuild.id).order_by(DTGuild.id))).scalars().all()
+
+  written = 0
+  for start in range(0, len(guild_ids), REBUILD_GUILD_BATCH_SIZE):
+    written += await refresh_guild_event_stats(session, guild_ids=guild_ids[start:start + REBUILD_GUILD_BATCH_SIZE], commit=True)
+  return written
+
+async def get_guild_event_history(session, guild_id: int, year: Optional[int]=None, week: Optional[int]=None, limit: int=730) -> List[Tuple[int, int, int, float, float, Optional[str], int]]:
+  """
+  :param session: Database session
+  :param guild_id: Deep Town Guild ID
+  :param year: Event year
+  :param week: Event week
+  :param limit: Limit of retrieved data rows
+  :return: List[Tuple[event_year, event_week, total, average, nonzero average, top donor username, top donor amount]] from newest event
+  """
+  filters = [DTGuildEventStats.dt_guild_id == guild_id]
+  if year is not None:
+    filters.append(EventSpecification.event_year == year)
+  if week is not None:
+    filters.append(EventSpecification.event_week == week)
+
+  data = (await run_query_in_thread(session, select(EventSpecification.event_year, EventSpecification.event_week, DTGuildEventStats.total, DTGuildEventStats.average, DTGuildEventStats.nonzero_average, DTUser.username, DTGuildEventStats.top_amount)
+                                    .select_from(DTGuildEventStats)
+                                    .join(EventSpecification)
+                                    .outerjoin(DTUser, DTUser.id == DTGuildEventStats.top_user_id)
+                                    .filter(*filters)
+                                    .order_by(EventSpecification.event_year.desc(), EventSpecification.event_week.desc())
+                                    .limit(limit))).all()
+  return [(d[0], d[1], d[2], d[3], d[4], d[5], d[6]) for d in data]
+
+async def get_guild_totals_stats(session, guild_id: int, year: Optional[int]=None, ignore_zero_participation_median: bool=False, ignore_zero_participation_average: bool=False) -> Tuple[int, float, float]:
+  """
+  Statistics of event totals of guild
+
+  :param session: Database session
+  :param guild_id: Deep Town Guild ID
+  :param year: Event year
+  :param ignore_zero_participation_median: Ignore events with zero total for calculation of median
+  :param ignore_zero_participation_average: Ignore events with zero total for calculation of average
+  :return: total, average, median
+  """
+  filters = [DTGuildEventStats.dt_guild_id == guild_id]
+  if year is not None:
+    filters.append(EventSpecification.event_year == year)
+
+  totals = (await run_query_in_thread(session, select(DTGuildEventStats.total).join(EventSpecification).filter(*filters))).scalars().all()
+  if not totals:
+    return 0, 0, 0
+
+  nonzero_totals = [total for total in totals if total > 0]
+  average = statistics.mean(totals)
+  median = statistics.median(totals)
+  if ignore_zero_participation_average:
+    average = statistics.mean(nonzero_totals) if nonzero_totals else 0
+  if ignore_zero_participation_median:
+    median = statistics.median(nonzero_totals) if nonzero_totals else 0
+  return sum(totals), average, median
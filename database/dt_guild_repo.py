@@ -1,10 +1,12 @@
-from typing import Optional, List, Tuple
-from sqlalchemy import or_, select, delete, text, func
+from typing import Optional, List, Tuple, Iterable
+from sqlalchemy import select, delete, update, func
 
 from database import run_commit_in_thread, run_query_in_thread
 from database.tables.dt_guild import DTGuild
-from database import dt_blacklist_repo
-from utils.dt_helpers import DTGuildData
+from database.tables.dt_guild_member import DTGuildMember
+from database.tables.dt_guild_event_stats import DTGuildEventStats
+from database.tables.event_participation import EventParticipation
+from database import dt_entity_counters_repo, dt_name_search_repo, dt_event_leaderboard_repo
 
 async def get_dt_guild(session, guild_id:int) -> Optional[DTGuild]:
   result = await run_query_in_thread(session, select(DTGuild).filter(DTGuild.id == guild_id))
@@ -12,48 +14,50 @@ async def get_dt_guild(session, guild_id:int) -> Optional[DTGuild]:
 
 async def search_guilds(session, search: Optional[str]=None, limit: int=25) -> List[DTGuild]:
   if search is not None:
-    if search.isnumeric():
-      result = await run_query_in_thread(session, select(DTGuild).filter(or_(DTGuild.name.ilike(f"%{search}%"), DTGuild.id == int(search))).order_by(DTGuild.name).limit(limit))
-    else:
-      result = await run_query_in_thread(session, select(DTGuild).filter(DTGuild.name.ilike(f"%{search}%")).order_by(DTGuild.name).limit(limit))
+    search_filter, order_by = await dt_name_search_repo.get_name_search_clauses(session, DTGuild.name, search, DTGuild.id)
+    result = await run_query_in_thread(session, select(DTGuild).filter(search_filter).order_by(*order_by).limit(limit))
   else:
     result = await run_query_in_thread(session, select(DTGuild).order_by(DTGuild.name).limit(limit))
   return result.scalars().all()
 
-async def create_dummy_dt_guild(session, gid: int) -> Optional[DTGuild]:
-  item = await get_dt_guild(session, gid)
-  if item is None:
-    if await dt_blacklist_repo.is_on_blacklist(session, dt_blacklist_repo.BlacklistType.GUILD, gid):
-      return None
-
-    item = DTGuild(id=gid, name="Unknown", level=-1)
-    session.add(session)
-    await run_commit_in_thread(session)
-
-  return item
+async def get_guild_data_fingerprint(session, guild_id: int) -> Optional[str]:
+  result = await run_query_in_thread(session, select(DTGuild.data_fingerprint).filter(DTGuild.id == guild_id))
+  return result.scalar_one_or_none()
 
-async def get_and_update_dt_guild(session, guild_data: DTGuildData) -> Optional[DTGuild]:
-  item = await get_dt_guild(session, guild_data.id)
-  if item is None:
-    if await dt_blacklist_repo.is_on_blacklist(session, dt_blacklist_repo.BlacklistType.GUILD, guild_data.id):
-      return None
+async def set_guild_data_fingerprint(session, guild_id: int, fingerprint: Optional[str], commit: bool=True):
+  await run_query_in_thread(session, update(DTGuild).filter(DTGuild.id == guild_id).values(data_fingerprint=fingerprint), commit=commit)
 
-    item = DTGuild(id=guild_data.id, name=guild_data.name, level=guild_data.level, is_active=guild_data.is_active)
-    session.add(item)
-    await run_commit_in_thread(session)
-  else:
-    item.update(guild_data)
-    await run_commit_in_thread(session)
+async def remove_guilds(session, guild_ids: List[int]) -> int:
+  """
+  Remove guilds and rebuild leaderboards of events they participated in so no gaps are left in ranks, commit is left to caller
 
-  return item
+  :return: Number of removed guilds
+  """
+  if not guild_ids: return 0
+
+  event_ids = (await run_query_in_thread(session, select(EventParticipation.event_id).filter(EventParticipation.dt_guild_id.in_(guild_ids)).distinct())).scalars().all()
+  # Participations and guild aggregates are removed explicitly (not only by cascade) before leaderboards are rebuilt from them
+  await run_query_in_thread(session, delete(EventParticipation).filter(EventParticipation.dt_guild_id.in_(guild_ids)))
+  await run_query_in_thread(session, delete(DTGuildEventStats).filter(DTGuildEventStats.dt_guild_id.in_(guild_ids)))
+  result = await run_query_in_thread(session, delete(DTGuild).filter(DTGuild.id.in_(guild_ids)))
+  if event_ids:
+    await dt_event_leaderboard_repo.refresh_event_leaderboards(session, event_ids)
+  return result.rowcount
 
 async def remove_guild(session, gid: int) -> bool:
-  result = await run_query_in_thread(session, delete(DTGuild).filter(DTGuild.id == gid), commit=True)
-  return result.rowcount > 0
+  removed = await remove_guilds(session, [gid])
+  await run_commit_in_thread(session)
+  dt_entity_counters_repo.invalidate_entity_counters()
+  dt_name_search_repo.name_search_cache.remove_guilds(session, [gid])
+  return removed > 0
 
 async def remove_deleted_guilds(session, guild_id_list: List[int]) -> int:
-  result = await run_query_in_thread(session, delete(DTGuild).filter(DTGuild.id.not_in(guild_id_list)), commit=True)
-  return result.rowcount
+  removed_guild_ids = (await run_query_in_thread(session, select(DTGuild.id).filter(DTGuild.id.not_in(guild_id_list)))).scalars().all()
+  await remove_guilds(session, removed_guild_ids)
+  await run_commit_in_thread(session)
+  dt_entity_counters_repo.invalidate_entity_counters()
+  dt_name_search_repo.name_search_cache.remove_guilds(session, removed_guild_ids)
+  return len(removed_guild_ids)
 
 async def is_guild_active(session, guild_id: int) -> bool:
   guild = await get_dt_guild(session, guild_id)
@@ -73,30 +77,63 @@ async def get_number_of_all_guilds(session) -> int:
   result = await run_query_in_thread(session, select(func.count(DTGuild.id)))
   return result.scalar_one()
 
-async def get_guild_level_leaderboard(session) -> List[Tuple[int, int, str, int]]:
+async def refresh_guild_level_ranks(session, commit: bool=False) -> int:
+  """
+  Rank active guilds by level in one statement, only changed ranks are written
+  Inactive guilds lose their rank
+
+  :return: Number of guilds with changed rank
+  """
+  ranking = select(DTGuild.id, func.row_number().over(order_by=(DTGuild.level.desc(), DTGuild.id)).label("level_rank")).filter(DTGuild.is_active == True).subquery()
+  result = await run_query_in_thread(session, update(DTGuild)
+                                     .filter(DTGuild.id == ranking.c.id, DTGuild.level_rank.is_distinct_from(ranking.c.level_rank))
+                                     .values(level_rank=ranking.c.level_rank))
+  removed_result = await run_query_in_thread(session, update(DTGuild).filter(DTGuild.is_active == False, DTGuild.level_rank != None).values(level_rank=None))
+
+  if commit:
+    await run_commit_in_thread(session)
+  return result.rowcount + removed_result.rowcount
+
+async def refresh_guild_member_counts(session, guild_ids: Optional[Iterable[int]]=None, commit: bool=False) -> int:
   """
-  :return: standing, guild id, guild name, guild level
+  Recount members of guilds, only changed counts are written
+
+  :param guild_ids: Ids of guilds, all guilds when None
+  :return: Number of guilds with changed member count
   """
+  if guild_ids is None:
+    # Members of all guilds are counted in one pass, guilds without members are not in the grouped counts
+    counts = select(DTGuildMember.dt_guild_id, func.count().label("member_count")).group_by(DTGuildMember.dt_guild_id).subquery()
+    result = await run_query_in_thread(session, update(DTGuild)
+                                       .filter(DTGuild.id == counts.c.dt_guild_id, DTGuild.member_count != counts.c.member_count)
+                                       .values(member_count=counts.c.member_count))
+    empty_result = await run_query_in_thread(session, update(DTGuild)
+                                             .filter(DTGuild.member_count != 0, DTGuild.id.not_in(select(DTGuildMember.dt_guild_id)))
+                                             .values(member_count=0))
+    rowcount = result.rowcount + empty_result.rowcount
+  else:
+    guild_ids = list(guild_ids)
+    if not guild_ids: return 0
+
+    member_count = select(func.count()).select_from(DTGuildMember).filter(DTGuildMember.dt_guild_id == DTGuild.id).scalar_subquery()
+    result = await run_query_in_thread(session, update(DTGuild)
+                                       .filter(DTGuild.id.in_(guild_ids), DTGuild.member_count != member_count)
+                                       .values(member_count=member_count))
+    rowcount = result.rowcount
 
-  result = await run_query_in_thread(session, text(f"""
-  SELECT position, id, name, level
-  FROM (SELECT ROW_NUMBER() OVER(ORDER BY level DESC) AS position, id, name, level
-        FROM dt_guilds
-        WHERE is_active=TRUE
-        ORDER BY level DESC) as pin
-  ORDER BY level DESC;
-  """))
+  if commit:
+    await run_commit_in_thread(session)
+  return rowcount
 
+async def get_guild_level_leaderboard(session) -> List[Tuple[int, int, str, int, int]]:
+  """
+  :return: standing, guild id, guild name, guild level, number of members
+  """
+  result = await run_query_in_thread(session, select(DTGuild.level_rank, DTGuild.id, DTGuild.name, DTGuild.level, DTGuild.member_count)
+                                     .filter(DTGuild.level_rank != None)
+                                     .order_by(DTGuild.level_rank))
   return result.all()
 
 async def get_guild_position(session, guild_id: int) -> Optional[int]:
-  result = await run_query_in_thread(session, text(f"""
-    SELECT position
-    FROM (SELECT ROW_NUMBER() OVER(ORDER BY level DESC) AS position, id, name, level
-          FROM dt_guilds
-          WHERE is_active=TRUE
-          ORDER BY level DESC) as pin
-    WHERE id={guild_id};
-    """))
-
+  result = await run_query_in_thread(session, select(DTGuild.level_rank).filter(DTGuild.id == guild_id))
   return result.scalar_one_or_none()
@@ -1,9 +1,84 @@
+import asyncio
 from typing import Optional, List, Tuple
+from rapidfuzz import process, fuzz
 from sqlalchemy import select, delete, func, literal_column
 
 from database import run_query_in_thread, run_commit_in_thread, event_participation_repo
 from database.tables.dt_items import EventItem, DTItem, ItemType, ItemSource, DTItemComponentMapping
 
+class ItemCatalogue:
+  """
+  Snapshot of item names for autocomplete and fuzzy matching of item names written by users
+  """
+  def __init__(self, items: List[Tuple[str, ItemType]]):
+    items = sorted(items)
+    self.names = [name for name, _ in items]
+    self.lower_names = [name.lower() for name in self.names]
+    self.craftable_names = [name for name, item_type in items if item_type == ItemType.CRAFTABLE]
+    self.lower_craftable_names = [name.lower() for name in self.craftable_names]
+
+  def search(self, search: Optional[str]=None, limit: int=20, craftable_only: bool=False) -> List[str]:
+    names, lower_names = (self.craftable_names, self.lower_craftable_names) if craftable_only else (self.names, self.lower_names)
+    if search is None:
+      return names[:limit]
+
+    search = search.lower()
+    return [name for name, lower_name in zip(names, lower_names) if search in lower_name][:limit]
+
+  def match(self, name: str, min_score: float=0.0) -> Optional[Tuple[str, float]]:
+    """
+    Item with name most similar to given name, similarity is normalized indel distance of lowercase names (same as Levenshtein.ratio)
+
+    :return: item name, score from 0 to 1 or None when there is no item with at least min_score
+    """
+    # Names are scored in one native call
+    result = process.extractOne(name.lower(), self.lower_names, scorer=fuzz.ratio, score_cutoff=min_score * 100)
+    if result is None: return None
+
+    _, score, index = result
+    return self.names[index], score / 100
+
+class ItemCatalogueCache:
+  """
+  Process wide item catalogue, loaded on first use and reloaded after items are changed
+  """
+  def __init__(self):
+    self.catalogue: Optional[ItemCatalogue] = None
+    # Incremented on every invalidation so load that raced with change of items doesn't store outdated catalogue
+    self.generation = 0
+    self.lock = asyncio.Lock()
+
+  async def get(self, session) -> ItemCatalogue:
+    catalogue = self.catalogue
+    if catalogue is not None:
+      return catalogue
+
+    async with self.lock:
+      while self.catalogue is None:
+        generation = self.generation
+        result = await run_query_in_thread(session, select(DTItem.name, DTItem.item_type))
+        catalogue = ItemCatalogue(result.all())
+
+        # Items changed while query was running, result can miss the change so it's loaded again
+        if generation == self.generation:
+          self.catalogue = catalogue
+      return self.catalogue
+
+  def invalidate(self):
+    self.generation += 1
+    self.catalogue = None
+
+item_catalogue_cache = ItemCatalogueCache()
+
+async def get_item_catalogue(session) -> ItemCatalogue:
+  return await item_catalogue_cache.get(session)
+
+async def match_item_name(session, name: str, min_score: float=0.0) -> Optional[Tuple[str, float]]:
+  """
+  :return: Name of item most similar to name, score from 0 to 1 or None when there is no item with at least min_score
+  """
+  return (await get_item_catalogue(session)).match(name, min_score)
+
 async def get_dt_item(session, name: str) -> Optional[DTItem]:
   result = await run_query_in_thread(session, select(DTItem).filter(DTItem.name == name))
   return result.scalar_one_or_none()
@@ -22,35 +97,26 @@ async def set_dt_item(session, name: str, item_type: ItemType, item_source: Item
   item.crafting_batch_size = crafting_batch_size if (crafting_batch_size is not None and item_type == ItemType.CRAFTABLE) else 1
 
   await run_commit_in_thread(session)
+  item_catalogue_cache.invalidate()
   return item
 
 async def remove_dt_item(session, name: str) -> bool:
   result = await run_query_in_thread(session, delete(DTItem).filter(DTItem.name == name), commit=True)
+  item_catalogue_cache.invalidate()
   return result.rowcount > 0
 
 async def search_items(session, search: Optional[str]=None, limit: int=20) -> List[str]:
-  if search is None:
-    query = select(DTItem.name).order_by(DTItem.name)
-  else:
-    query = select(DTItem.name).filter(DTItem.name.ilike(f"%{search}%")).order_by(DTItem.name)
-  result = await run_query_in_thread(session, query.limit(limit))
-  return result.scalars().all()
+  return (await get_item_catalogue(session)).search(search, limit)
 
-async def search_craftable_items(session, search: Optional[str]=None, limit: int=20) -> List[DTItem]:
-  if search is None:
-    query = select(DTItem.name).filter(DTItem.item_type == ItemType.CRAFTABLE).order_by(DTItem.name)
-  else:
-    query = select(DTItem.name).filter(DTItem.item_type == ItemType.CRAFTABLE, DTItem.name.ilike(f"%{search}%")).order_by(DTItem.name)
-  result = await run_query_in_thread(session, query.limit(limit))
-  return result.scalars().all()
+async def search_craftable_items(session, search: Optional[str]=None, limit: int=20) -> List[str]:
+  return (await get_item_catalogue(session)).search(search, limit, craftable_only=True)
 
 async def get_all_dt_items(session) -> List[DTItem]:
   result = await run_query_in_thread(session, select(DTItem).order_by(DTItem.name))
   return result.scalars().all()
 
 async def get_all_item_names(session) -> List[str]:
-  result = await run_query_in_thread(session, select(DTItem.name))
-  return result.scalars().all()
+  return list((await get_item_catalogue(session)).names)
 
 async def get_component_mapping(session, target_item_name: str, component_item_name: str) -> Optional[DTItemComponentMapping]:
   result = await run_query_in_thread(session, select(DTItemComponentMapping).filter(DTItemComponentMapping.target_item_name == target_item_name, DTItemComponentMapping.component_item_name == component_item_name))
@@ -90,11 +156,11 @@ async def set_event_item(session, event_year: int, event_week: int, item_name: s
   if (await get_dt_item(session, item_name)) is None:
     return None
 
-  event_specification = await event_participation_repo.get_or_create_event_specification(session, event_year, event_week)
+  event_id = await event_participation_repo.get_or_create_event_id(session, event_year, event_week)
 
-  item = await get_event_item(session, item_name, event_specification.event_id)
+  item = await get_event_item(session, item_name, event_id)
   if item is None:
-    item = EventItem(event_id=event_specification.event_id, item_name=item_name)
+    item = EventItem(event_id=event_id, item_name=item_name)
     session.add(item)
 
   item.base_amount = base_amount
@@ -104,10 +170,10 @@ async def set_event_item(session, event_year: int, event_week: int, item_name: s
   return item
 
 async def remove_event_participation_items(session, event_year: int, event_week: int) -> bool:
-  event_spec = await event_participation_repo.get_event_specification(session, event_year, event_week)
-  if event_spec is None: return False
+  event_id = await event_participation_repo.get_event_id(session, event_year, event_week)
+  if event_id is None: return False
 
-  result = await run_query_in_thread(session, delete(EventItem).filter(EventItem.event_id == event_spec.event_id), commit=True)
+  result = await run_query_in_thread(session, delete(EventItem).filter(EventItem.event_id == event_id), commit=True)
   return result.rowcount > 0
 
 async def get_event_items_history(session, limit: int=500) -> List[Tuple[int, int, Optional[str]]]:
@@ -119,28 +185,26 @@ async def get_event_items_history(session, limit: int=500) -> List[Tuple[int, in
   return result.all()
 
 async def get_event_item_stats(session, start_year: Optional[int]=None, end_year: Optional[int]=None) -> List[Tuple[str, int, str]]:
-  final_stats = []
-
   filters = []
   if start_year is not None:
     filters.append(event_participation_repo.EventSpecification.event_year >= start_year)
   if end_year is not None:
     filters.append(event_participation_repo.EventSpecification.event_year <= end_year)
 
-  counts_data = (await run_query_in_thread(session, select(EventItem.item_name, func.count(EventItem.item_name))
-                                                    .join(event_participation_repo.EventSpecification)
-                                                    .filter(*filters)
-                                                    .group_by(EventItem.item_name)
-                                                    .order_by(func.count(EventItem.item_name).desc(), EventItem.item_name))).all()
-  for item_name, count in counts_data:
-    last_ocurance = (await run_query_in_thread(session, select(event_participation_repo.EventSpecification.event_year, event_participation_repo.EventSpecification.event_week)
-                                                        .join(EventItem)
-                                                        .filter(EventItem.item_name == item_name, *filters)
-                                                        .order_by(event_participation_repo.EventSpecification.event_year.desc(), event_participation_repo.EventSpecification.event_week.desc()))).first()
-
-    if start_year is not None and end_year is not None and start_year == end_year:
-      final_stats.append((item_name, count, f"{last_ocurance[1]}"))
-    else:
-      final_stats.append((item_name, count, f"{last_ocurance[0]} {last_ocurance[1]}"))
-
-  return final_stats
\ No newline at end of file
+  # Number of occurrences and last occurrence of each item from one pass over event items
+  ranked_items = select(EventItem.item_name,
+                        event_participation_repo.EventSpecification.event_year,
+                        event_participation_repo.EventSpecification.event_week,
+                        func.count().over(partition_by=EventItem.item_name).label("occurrences"),
+                        func.row_number().over(partition_by=EventItem.item_name, order_by=[event_participation_repo.EventSpecification.event_year.desc(), event_participation_repo.EventSpecification.event_week.desc()]).label("recency"))\
+    .join(event_participation_repo.EventSpecification)\
+    .filter(*filters)\
+    .subquery()
+
+  data = (await run_query_in_thread(session, select(ranked_items.c.item_name, ranked_items.c.occurrences, ranked_items.c.event_year, ranked_items.c.event_week)
+                                             .filter(ranked_items.c.recency == 1)
+                                             .order_by(ranked_items.c.occurrences.desc(), ranked_items.c.item_name))).all()
+
+  if start_year is not None and end_year is not None and start_year == end_year:
+    return [(item_name, count, f"{week}") for item_name, count, _, week in data]
+  return [(item_name, count, f"{year} {week}") for item_name, count, year, week in data]
@@ -0,0 +1,154 @@
+# Running statistics of event participations of each user in guild, updated incrementally from changed participations
+
+import itertools
+from typing import Optional, List, Tuple, Iterable, Union, Any
+from sqlalchemy import select, delete, insert, and_, Select
+
+from database import run_query_in_thread, run_commit_in_thread, insert_on_conflict, event_participation_archive_repo
+from database.tables.dt_member_stats import DTMemberStats
+from database.tables.event_participation import EventParticipation, EventSpecification
+from database.tables.dt_guild import DTGuild
+from database.tables.dt_guild_member import DTGuildMember
+from database.tables.dt_user import DTUser
+from features.quantile_sketch import QuantileSketch
+
+SKETCH_RELATIVE_ACCURACY = 0.01
+INSERT_CHUNK_SIZE = 5_000
+REBUILD_GUILD_BATCH_SIZE = 500
+
+STATS_COLUMNS = ("participation_count", "nonzero_count", "total", "average", "quantile_sketch", "median", "nonzero_median", "last_event_id", "updated_at")
+
+IdsFilter = Optional[Union[Iterable[int], Select]]
+
+def get_stats_values(user_id: int, guild_id: int, sketch: QuantileSketch, total: int, last_event_id: Optional[int]) -> dict:
+  """
+  :return: Values of DTMemberStats row
+  """
+  return {"dt_user_id": user_id, "dt_guild_id": guild_id,
+          "participation_count": sketch.count, "nonzero_count": sketch.nonzero_count, "total": total, "average": total / sketch.count if sketch.count else 0,
+          "quantile_sketch": sketch.to_string(), "median": sketch.get_quantile(0.5), "nonzero_median": sketch.get_quantile(0.5, ignore_zero=True),
+          "last_event_id": last_event_id}
+
+async def apply_participation_changes(session, guild_id: int, event_id: int, changes: Iterable[Tuple[int, Optional[int], Optional[int]]]) -> int:
+  """
+  Update statistics of members by changed participations of guild in event
+
+  :param changes: Iterable[Tuple[user id, previous amount or None when participation was created, new amount or None when participation was removed]]
+  :return: Number of updated statistics
+  """
+  changes = [change for change in changes if change[1] != change[2]]
+  if not changes: return 0
+
+  current_stats = {row[0]: row for row in (await run_query_in_thread(session, select(DTMemberStats.dt_user_id, DTMemberStats.total, DTMemberStats.quantile_sketch)
+                                                                     .filter(DTMemberStats.dt_guild_id == guild_id, DTMemberStats.dt_user_id.in_([change[0] for change in changes])))).all()}
+
+  updated_stats, emptied_user_ids = [], []
+  for user_id, previous_amount, amount in changes:
+    row = current_stats.get(user_id)
+    sketch = QuantileSketch.from_string(row[2]) if row is not None else QuantileSketch(SKETCH_RELATIVE_ACCURACY)
+    total = row[1] if row is not None else 0
+
+    if previous_amount is not None:
+      sketch.remove(previous_amount)
+      total -= previous_amount
+    if amount is not None:
+      sketch.add(amount)
+      total += amount
+
+    if sketch.count == 0:
+      emptied_user_ids.append(user_id)
+    else:
+      updated_stats.append(get_stats_values(user_id, guild_id, sketch, total, event_id))
+
+  if updated_stats:
+    statement = insert_on_conflict(DTMemberStats).values(updated_stats)
+    await run_query_in_thread(session, statement.on_conflict_do_update(index_elements=[DTMemberStats.dt_user_id, DTMemberStats.dt_guild_id], set_={column: statement.excluded[column] for column in STATS_COLUMNS}))
+  if emptied_user_ids:
+    await run_query_in_thread(session, delete(DTMemberStats).filter(DTMemberStats.dt_guild_id == guild_id, DTMemberStats.dt_user_id.in_(emptied_user_ids)))
+
+  return len(changes)
+
+def _ids_filter(column, ids: IdsFilter) -> Any:
+  return column.in_(ids if isinstance(ids, Select) else list(ids))
+
+async def refresh_member_stats(session, guild_ids: IdsFilter=None, user_ids: IdsFilter=None, commit: bool=False) -> int:
+  """
+  Recalculate statistics of selected members from all their participations including archived ones, members without participations are removed
+
+  :param guild_ids: Ids of guilds or select of them, all guilds when None
+  :param user_ids: Ids of users or select of them, all users when None
+  :return: Number of written statistics
+  """
+  participation_filters, stats_filters = [], []
+  if guild_ids is not None:
+    participation_filters.append(_ids_filter(EventParticipation.dt_guild_id, guild_ids))
+    stats_filters.append(_ids_filter(DTMemberStats.dt_guild_id, guild_ids))
+  if user_ids is not None:
+    participation_filters.append(_ids_filter(EventParticipation.dt_user_id, user_ids))
+    stats_filters.append(_ids_filter(DTMemberStats.dt_user_id, user_ids))
+
+  rows = (await run_query_in_thread(session, select(EventParticipation.dt_guild_id, EventParticipation.dt_user_id, EventParticipation.amount, EventParticipation.event_id)
+                                    .join(EventSpecification)
+                                    .filter(*participation_filters)
+                                    .order_by(EventParticipation.dt_guild_id, EventParticipation.dt_user_id, EventSpecification.event_year, EventSpecification.event_week))).all()
+
+  # Archived years are older than all participations left in event_participations
+  archived_stats = await event_participation_archive_repo.get_archived_member_stats(session, guild_ids, user_ids)
+
+  stats = []
+  for (guild_id, user_id), group in itertools.groupby(rows, key=lambda row: (row[0], row[1])):
+    total, sketch, last_event_id = archived_stats.pop((guild_id, user_id), (0, QuantileSketch(SKETCH_RELATIVE_ACCURACY), None))
+    for _, _, amount, event_id in group:
+      sketch.add(amount)
+      total += amount
+      last_event_id = event_id
+    stats.append(get_stats_values(user_id, guild_id, sketch, total, last_event_id))
+
+  for (guild_id, user_id), (total, sketch, last_event_id) in archived_stats.items():
+    stats.append(get_stats_values(user_id, guild_id, sketch, total, last_event_id))
+
+  await run_query_in_thread(session, delete(DTMemberStats).filter(*stats_filters))
+  for start in range(0, len(stats), INSERT_CHUNK_SIZE):
+    await run_query_in_thread(session, insert(DTMemberStats), params=stats[start:start + INSERT_CHUNK_SIZE])
+
+  if commit:
+    await run_commit_in_thread(session)
+  return len(stats)
+
+async def have_member_stats(session) -> bool:
+  return (await run_query_in_thread(session, select(DTMemberStats.dt_guild_id).limit(1))).first() is not None
+
+async def rebuild_member_stats(session) -> int:
+  """
+  Recalculate statistics of all members, each batch of guilds is committed separately
+
+  :return: Number of written statistics
+  """
+  guild_ids = (await run_query_in_thread(session, select(DTGuild.id).order_by(DTGuild.id))).scalars().all()
+
+  written = 0
+  for start in range(0, len(guild_ids), REBUILD_GUILD_BATCH_SIZE):
+    written += await refresh_member_stats(session, guild_ids=guild_ids[start:start + REBUILD_GUILD_BATCH_SIZE], commit=True)
+  return written
+
+async def get_member_rankings(session, guild_id: int, limit: int=10, ascending: bool=False, only_current_members: bool=False, ignore_zero_participation_median: bool=False) -> List[Tuple[int, str, int, str, int, float, float]]:
+  """
+  :param session: Database session
+  :param guild_id: Deep Town Guild ID
+  :param limit: Limit of retrieved data rows
+  :param ascending: Order from lowest average participation
+  :param only_current_members: Get stats only from current members
+  :param ignore_zero_participation_median: Ignore zero participations for calculation of median
+  :return: List[Tuple[user id, username, guild id, guild name, total, average, median]] ordered by average participation
+  """
+  query = select(DTUser.id, DTUser.username, DTGuild.id, DTGuild.name, DTMemberStats.total, DTMemberStats.average, DTMemberStats.nonzero_median if ignore_zero_participation_median else DTMemberStats.median)\
+    .select_from(DTMemberStats)\
+    .join(DTUser, DTUser.id == DTMemberStats.dt_user_id)\
+    .join(DTGuild, DTGuild.id == DTMemberStats.dt_guild_id)\
+    .filter(DTMemberStats.dt_guild_id == guild_id)
+
+  if only_current_members:
+    query = query.join(DTGuildMember, and_(DTGuildMember.dt_user_id == DTMemberStats.dt_user_id, DTGuildMember.dt_guild_id == DTMemberStats.dt_guild_id))
+
+  data = (await run_query_in_thread(session, query.order_by(DTMemberStats.average if ascending else DTMemberStats.average.desc()).limit(limit))).all()
+  return [(d[0], d[1], d[2], d[3], d[4], d[5], d[6]) for d in data]
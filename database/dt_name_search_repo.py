@@ -0,0 +1,154 @@
+# In-process search indexes of Deep Town user and guild names for autocomplete, loaded on startup and kept in sync by writers of names
+# and database search clauses for them, ranked by trigram similarity on postgresql with pg_trgm
+
+import asyncio
+from typing import Optional, List, Tuple, Iterable, Any
+from sqlalchemy import select, or_, case, func, text
+
+import database
+from config import config
+from database import run_query_in_thread
+from database.tables.dt_guild import DTGuild
+from database.tables.dt_user import DTUser
+from features.name_search_index import NameSearchIndex
+from utils.logger import setup_custom_logger
+
+logger = setup_custom_logger(__name__)
+
+LOAD_CHUNK_SIZE = 50_000
+
+class NameSearchCache:
+  """
+  Process wide indexes of user and guild names, changes of names are applied when transaction that wrote them is commited so rolled back entities are not offered
+  Changes made while indexes are loading are recorded and replayed after load
+  """
+  def __init__(self):
+    self.users = NameSearchIndex()
+    self.guilds = NameSearchIndex()
+    self.loaded = False
+    self.loading_changes: Optional[List[Tuple[NameSearchIndex, int, Optional[str], bool]]] = None
+    self.lock = asyncio.Lock()
+
+  async def _load_index(self, session, index: NameSearchIndex, id_column, name_column):
+    last_id = None
+    while True:
+      statement = select(id_column, name_column).order_by(id_column).limit(LOAD_CHUNK_SIZE)
+      if last_id is not None:
+        statement = statement.filter(id_column > last_id)
+      rows = (await run_query_in_thread(session, statement)).all()
+      if not rows: break
+
+      await asyncio.to_thread(index.add_many, rows)
+      last_id = rows[-1][0]
+
+  async def load(self, session):
+    async with self.lock:
+      if self.loaded: return
+
+      self.loading_changes = []
+      try:
+        self.users.clear()
+        self.guilds.clear()
+        await self._load_index(session, self.users, DTUser.id, DTUser.username)
+        await self._load_index(session, self.guilds, DTGuild.id, DTGuild.name)
+
+        for index, entity_id, name, removed in self.loading_changes:
+          if removed:
+            index.remove(entity_id)
+          else:
+            index.set(entity_id, name)
+        self.loaded = True
+      finally:
+        self.loading_changes = None
+
+  def invalidate(self):
+    self.loaded = False
+    self.users.clear()
+    self.guilds.clear()
+
+  def _change(self, index: NameSearchIndex, entity_id: int, name: Optional[str]=None, removed: bool=False):
+    if self.loading_changes is not None:
+      self.loading_changes.append((index, entity_id, name, removed))
+    elif self.loaded:
+      if removed:
+        index.remove(entity_id)
+      else:
+        index.set(entity_id, name)
+
+  def _change_after_commit(self, session, index: NameSearchIndex, changes: List[Tuple[int, Optional[str]]], removed: bool=False):
+    def apply_changes():
+      for entity_id, name in changes:
+        self._change(index, entity_id, name, removed)
+    database.call_after_commit(session, apply_changes)
+
+  def set_users(self, session, users: Iterable[Tuple[int, Optional[str]]]):
+    self._change_after_commit(session, self.users, list(users))
+
+  def set_guilds(self, session, guilds: Iterable[Tuple[int, Optional[str]]]):
+    self._change_after_commit(session, self.guilds, list(guilds))
+
+  def remove_users(self, session, user_ids: Iterable[int]):
+    self._change_after_commit(session, self.users, [(user_id, None) for user_id in user_ids], removed=True)
+
+  def remove_guilds(self, session, guild_ids: Iterable[int]):
+    self._change_after_commit(session, self.guilds, [(guild_id, None) for guild_id in guild_ids], removed=True)
+
+name_search_cache = NameSearchCache()
+trigram_search_available: Optional[bool] = None
+
+def is_enabled() -> bool:
+  return config.data_manager.name_search_index
+
+async def load_name_search_cache(session):
+  """
+  Load indexes when they are enabled, autocomplete uses database search until they are loaded
+  """
+  if not is_enabled() or name_search_cache.loaded: return
+  await name_search_cache.load(session)
+  logger.info(f"Name search indexes loaded with {len(name_search_cache.users)} users and {len(name_search_cache.guilds)} guilds")
+
+def search_users(search: Optional[str], limit: int=25) -> Optional[List[Tuple[int, str]]]:
+  """
+  :return: List[Tuple[user id, username]] or None when indexes are not loaded
+  """
+  if not name_search_cache.loaded: return None
+  return name_search_cache.users.search(search, limit)
+
+def search_guilds(search: Optional[str], limit: int=25) -> Optional[List[Tuple[int, str]]]:
+  """
+  :return: List[Tuple[guild id, guild name]] or None when indexes are not loaded
+  """
+  if not name_search_cache.loaded: return None
+  return name_search_cache.guilds.search(search, limit)
+
+async def is_trigram_search_available(session) -> bool:
+  """
+  :return: True if database is postgresql with pg_trgm extension (migration of 18.10.2026 was applied)
+  """
+  global trigram_search_available
+  if trigram_search_available is None:
+    if database.engine.dialect.name != "postgresql":
+      trigram_search_available = False
+    else:
+      trigram_search_available = (await run_query_in_thread(session, text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"))).scalar_one()
+  return trigram_search_available
+
+async def get_name_search_clauses(session, name_column, search: str, id_column=None) -> Tuple[Any, List[Any]]:
+  """
+  Clauses of substring search in names, with pg_trgm names similar to search are matched too and results are ordered by similarity (GIN trigram indexes serve both)
+  Otherwise results are ordered by name so scan of name index stops after limit is reached
+
+  :param id_column: Column of ids, entity with id equal to numeric search is matched too (and placed first when ordered by similarity)
+  :return: filter, list of order by clauses
+  """
+  search_filter = name_column.ilike(f"%{search}%")
+  order_by = [name_column]
+  if await is_trigram_search_available(session):
+    search_filter = or_(search_filter, name_column.op("%")(search))
+    order_by.insert(0, func.similarity(name_column, search).desc())
+
+  if id_column is not None and search.isnumeric():
+    search_filter = or_(search_filter, id_column == int(search))
+    if len(order_by) > 1:
+      order_by.insert(0, case((id_column == int(search), 0), else_=1))
+  return search_filter, order_by
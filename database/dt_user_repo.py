@@ -1,12 +1,13 @@
 from typing import Optional, List
-from sqlalchemy import or_, select, delete, func
-import datetime
+from sqlalchemy import select, delete, func
 
-from config import config
 from database import run_commit_in_thread, run_query_in_thread
 from database.tables.dt_user import DTUser
-from utils.dt_helpers import DTUserData
-from database import dt_blacklist_repo
+from database.tables.event_participation import EventParticipation
+from database.tables.dt_member_stats import DTMemberStats
+from database.tables.dt_guild_member import DTGuildMember
+from database.tables.event_participation_archive import DTMemberArchivedStats
+from database import dt_guild_repo, dt_name_search_repo, dt_guild_event_stats_repo, dt_entity_counters_repo, dt_event_leaderboard_repo
 
 async def get_dt_user(session, user_id: int) -> Optional[DTUser]:
   result = await run_query_in_thread(session, select(DTUser).filter(DTUser.id == user_id))
@@ -14,46 +15,32 @@ async def get_dt_user(session, user_id: int) -> Optional[DTUser]:
 
 async def get_all_users(session, search: Optional[str]=None, limit: int=25) -> List[DTUser]:
   if search is not None:
-    if search.isnumeric():
-      result = await run_query_in_thread(session, select(DTUser).filter(or_(DTUser.username.ilike(f"%{search}%"), DTUser.id == int(search))).order_by(DTUser.username).limit(limit))
-    else:
-      result = await run_query_in_thread(session, select(DTUser).filter(DTUser.username.ilike(f"%{search}%")).order_by(DTUser.username).limit(limit))
+    search_filter, order_by = await dt_name_search_repo.get_name_search_clauses(session, DTUser.username, search, DTUser.id)
+    result = await run_query_in_thread(session, select(DTUser).filter(search_filter).order_by(*order_by).limit(limit))
   else:
     result = await run_query_in_thread(session, select(DTUser).order_by(DTUser.username).limit(limit))
   return result.scalars().all()
 
-async def create_dummy_dt_user(session, user_id: int) -> Optional[DTUser]:
-  item = await get_dt_user(session, user_id)
-  if item is None:
-    if await dt_blacklist_repo.is_on_blacklist(session, dt_blacklist_repo.BlacklistType.USER, user_id):
-      return None
-
-    item = DTUser(id=user_id, username="Unknown", level=-1, depth=-1)
-    session.add(item)
-    await run_commit_in_thread(session)
-  return item
-
 async def remove_user(session, user_id: int) -> bool:
-  result = await run_query_in_thread(session, delete(DTUser).filter(DTUser.id == user_id), commit=True)
+  participations = (await run_query_in_thread(session, select(EventParticipation.dt_guild_id, EventParticipation.event_id, EventParticipation.event_year).filter(EventParticipation.dt_user_id == user_id))).all()
+  member_guild_ids = (await run_query_in_thread(session, delete(DTGuildMember).filter(DTGuildMember.dt_user_id == user_id).returning(DTGuildMember.dt_guild_id))).scalars().all()
+
+  result = await run_query_in_thread(session, delete(DTUser).filter(DTUser.id == user_id))
+  await dt_guild_repo.refresh_guild_member_counts(session, member_guild_ids)
+  await run_query_in_thread(session, delete(DTMemberStats).filter(DTMemberStats.dt_user_id == user_id))
+  await run_query_in_thread(session, delete(DTMemberArchivedStats).filter(DTMemberArchivedStats.dt_user_id == user_id))
+  # Participations are removed explicitly (not only by cascade) before aggregates of his guilds are recalculated
+  if participations:
+    await run_query_in_thread(session, delete(EventParticipation).filter(EventParticipation.dt_user_id == user_id))
+    await dt_guild_event_stats_repo.refresh_guild_event_stats(session, guild_ids={p[0] for p in participations}, event_ids={p[1] for p in participations}, event_years={p[2] for p in participations})
+    await dt_event_leaderboard_repo.refresh_event_leaderboards(session, {p[1] for p in participations})
+  await run_commit_in_thread(session)
+  dt_entity_counters_repo.invalidate_entity_counters()
+  dt_name_search_repo.name_search_cache.remove_users(session, [user_id])
   return result.rowcount > 0
 
-async def get_and_update_dt_user(session, user_data: DTUserData) -> Optional[DTUser]:
-  item = await get_dt_user(session, user_data.id)
-  if item is None:
-    if await dt_blacklist_repo.is_on_blacklist(session, dt_blacklist_repo.BlacklistType.USER, user_data.id):
-      return None
-
-    item = DTUser.from_DTUserData(user_data)
-    session.add(item)
-    await run_commit_in_thread(session)
-  else:
-    item.update(user_data)
-    await run_commit_in_thread(session)
-
-  return item
-
 async def get_number_of_active_users(session) -> int:
-  result = await run_query_in_thread(session, select(func.count(DTUser.id)).filter((DTUser.last_online + datetime.timedelta(days=config.data_manager.activity_days_threshold)) > datetime.datetime.now(datetime.UTC).replace(tzinfo=None)))
+  result = await run_query_in_thread(session, select(func.count(DTUser.id)).filter(DTUser.last_online > dt_entity_counters_repo.get_user_activity_threshold()))
   return result.scalar_one()
 
 async def get_number_of_all_users(session) -> int:
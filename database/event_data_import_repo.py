@@ -0,0 +1,128 @@
+# Bulk import of historical event data through staging table merged with set-based statements
+
+import datetime
+from typing import Tuple, Iterable
+import pandas as pd
+from sqlalchemy import Table, Column, MetaData, Integer, String, select, update, delete, exists, and_, or_, not_, func, literal, insert
+from sqlalchemy.orm import aliased
+from sqlalchemy.schema import CreateTable, DropTable
+
+import database
+from database import run_query_in_thread, run_commit_in_thread, insert_on_conflict, dt_name_search_repo, dt_guild_event_stats_repo, dt_member_stats_repo, dt_event_leaderboard_repo
+from database.tables.event_participation import EventParticipation, EventSpecification
+from database.tables.event_participation_archive import ArchivedEventYear
+from database.tables.dt_guild import DTGuild
+from database.tables.dt_user import DTUser
+
+STAGING_CHUNK_SIZE = 10_000
+
+# Not part of database.base metadata so it's never created by init_tables, it lives only in transaction of import
+staging_table = Table("event_data_import_staging", MetaData(),
+                      Column("guild_id", database.BigIntegerType, nullable=False),
+                      Column("user_id", database.BigIntegerType, nullable=False),
+                      Column("event_year", Integer, nullable=False),
+                      Column("event_week", Integer, nullable=False),
+                      Column("amount", database.BigIntegerType, nullable=False),
+                      Column("username", String, nullable=True),
+                      prefixes=["TEMPORARY"])
+
+def prepare_event_data(dataframe: pd.DataFrame) -> pd.DataFrame:
+  """
+  Remove duplicate rows of same participation (last one wins) and keep only highest participation of user in each event,
+  lower ones are from guild the user left during event
+  """
+  dataframe = dataframe.drop_duplicates(subset=["guild_id", "user_id", "event_year", "event_week"], keep="last")
+  dataframe = dataframe.sort_values("amount", ascending=False, kind="stable").drop_duplicates(subset=["user_id", "event_year", "event_week"], keep="first")
+  return dataframe
+
+async def import_event_data(session, dataframe: pd.DataFrame, blacklisted_user_ids: Iterable[int]=()) -> Tuple[int, int]:
+  """
+  Import normalized event data (see dt_helpers.normalize_event_data) in one transaction
+  Missing guilds and users are created as placeholders, existing participations are updated
+  and new ones are created only when user has no equal or higher participation in other guild in same event
+
+  :param dataframe: Normalized event data
+  :param blacklisted_user_ids: Users that will not be created
+  :return: number of staged rows, number of created or changed participations
+  """
+  dataframe = prepare_event_data(dataframe)
+  if dataframe.empty:
+    return 0, 0
+
+  # Failed import can leave staging table on pooled connection (on sqlite its creation is not rolled back), so leftover one is reused and emptied
+  await run_query_in_thread(session, CreateTable(staging_table, if_not_exists=True))
+  await run_query_in_thread(session, delete(staging_table))
+
+  staging_data = dataframe[[column.name for column in staging_table.columns]]
+  records = staging_data.astype(object).where(staging_data.notna(), None).to_dict("records")
+  for start in range(0, len(records), STAGING_CHUNK_SIZE):
+    await run_query_in_thread(session, insert(staging_table), params=records[start:start + STAGING_CHUNK_SIZE])
+
+  # Placeholders for missing guilds and users
+  # Every INSERT ... SELECT has WHERE clause, without it sqlite can't parse following ON CONFLICT clause
+  guilds_statement = insert_on_conflict(DTGuild).from_select(["id", "name", "level"],
+                                                             select(staging_table.c.guild_id, literal("Unknown"), literal(-1))
+                                                             .where(staging_table.c.guild_id != None)
+                                                             .distinct())
+  await run_query_in_thread(session, guilds_statement.on_conflict_do_nothing())
+
+  blacklisted_user_ids = list(blacklisted_user_ids)
+  users_statement = insert_on_conflict(DTUser).from_select(["id", "username", "level", "depth"],
+                                                           select(staging_table.c.user_id, func.coalesce(func.max(staging_table.c.username), literal("Unknown")), literal(-1), literal(-1))
+                                                           .where(staging_table.c.user_id.not_in(blacklisted_user_ids))
+                                                           .group_by(staging_table.c.user_id))
+  await run_query_in_thread(session, users_statement.on_conflict_do_nothing())
+
+  await run_query_in_thread(session, update(DTUser)
+                            .where(DTUser.id.in_(select(staging_table.c.user_id).where(staging_table.c.username != None)))
+                            .values(username=select(func.max(staging_table.c.username)).where(staging_table.c.user_id == DTUser.id).scalar_subquery()))
+
+  specifications_statement = insert_on_conflict(EventSpecification).from_select(["event_year", "event_week"],
+                                                                                select(staging_table.c.event_year, staging_table.c.event_week)
+                                                                                .where(staging_table.c.event_year != None)
+                                                                                .distinct())
+  await run_query_in_thread(session, specifications_statement.on_conflict_do_nothing())
+
+  # Merge of participations
+  own_participation = aliased(EventParticipation)
+  other_participation = aliased(EventParticipation)
+  have_own_participation = exists().where(own_participation.event_year == staging_table.c.event_year,
+                                          own_participation.event_id == EventSpecification.event_id,
+                                          own_participation.dt_guild_id == staging_table.c.guild_id,
+                                          own_participation.dt_user_id == staging_table.c.user_id)
+  have_participation_elsewhere = exists().where(other_participation.event_year == staging_table.c.event_year,
+                                                other_participation.event_id == EventSpecification.event_id,
+                                                other_participation.dt_user_id == staging_table.c.user_id,
+                                                other_participation.dt_guild_id != staging_table.c.guild_id,
+                                                other_participation.amount >= staging_table.c.amount)
+
+  # Participations of archived years are not imported, year has to be restored first
+  participations_source = (select(EventSpecification.event_id, staging_table.c.guild_id, staging_table.c.user_id, staging_table.c.amount, staging_table.c.event_year, literal(datetime.datetime.now(datetime.UTC).replace(tzinfo=None)))
+                           .select_from(staging_table)
+                           .join(EventSpecification, and_(EventSpecification.event_year == staging_table.c.event_year, EventSpecification.event_week == staging_table.c.event_week))
+                           .join(DTGuild, DTGuild.id == staging_table.c.guild_id)
+                           .join(DTUser, DTUser.id == staging_table.c.user_id)
+                           .where(staging_table.c.event_year.not_in(select(ArchivedEventYear.event_year)), or_(have_own_participation, not_(have_participation_elsewhere))))
+  participations_statement = insert_on_conflict(EventParticipation).from_select(["event_id", "dt_guild_id", "dt_user_id", "amount", "event_year", "updated_at"], participations_source)
+  participations_statement = participations_statement.on_conflict_do_update(index_elements=[EventParticipation.event_id, EventParticipation.dt_guild_id, EventParticipation.dt_user_id, EventParticipation.event_year],
+                                                                            set_={"amount": participations_statement.excluded.amount, "updated_at": participations_statement.excluded.updated_at},
+                                                                            where=EventParticipation.amount != participations_statement.excluded.amount)
+  result = await run_query_in_thread(session, participations_statement)
+
+  imported_event_ids = (select(EventSpecification.event_id)
+                        .join(staging_table, and_(EventSpecification.event_year == staging_table.c.event_year, EventSpecification.event_week == staging_table.c.event_week))
+                        .distinct())
+  await dt_guild_event_stats_repo.refresh_guild_event_stats(session, guild_ids=select(staging_table.c.guild_id).distinct(), event_ids=imported_event_ids,
+                                                            event_years=dataframe["event_year"].unique().tolist())
+  await dt_member_stats_repo.refresh_member_stats(session, guild_ids=select(staging_table.c.guild_id).distinct(), user_ids=select(staging_table.c.user_id).distinct())
+  await dt_event_leaderboard_repo.refresh_event_leaderboards(session, imported_event_ids)
+
+  imported_users = (await run_query_in_thread(session, select(DTUser.id, DTUser.username).filter(DTUser.id.in_(select(staging_table.c.user_id))))).all()
+  imported_guilds = (await run_query_in_thread(session, select(DTGuild.id, DTGuild.name).filter(DTGuild.id.in_(select(staging_table.c.guild_id))))).all()
+
+  await run_query_in_thread(session, DropTable(staging_table))
+  await run_commit_in_thread(session)
+  dt_name_search_repo.name_search_cache.set_users(session, imported_users)
+  dt_name_search_repo.name_search_cache.set_guilds(session, imported_guilds)
+
+  return len(records), max(result.rowcount, 0)
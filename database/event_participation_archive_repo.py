@@ -0,0 +1,172 @@
+# Yearly partitions of event participations (optional postgresql layout) and archival of closed years to compressed files
+
+import asyncio
+import gzip
+import itertools
+import os
+from typing import Optional, List, Tuple, Dict, Iterable, Union
+import pandas as pd
+from sqlalchemy import select, delete, insert, text, exc, func, Select
+
+import database
+from database import run_query_in_thread, run_commit_in_thread, run_rollback_in_thread
+from database.tables.event_participation import EventParticipation, EventSpecification
+from database.tables.event_participation_archive import ArchivedEventYear, DTMemberArchivedStats
+from database.tables.dt_user import DTUser
+from features.quantile_sketch import QuantileSketch
+from utils.logger import setup_custom_logger
+
+logger = setup_custom_logger(__name__)
+
+# Same columns as output of dt_helpers.normalize_event_data so archive can be loaded back by event_data_import_repo
+ARCHIVE_COLUMNS = ["guild_id", "user_id", "event_year", "event_week", "amount", "username"]
+ARCHIVE_GUILD_BATCH_SIZE = 500
+INSERT_CHUNK_SIZE = 5_000
+
+IdsFilter = Optional[Union[Iterable[int], Select]]
+
+def get_partition_name(year: int) -> str:
+  return f"event_participations_{year}"
+
+async def is_partitioned(session) -> bool:
+  """
+  :return: True if event_participations is partitioned table (partition_event_participations.sql migration was applied)
+  """
+  if database.engine.dialect.name != "postgresql":
+    return False
+  return (await run_query_in_thread(session, text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid WHERE pg_class.relname = 'event_participations')"))).scalar_one()
+
+async def get_year_partitions(session) -> List[str]:
+  result = await run_query_in_thread(session, text("SELECT child.relname FROM pg_inherits JOIN pg_class parent ON parent.oid = pg_inherits.inhparent JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                                                   "WHERE parent.relname = 'event_participations' ORDER BY child.relname"))
+  return result.scalars().all()
+
+async def ensure_year_partitions(session, years: Iterable[int]) -> List[int]:
+  """
+  Create missing partitions of selected years, does nothing when table is not partitioned
+
+  :return: Years with newly created partition
+  """
+  if not await is_partitioned(session):
+    return []
+
+  existing_partitions = set(await get_year_partitions(session))
+  created_years = []
+  for year in years:
+    if get_partition_name(year) in existing_partitions: continue
+
+    try:
+      await run_query_in_thread(session, text(f"CREATE TABLE IF NOT EXISTS {get_partition_name(year)} PARTITION OF event_participations FOR VALUES FROM ({year}) TO ({year + 1})"), commit=True)
+      created_years.append(year)
+    except exc.DBAPIError:
+      # Default partition already holds rows of this year, they have to be moved manually
+      await run_rollback_in_thread(session)
+      logger.warning(f"Failed to create partition of event participations for year {year}")
+  return created_years
+
+async def get_archived_years(session) -> List[int]:
+  return (await run_query_in_thread(session, select(ArchivedEventYear.event_year).order_by(ArchivedEventYear.event_year))).scalars().all()
+
+async def get_archived_year(session, year: int) -> Optional[ArchivedEventYear]:
+  return (await run_query_in_thread(session, select(ArchivedEventYear).filter(ArchivedEventYear.event_year == year))).scalar_one_or_none()
+
+def _write_archive(path: str, chunks: List[pd.DataFrame]):
+  with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+    for index, chunk in enumerate(chunks):
+      chunk.to_csv(f, header=index == 0, index=False)
+
+async def archive_event_year(session, year: int, archive_directory: str) -> Tuple[int, str]:
+  """
+  Export participations of closed year to gzip compressed csv, keep their per member statistics and remove them from event_participations
+  Aggregates in dt_guild_event_stats are kept so all-time guild statistics don't change
+
+  :return: Number of archived participations, path of archive
+  """
+  guild_ids = (await run_query_in_thread(session, select(EventParticipation.dt_guild_id).filter(EventParticipation.event_year == year).distinct().order_by(EventParticipation.dt_guild_id))).scalars().all()
+
+  session.add(ArchivedEventYear(event_year=year, archive_path="", participations=0))
+  await run_query_in_thread(session, delete(DTMemberArchivedStats).filter(DTMemberArchivedStats.event_year == year))
+
+  chunks, number_of_participations = [], 0
+  for start in range(0, len(guild_ids), ARCHIVE_GUILD_BATCH_SIZE):
+    rows = (await run_query_in_thread(session, select(EventParticipation.dt_guild_id, EventParticipation.dt_user_id, EventParticipation.event_year, EventSpecification.event_week, EventParticipation.amount, DTUser.username, EventParticipation.event_id)
+                                      .join(EventSpecification)
+                                      .join(DTUser)
+                                      .filter(EventParticipation.event_year == year, EventParticipation.dt_guild_id.in_(guild_ids[start:start + ARCHIVE_GUILD_BATCH_SIZE]))
+                                      .order_by(EventParticipation.dt_guild_id, EventParticipation.dt_user_id, EventSpecification.event_week))).all()
+    if not rows: continue
+
+    number_of_participations += len(rows)
+    chunks.append(pd.DataFrame([row[:6] for row in rows], columns=ARCHIVE_COLUMNS))
+
+    member_stats = []
+    for (guild_id, user_id), group in itertools.groupby(rows, key=lambda row: (row[0], row[1])):
+      sketch, total, last_event_id = QuantileSketch(), 0, None
+      for row in group:
+        sketch.add(row[4])
+        total += row[4]
+        last_event_id = row[6]
+      member_stats.append({"event_year": year, "dt_user_id": user_id, "dt_guild_id": guild_id, "participation_count": sketch.count, "total": total, "quantile_sketch": sketch.to_string(), "last_event_id": last_event_id})
+
+    for chunk_start in range(0, len(member_stats), INSERT_CHUNK_SIZE):
+      await run_query_in_thread(session, insert(DTMemberArchivedStats), params=member_stats[chunk_start:chunk_start + INSERT_CHUNK_SIZE])
+
+  os.makedirs(archive_directory, exist_ok=True)
+  path = os.path.join(archive_directory, f"{get_partition_name(year)}.csv.gz")
+  await asyncio.to_thread(_write_archive, path, chunks if chunks else [pd.DataFrame(columns=ARCHIVE_COLUMNS)])
+
+  if await is_partitioned(session) and get_partition_name(year) in await get_year_partitions(session):
+    await run_query_in_thread(session, text(f"ALTER TABLE event_participations DETACH PARTITION {get_partition_name(year)}"))
+    await run_query_in_thread(session, text(f"DROP TABLE {get_partition_name(year)}"))
+  else:
+    await run_query_in_thread(session, delete(EventParticipation).filter(EventParticipation.event_year == year))
+
+  archived_year = await get_archived_year(session, year)
+  archived_year.archive_path = path
+  archived_year.participations = number_of_participations
+  await run_commit_in_thread(session)
+
+  return number_of_participations, path
+
+async def read_archive(path: str) -> pd.DataFrame:
+  return await asyncio.to_thread(pd.read_csv, path, compression="gzip")
+
+async def unregister_archived_year(session, year: int):
+  """
+  Remove archived year and its member statistics, participations of the year have to be imported back in the same transaction
+  """
+  await ensure_year_partitions(session, [year])
+  await run_query_in_thread(session, delete(DTMemberArchivedStats).filter(DTMemberArchivedStats.event_year == year))
+  await run_query_in_thread(session, delete(ArchivedEventYear).filter(ArchivedEventYear.event_year == year))
+
+async def get_archived_member_stats(session, guild_ids: IdsFilter=None, user_ids: IdsFilter=None, year: Optional[int]=None) -> Dict[Tuple[int, int], Tuple[int, QuantileSketch, Optional[int]]]:
+  """
+  :param guild_ids: Ids of guilds or select of them, all guilds when None
+  :param user_ids: Ids of users or select of them, all users when None
+  :return: (guild id, user id) -> total, merged sketch, last event id of archived participations
+  """
+  filters = []
+  if guild_ids is not None:
+    filters.append(DTMemberArchivedStats.dt_guild_id.in_(guild_ids if isinstance(guild_ids, Select) else list(guild_ids)))
+  if user_ids is not None:
+    filters.append(DTMemberArchivedStats.dt_user_id.in_(user_ids if isinstance(user_ids, Select) else list(user_ids)))
+  if year is not None:
+    filters.append(DTMemberArchivedStats.event_year == year)
+
+  rows = (await run_query_in_thread(session, select(DTMemberArchivedStats.dt_guild_id, DTMemberArchivedStats.dt_user_id, DTMemberArchivedStats.total, DTMemberArchivedStats.quantile_sketch, DTMemberArchivedStats.last_event_id)
+                                    .filter(*filters)
+                                    .order_by(DTMemberArchivedStats.event_year))).all()
+
+  archived_stats = {}
+  for guild_id, user_id, total, quantile_sketch, last_event_id in rows:
+    sketch = QuantileSketch.from_string(quantile_sketch)
+    if (guild_id, user_id) in archived_stats:
+      previous_total, previous_sketch, _ = archived_stats[(guild_id, user_id)]
+      previous_sketch.merge(sketch)
+      archived_stats[(guild_id, user_id)] = (previous_total + total, previous_sketch, last_event_id)
+    else:
+      archived_stats[(guild_id, user_id)] = (total, sketch, last_event_id)
+  return archived_stats
+
+async def have_archived_participations(session) -> bool:
+  return (await run_query_in_thread(session, select(func.count()).select_from(ArchivedEventYear))).scalar_one() > 0
@@ -1,20 +1,79 @@
+import asyncio
 import datetime
-from typing import Optional, List, Tuple, Any
-from sqlalchemy import func, and_, select, or_, text
+import hashlib
+from typing import Optional, List, Tuple, Any, Dict
+from sqlalchemy import func, and_, select, or_, delete
 
-from database import run_query_in_thread, run_commit_in_thread
+from database import run_query_in_thread, run_commit_in_thread, insert_on_conflict, call_after_commit, DEFERRED_COMMIT_KEY
 from database.tables.event_participation import EventParticipation, EventSpecification
-from database.dt_guild_member_repo import get_and_update_dt_guild_members, create_dummy_dt_guild_member
-from database.dt_member_criteria import have_participation_elsewhere
-from database import dt_user_repo, dt_guild_repo, dt_guild_member_repo
+from database.tables.dt_guild import DTGuild
+from database.tables.dt_user import DTUser
+from database.tables.dt_guild_member import DTGuildMember
+from database import dt_guild_repo, dt_name_search_repo, dt_blacklist_repo, dt_guild_event_stats_repo, dt_member_stats_repo, event_participation_archive_repo, dt_event_leaderboard_repo
+from features.quantile_sketch import QuantileSketch
 from utils import dt_helpers
 from utils.logger import setup_custom_logger
 
 logger = setup_custom_logger(__name__)
 
+USER_DATA_COLUMNS = ("username", "level", "depth", "last_online", "mines", "chem_mines", "oil_mines", "crafters", "smelters", "jewel_stations", "chem_stations", "green_houses")
+
+class EventSpecificationCache:
+  """
+  Process wide mapping of event year and week to event id, loaded on first use and extended when new events are found or created
+  Event specifications are never removed so cached ids stay valid, missing events are always looked up in database
+  """
+  def __init__(self):
+    self.event_ids: Optional[Dict[Tuple[int, int], int]] = None
+    self.lock = asyncio.Lock()
+
+  @property
+  def loaded(self) -> bool:
+    return self.event_ids is not None
+
+  async def load(self, session):
+    async with self.lock:
+      if self.event_ids is not None: return
+
+      result = await run_query_in_thread(session, select(EventSpecification.event_year, EventSpecification.event_week, EventSpecification.event_id))
+      self.event_ids = {(event_year, event_week): event_id for event_year, event_week, event_id in result.all()}
+
+  def invalidate(self):
+    self.event_ids = None
+
+  def get(self, year: int, week: int) -> Optional[int]:
+    if self.event_ids is None:
+      raise RuntimeError("Event specification cache is not loaded")
+    return self.event_ids.get((year, week))
+
+  def add(self, session, specification: EventSpecification):
+    key, event_id = (specification.event_year, specification.event_week), specification.event_id
+    if session.info.get(DEFERRED_COMMIT_KEY, False):
+      # Specification created or read inside batched transaction can still be rolled back, it's cached after the batch is commited
+      call_after_commit(session, lambda: self.set(key, event_id))
+      return
+    self.set(key, event_id)
+
+  def set(self, key: Tuple[int, int], event_id: int):
+    if self.event_ids is not None:
+      self.event_ids[key] = event_id
+
+event_specification_cache = EventSpecificationCache()
+
+async def get_event_specification_cache(session) -> EventSpecificationCache:
+  """
+  :return: Loaded event specification cache
+  """
+  if not event_specification_cache.loaded:
+    await event_specification_cache.load(session)
+  return event_specification_cache
+
 async def get_event_specification(session, year: int, week: int) -> Optional[EventSpecification]:
   result = await run_query_in_thread(session, select(EventSpecification).filter(EventSpecification.event_year == year, EventSpecification.event_week == week))
-  return result.scalar_one_or_none()
+  item = result.scalar_one_or_none()
+  if item is not None:
+    event_specification_cache.add(session, item)
+  return item
 
 async def get_or_create_event_specification(session, year: int, week: int) -> EventSpecification:
   item = await get_event_specification(session, year, week)
@@ -22,8 +81,29 @@ async def get_or_create_event_specification(session, year: int, week: int) -> Ev
     item = EventSpecification(event_year=year, event_week=week)
     session.add(item)
     await run_commit_in_thread(session)
+    event_specification_cache.add(session, item)
   return item
 
+async def get_event_id(session, year: int, week: int) -> Optional[int]:
+  """
+  :return: Id of event specification from cache or None if event doesn't exist
+  """
+  event_id = (await get_event_specification_cache(session)).get(year, week)
+  if event_id is not None:
+    return event_id
+
+  item = await get_event_specification(session, year, week)
+  return item.event_id if item is not None else None
+
+async def get_or_create_event_id(session, year: int, week: int) -> int:
+  """
+  :return: Id of event specification from cache, specification is created when it doesn't exist
+  """
+  event_id = (await get_event_specification_cache(session)).get(year, week)
+  if event_id is not None:
+    return event_id
+  return (await get_or_create_event_specification(session, year, week)).event_id
+
 async def get_event_participations(session, user_id: Optional[int] = None, guild_id: Optional[int] = None, year: Optional[int] = None, week: Optional[int] = None, order_by: Optional[List[Any]] = None, limit: int = 730) -> List[EventParticipation]:
   filters = []
   if order_by is None:
@@ -34,92 +114,18 @@ async def get_event_participations(session, user_id: Optional[int] = None, guild
   if guild_id is not None:
     filters.append(EventParticipation.dt_guild_id == guild_id)
   if year is not None:
-    filters.append(EventSpecification.event_year == year)
+    filters.append(EventParticipation.event_year == year)
   if week is not None:
     filters.append(EventSpecification.event_week == week)
 
   result = await run_query_in_thread(session, select(EventParticipation).join(EventSpecification).filter(*filters).order_by(*order_by).limit(limit))
   return result.scalars().all()
 
-async def get_event_participants_data(session, guild_id: Optional[int] = None, year: Optional[int] = None, week: Optional[int] = None, limit: int = 10, order_by: Optional[List[Any]]=None, ignore_zero_participation_median: bool=False, ignore_zero_participation_average: bool=False, only_current_members: bool=False) -> List[Tuple[int, str, int, str, int, float, float]]:
-  """
-  :param session: Database session
-  :param guild_id: Deep Town Guild ID
-  :param year: Event year
-  :param week: Event week
-  :param limit: Limit of retrieved data rows
-  :param order_by: Order in which retrieve data
-  :param ignore_zero_participation_median: Ignore zero participations for calculation of median
-  :param ignore_zero_participation_average: Ignore zero participations for calculation of average
-  :param only_current_members: Get stats only from current members
-  :return: List[Tuple[user id, username, guild id, guild name, total, average, median]]
-  """
-  filters = []
-  if guild_id is not None:
-    filters.append(EventParticipation.dt_guild_id == guild_id)
-  if year is not None:
-    filters.append(EventSpecification.event_year == year)
-  if week is not None:
-    filters.append(EventSpecification.event_week == week)
-
-  if order_by is None:
-    order_by = [func.avg(EventParticipation.amount).desc()]
-
-  data_query = select(dt_user_repo.DTUser.id, dt_user_repo.DTUser.username, dt_guild_repo.DTGuild.id, dt_guild_repo.DTGuild.name, func.sum(EventParticipation.amount), func.avg(EventParticipation.amount), func.percentile_cont(0.5).within_group(EventParticipation.amount))\
-    .join(EventSpecification) \
-    .join(dt_guild_repo.DTGuild) \
-    .join(dt_user_repo.DTUser)
-
-  if only_current_members:
-    data_query = data_query.join(dt_guild_member_repo.DTGuildMember, and_(dt_guild_member_repo.DTGuildMember.dt_user_id == EventParticipation.dt_user_id, dt_guild_member_repo.DTGuildMember.dt_guild_id == dt_guild_repo.DTGuild.id))
-
-  if filters:
-    data_query = data_query.filter(*filters)
-
-  data_query = data_query.group_by(dt_user_repo.DTUser.id, dt_user_repo.DTUser.username, dt_guild_repo.DTGuild.id, dt_guild_repo.DTGuild.name)\
-    .order_by(*order_by)\
-    .limit(limit)
-
-  # print(data_query)
-  data = (await run_query_in_thread(session, data_query)).all()
-
-  if ignore_zero_participation_average or ignore_zero_participation_median:
-    output_data = []
-
-    for user_id, username, guild_id, guild_name, total, average, median in data:
-      additional_data = (await run_query_in_thread(session, select(func.avg(EventParticipation.amount), func.percentile_cont(0.5).within_group(EventParticipation.amount))
-        .filter(*filters, EventParticipation.dt_user_id == user_id, EventParticipation.dt_guild_id == guild_id, EventParticipation.amount > 0)))\
-        .one()
-
-      ignore_zero_average, ignore_zero_median = 0, 0
-      if all(additional_data):
-        ignore_zero_average, ignore_zero_median = float(additional_data[0]), float(additional_data[1])
-
-      output_data.append((user_id, username, guild_id, guild_name, total, ignore_zero_average if ignore_zero_participation_average else average, ignore_zero_median if ignore_zero_participation_median else median))
-
-    return output_data
-  return [(d[0], d[1], d[2], d[3], d[4], d[5], d[6] if d[6] is not None else 0) for d in data]
-
 async def get_users_leaderboard(session, year: int, week: int, limit: int = 10) -> List[Tuple[str, str, int]]:
-  return ((await run_query_in_thread(session, select(dt_user_repo.DTUser.username, dt_guild_repo.DTGuild.name, func.sum(EventParticipation.amount))
-                                             .select_from(EventParticipation)
-                                             .join(EventSpecification)
-                                             .join(dt_guild_repo.DTGuild)
-                                             .join(dt_user_repo.DTUser)
-                                             .filter(EventSpecification.event_year == year, EventSpecification.event_week == week)
-                                             .group_by(dt_user_repo.DTUser.username, dt_guild_repo.DTGuild.name)
-                                             .order_by(func.sum(EventParticipation.amount).desc())
-                                             .limit(limit))).all())
+  return await dt_event_leaderboard_repo.get_users_leaderboard(session, year, week, limit)
 
 async def get_guild_leaderbord(session, year: int, week: int, limit: int = 10) -> List[Tuple[str, int, int]]:
-  return (await run_query_in_thread(session, select(dt_guild_repo.DTGuild.name, func.sum(EventParticipation.amount), func.max(EventParticipation.amount))
-                                             .select_from(EventParticipation)
-                                             .join(EventSpecification)
-                                             .join(dt_guild_repo.DTGuild)
-                                             .filter(EventSpecification.event_year == year, EventSpecification.event_week == week)
-                                             .group_by(dt_guild_repo.DTGuild.name)
-                                             .order_by(func.sum(EventParticipation.amount).desc())
-                                             .limit(limit))).all()
+  return await dt_event_leaderboard_repo.get_guild_leaderboard(session, year, week, limit)
 
 async def get_event_participation_stats(session, guild_id: Optional[int]=None, user_id: Optional[int]=None, year: Optional[int]=None, ignore_zero_participation_median: bool=False, ignore_zero_participation_average: bool=False) -> Tuple[int, float, float]:
   """
@@ -131,6 +137,8 @@ async def get_event_participation_stats(session, guild_id: Optional[int]=None, u
   :param ignore_zero_participation_average: Ignore zero participations for calculation of average
   :return: total, average, median
   """
+  if guild_id is not None and user_id is None:
+    return await dt_guild_event_stats_repo.get_guild_totals_stats(session, guild_id, year, ignore_zero_participation_median, ignore_zero_participation_average)
 
   filters = []
   if guild_id is not None:
@@ -138,7 +146,7 @@ async def get_event_participation_stats(session, guild_id: Optional[int]=None, u
   if user_id is not None:
     filters.append(EventParticipation.dt_user_id == user_id)
   if year is not None:
-    filters.append(EventSpecification.event_year == year)
+    filters.append(EventParticipation.event_year == year)
 
   distinc_amount_query = select(func.sum(EventParticipation.amount).label("amount"))\
                          .join(EventSpecification)\
@@ -146,20 +154,31 @@ async def get_event_participation_stats(session, guild_id: Optional[int]=None, u
                          .group_by(EventSpecification.event_year, EventSpecification.event_week)\
                          .subquery()
 
-  data = (await run_query_in_thread(session, select(func.sum(distinc_amount_query.c.amount), func.avg(distinc_amount_query.c.amount), func.percentile_cont(0.5).within_group(distinc_amount_query.c.amount)))).one()
+  if user_id is not None:
+    archived_stats = await event_participation_archive_repo.get_archived_member_stats(session, [guild_id] if guild_id is not None else None, [user_id], year)
+    if archived_stats:
+      # Amounts of archived years are only in sketches, live amounts are added to them
+      sketch = QuantileSketch()
+      total = 0
+      for archived_total, archived_sketch, _ in archived_stats.values():
+        sketch.merge(archived_sketch)
+        total += archived_total
+      for amount in (await run_query_in_thread(session, select(distinc_amount_query.c.amount))).scalars().all():
+        sketch.add(amount)
+        total += amount
+
+      average = (total / sketch.nonzero_count if sketch.nonzero_count else 0) if ignore_zero_participation_average else total / sketch.count
+      return total, average, sketch.get_quantile(0.5, ignore_zero=ignore_zero_participation_median)
+
+  nonzero_filter = distinc_amount_query.c.amount > 0
+  data = (await run_query_in_thread(session, select(func.sum(distinc_amount_query.c.amount), func.avg(distinc_amount_query.c.amount), func.percentile_cont(0.5).within_group(distinc_amount_query.c.amount),
+                                                    func.avg(distinc_amount_query.c.amount).filter(nonzero_filter), func.percentile_cont(0.5).within_group(distinc_amount_query.c.amount).filter(nonzero_filter)))).one()
   if data[0] is None and data[1] is None and data[2] is None:
     return 0, 0, 0
 
-  if ignore_zero_participation_average or ignore_zero_participation_median:
-    additional_data = (await run_query_in_thread(session, select(func.avg(distinc_amount_query.c.amount), func.percentile_cont(0.5).within_group(distinc_amount_query.c.amount))
-                                                          .filter(distinc_amount_query.c.amount > 0))).one()
-
-    if not all(additional_data):
-      additional_data = 0, 0
-
-    median = additional_data[1] if ignore_zero_participation_median else data[2]
-    return data[0], additional_data[0] if ignore_zero_participation_average else data[1], median if median is not None else 0
-  return data[0], data[1], data[2] if data[2] is not None else 0
+  average = (data[3] if data[3] is not None else 0) if ignore_zero_participation_average else data[1]
+  median = data[4] if ignore_zero_participation_median else data[2]
+  return data[0], average, median if median is not None else 0
 
 async def get_guild_event_participations_data(session, guild_id: int, year: Optional[int] = None, week: Optional[int] = None, limit: int = 730, ignore_zero_participation_average: bool=False) -> List[Tuple[int, int, int, float]]:
   """
@@ -171,97 +190,146 @@ async def get_guild_event_participations_data(session, guild_id: int, year: Opti
   :param ignore_zero_participation_average: Ignore zero participations for calculation of average
   :return: List[Tuple[event_year, event_week, total, average]]
   """
-  filters = [EventParticipation.dt_guild_id == guild_id]
-  if year is not None:
-    filters.append(EventSpecification.event_year == year)
-  if week is not None:
-    filters.append(EventSpecification.event_week == week)
-  if ignore_zero_participation_average:
-    filters.append(EventParticipation.amount > 0)
-
-  data = (await run_query_in_thread(session, select(EventSpecification.event_year, EventSpecification.event_week, func.sum(EventParticipation.amount), func.avg(EventParticipation.amount))
-                                             .join(EventParticipation)
-                                             .filter(*filters)
-                                             .order_by(EventSpecification.event_year.desc(), EventSpecification.event_week.desc())
-                                             .group_by(EventSpecification.event_year, EventSpecification.event_week)
-                                             .limit(limit))).all()
-  return [(d[0], d[1], d[2], d[3]) for d in data]
-
-async def get_event_participation(session, user_id: int, guild_id: int, event_year: int, event_week: int) -> Optional[EventParticipation]:
-  result = await run_query_in_thread(session, select(EventParticipation).filter(EventSpecification.event_year == event_year, EventSpecification.event_week == event_week, EventParticipation.dt_user_id == user_id, EventParticipation.dt_guild_id == guild_id).join(EventSpecification))
-  return result.scalar_one_or_none()
-
-async def remove_event_participations(session, guild_id: int, event_year: int, event_week: int, user_id_filter: Optional[List[int]] = None):
-  if user_id_filter is None or not user_id_filter:
-    await run_query_in_thread(session, text(f"""
-      DELETE
-      FROM event_participations
-      WHERE dt_guild_id = {guild_id} AND event_id IN (
-          SELECT event_id
-          FROM event_specifications
-          WHERE event_year = {event_year} AND event_week = {event_week}
-          );
-    """), commit=True)
-  else:
-    filter_string = ",".join([str(i) for i in user_id_filter])
-    await run_query_in_thread(session, text(f"""
-      DELETE
-      FROM event_participations
-      WHERE dt_guild_id = {guild_id} AND dt_user_id NOT IN ({filter_string}) AND event_id IN (
-          SELECT event_id
-          FROM event_specifications
-          WHERE event_year = {event_year} AND event_week = {event_week}
-          );
-    """), commit=True)
-
-async def get_and_update_event_participation(session, user_id: int, guild_id: int, event_year: int, event_week: int, participation_amount: int) -> Optional[EventParticipation]:
-  item = await get_event_participation(session, user_id, guild_id, event_year, event_week)
-  if item is None:
-    # If user have participation somewhere else (changed guild), skip him
-    if await have_participation_elsewhere(session, user_id, guild_id, event_year, event_week, participation_amount):
-      # logger.info(f"Skipped creation of participation in {event_year} {event_week} for user {user_id} in guild {guild_id}")
-      return None
+  data = await dt_guild_event_stats_repo.get_guild_event_history(session, guild_id, year, week, limit)
+  return [(d[0], d[1], d[2], d[4] if ignore_zero_participation_average else d[3]) for d in data]
 
-    if (await create_dummy_dt_guild_member(session, user_id, guild_id)) is None:
-      return None
+def get_guild_data_fingerprint(guild_data: dt_helpers.DTGuildData, event_year: int, event_week: int) -> Optional[str]:
+  """
+  Fingerprint of guild data in context of event, same payload in different event or with changed activity state still needs update
 
-    specification = await get_or_create_event_specification(session, event_year, event_week)
+  :return: Fingerprint or None if guild data have no payload hash
+  """
+  if guild_data.payload_hash is None:
+    return None
+  return hashlib.sha256(f"{guild_data.payload_hash}:{event_year}:{event_week}:{guild_data.is_active}".encode("utf-8")).hexdigest()
 
-    item = EventParticipation(event_id=specification.event_id, dt_guild_id=guild_id, dt_user_id=user_id, amount=participation_amount)
-    session.add(item)
-    await run_commit_in_thread(session)
-  else:
-    item.amount = participation_amount
+async def generate_or_update_event_participations_if_changed(session, guild_data: dt_helpers.DTGuildData) -> bool:
+  """
+  :return: False if guild data were same as in last update and were skipped
+  """
+  event_year, event_week = dt_helpers.get_event_index(datetime.datetime.now(datetime.UTC).replace(tzinfo=None))
+  fingerprint = get_guild_data_fingerprint(guild_data, event_year, event_week)
+  if fingerprint is not None and fingerprint == (await dt_guild_repo.get_guild_data_fingerprint(session, guild_data.id)):
+    return False
 
-  return item
+  await generate_or_update_event_participations(session, guild_data)
+  return True
+
+async def get_max_participation_amounts_elsewhere(session, guild_id: int, user_ids: List[int], event_year: int, event_week: int) -> Dict[int, int]:
+  """
+  :return: Highest participation amount of each user in event in guilds other than selected one
+  """
+  if not user_ids: return {}
+
+  result = await run_query_in_thread(session, select(EventParticipation.dt_user_id, func.max(EventParticipation.amount))
+                                     .join(EventSpecification)
+                                     .filter(EventParticipation.dt_guild_id != guild_id,
+                                             EventParticipation.dt_user_id.in_(user_ids),
+                                             EventParticipation.event_year == event_year,
+                                             EventSpecification.event_week == event_week)
+                                     .group_by(EventParticipation.dt_user_id))
+  return {user_id: amount for user_id, amount in result.all()}
+
+async def generate_or_update_event_participations(session, guild_data: dt_helpers.DTGuildData) -> Optional[int]:
+  """
+  Apply whole guild snapshot with set based statements (semantics of per player member and participation generation are kept)
 
-async def generate_or_update_event_participations(session, guild_data: dt_helpers.DTGuildData) -> Optional[List[EventParticipation]]:
+  :return: Number of written participations or None if guild is blacklisted
+  """
   event_year, event_week = dt_helpers.get_event_index(datetime.datetime.now(datetime.UTC).replace(tzinfo=None))
   prev_event_year, prev_event_week = dt_helpers.get_event_index(datetime.datetime.now(datetime.UTC).replace(tzinfo=None) - datetime.timedelta(days=7))
 
-  if (await get_and_update_dt_guild_members(session, guild_data, event_year, event_week)) is None:
-    return None
+  # Last occurrence of player wins same as when players were applied one by one
+  players = list({player_data.id: player_data for player_data in guild_data.players}.values())
+  player_ids = [player_data.id for player_data in players]
+
+  # Guild, its row is locked so concurrent writers of same guild are serialized and don't apply same participation changes to member statistics twice
+  # (writers of new guild are serialized by conflict of its insert)
+  if (await run_query_in_thread(session, select(DTGuild.id).filter(DTGuild.id == guild_data.id).with_for_update())).scalar_one_or_none() is None:
+    if await dt_blacklist_repo.is_on_blacklist(session, dt_blacklist_repo.BlacklistType.GUILD, guild_data.id):
+      return None
+
+  guild_statement = insert_on_conflict(DTGuild).values(id=guild_data.id, name=guild_data.name, level=guild_data.level, is_active=guild_data.is_active)
+  await run_query_in_thread(session, guild_statement.on_conflict_do_update(index_elements=[DTGuild.id], set_={"name": guild_statement.excluded.name, "level": guild_statement.excluded.level, "is_active": guild_statement.excluded.is_active}))
+  dt_name_search_repo.name_search_cache.set_guilds(session, [(guild_data.id, guild_data.name)])
+
+  # Users, new blacklisted users are not created
+  existing_user_ids = set((await run_query_in_thread(session, select(DTUser.id).filter(DTUser.id.in_(player_ids)))).scalars().all()) if player_ids else set()
+  blacklisted_user_ids = await dt_blacklist_repo.filter_blacklisted_ids(session, dt_blacklist_repo.BlacklistType.USER, [user_id for user_id in player_ids if user_id not in existing_user_ids])
+  known_players = [player_data for player_data in players if player_data.id not in blacklisted_user_ids]
 
-  participation_amounts = [p.last_event_contribution for p in guild_data.players]
-  prev_event_participations = await get_event_participations(session, guild_id=guild_data.id, year=prev_event_year, week=prev_event_week)
-  prev_participation_amounts = [p.amount for p in prev_event_participations]
+  if known_players:
+    user_statement = insert_on_conflict(DTUser).values([{"id": player_data.id, "username": player_data.name, "level": player_data.level, "depth": player_data.depth, "last_online": player_data.last_online,
+                                                         "mines": player_data.mines, "chem_mines": player_data.chem_mines, "oil_mines": player_data.oil_mines, "crafters": player_data.crafters,
+                                                         "smelters": player_data.smelters, "jewel_stations": player_data.jewel_stations, "chem_stations": player_data.chem_stations, "green_houses": player_data.green_houses}
+                                                        for player_data in known_players])
+    await run_query_in_thread(session, user_statement.on_conflict_do_update(index_elements=[DTUser.id], set_={column: user_statement.excluded[column] for column in USER_DATA_COLUMNS}))
+    dt_name_search_repo.name_search_cache.set_users(session, [(player_data.id, player_data.name) for player_data in known_players])
+
+  # Memberships, new member is created only when he have participation elsewhere and rest of members not in snapshot are removed
+  member_ids = set((await run_query_in_thread(session, select(DTGuildMember.dt_user_id).filter(DTGuildMember.dt_guild_id == guild_data.id))).scalars().all())
+  max_amounts_elsewhere = await get_max_participation_amounts_elsewhere(session, guild_data.id, [player_data.id for player_data in known_players], event_year, event_week)
+
+  def have_participation_elsewhere_in_event(user_id: int, amount: int) -> bool:
+    return user_id in max_amounts_elsewhere and max_amounts_elsewhere[user_id] >= amount
+
+  new_member_ids = [player_data.id for player_data in known_players if player_data.id not in member_ids and have_participation_elsewhere_in_event(player_data.id, player_data.last_event_contribution)]
+  member_ids = {player_data.id for player_data in known_players if player_data.id in member_ids} | set(new_member_ids)
+
+  if new_member_ids:
+    await run_query_in_thread(session, insert_on_conflict(DTGuildMember).values([{"dt_user_id": user_id, "dt_guild_id": guild_data.id} for user_id in new_member_ids]).on_conflict_do_nothing())
+  await run_query_in_thread(session, delete(DTGuildMember).filter(DTGuildMember.dt_guild_id == guild_data.id, DTGuildMember.dt_user_id.not_in(member_ids)))
+  changed_member_guild_ids = {guild_data.id}
+
+  # Participations
+  prev_sum, prev_count = (await run_query_in_thread(session, select(func.coalesce(func.sum(EventParticipation.amount), 0), func.count())
+                                                    .join(EventSpecification)
+                                                    .filter(EventParticipation.dt_guild_id == guild_data.id, EventParticipation.event_year == prev_event_year, EventSpecification.event_week == prev_event_week))).one()
 
   new_event_started = True
-  if prev_participation_amounts and participation_amounts and \
-      sum(participation_amounts) == sum(prev_participation_amounts):
+  if prev_count > 0 and players and sum(player_data.last_event_contribution for player_data in players) == prev_sum:
     new_event_started = False
 
-  # Remove all participations from users that were currently not in guild
-  await remove_event_participations(session, guild_data.id, event_year, event_week, [player_data.id for player_data in guild_data.players])
+  amounts = {player_data.id: (player_data.last_event_contribution if new_event_started else 0) for player_data in players}
+
+  event_id = await get_event_id(session, event_year, event_week)
+  previous_amounts = {}
+  if event_id is not None:
+    previous_amounts = {user_id: amount for user_id, amount in (await run_query_in_thread(session, select(EventParticipation.dt_user_id, EventParticipation.amount).filter(EventParticipation.event_year == event_year, EventParticipation.event_id == event_id, EventParticipation.dt_guild_id == guild_data.id))).all()}
+
+    # Remove all participations from users that were currently not in guild
+    if any(user_id not in amounts for user_id in previous_amounts):
+      await run_query_in_thread(session, delete(EventParticipation).filter(EventParticipation.event_year == event_year, EventParticipation.event_id == event_id, EventParticipation.dt_guild_id == guild_data.id, EventParticipation.dt_user_id.not_in(player_ids)))
+  participant_ids = {user_id for user_id in previous_amounts if user_id in amounts}
+
+  # New participation is skipped when user have participation elsewhere (changed guild), otherwise he is moved to this guild
+  new_participant_ids = [player_data.id for player_data in known_players if player_data.id not in participant_ids and not have_participation_elsewhere_in_event(player_data.id, amounts[player_data.id])]
+  moved_user_ids = [user_id for user_id in new_participant_ids if user_id not in member_ids]
+  if moved_user_ids:
+    changed_member_guild_ids.update((await run_query_in_thread(session, delete(DTGuildMember).filter(DTGuildMember.dt_guild_id != guild_data.id, DTGuildMember.dt_user_id.in_(moved_user_ids)).returning(DTGuildMember.dt_guild_id))).scalars().all())
+    await run_query_in_thread(session, insert_on_conflict(DTGuildMember).values([{"dt_user_id": user_id, "dt_guild_id": guild_data.id} for user_id in moved_user_ids]).on_conflict_do_nothing())
+  await dt_guild_repo.refresh_guild_member_counts(session, changed_member_guild_ids)
+
+  written_user_ids = [user_id for user_id in player_ids if user_id in participant_ids] + new_participant_ids
+  if written_user_ids:
+    if event_id is None:
+      event_id = await get_or_create_event_id(session, event_year, event_week)
+
+    # Unchanged participations are not touched so their update time is kept
+    participation_statement = insert_on_conflict(EventParticipation).values([{"event_id": event_id, "event_year": event_year, "dt_guild_id": guild_data.id, "dt_user_id": user_id, "amount": amounts[user_id]} for user_id in written_user_ids])
+    await run_query_in_thread(session, participation_statement.on_conflict_do_update(index_elements=[EventParticipation.event_id, EventParticipation.dt_guild_id, EventParticipation.dt_user_id, EventParticipation.event_year],
+                                                                                     set_={"amount": participation_statement.excluded.amount, "updated_at": participation_statement.excluded.updated_at},
+                                                                                     where=EventParticipation.amount != participation_statement.excluded.amount))
+
+  if event_id is not None:
+    participation_changes = [(user_id, amount, None) for user_id, amount in previous_amounts.items() if user_id not in amounts] + [(user_id, previous_amounts.get(user_id), amounts[user_id]) for user_id in written_user_ids]
+    await dt_member_stats_repo.apply_participation_changes(session, guild_data.id, event_id, participation_changes)
+    await dt_guild_event_stats_repo.refresh_guild_event_stats(session, guild_ids=[guild_data.id], event_ids=[event_id], event_years=[event_year])
 
-  participations = []
-  for player_data in guild_data.players:
-    participation = await get_and_update_event_participation(session, player_data.id, guild_data.id, event_year, event_week, player_data.last_event_contribution if new_event_started else 0)
-    if participation is not None:
-      participations.append(participation)
+  await dt_guild_repo.set_guild_data_fingerprint(session, guild_data.id, get_guild_data_fingerprint(guild_data, event_year, event_week), commit=False)
 
   await run_commit_in_thread(session)
-  return participations
+  return len(written_user_ids)
 
 async def search_event_identificator(session, search: Optional[str]=None, limit: int=25) -> List[Tuple[int, int]]:
   """
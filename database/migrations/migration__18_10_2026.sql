@@ -0,0 +1,96 @@
+alter table public.dt_guilds
+    add column if not exists data_fingerprint varchar;
+
+-- Tables dt_guild_event_stats and dt_member_stats are created on startup and filled from event_participations by backfill task of data downloader when empty
+
+-- Indexes of event participation hot paths, built concurrently so ingest is not blocked (statements have to run outside of transaction block)
+-- Lookups by guild and event (ingest, guild event reports, aggregate refresh)
+create index concurrently if not exists ix_event_participations_dt_guild_id_event_id
+    on public.event_participations (dt_guild_id, event_id, dt_user_id) include (amount);
+
+-- Lookups by user across events (user profile, participation in other guilds)
+create index concurrently if not exists ix_event_participations_dt_user_id_event_id
+    on public.event_participations (dt_user_id, event_id) include (dt_guild_id, amount);
+
+-- Year and week lookups are served by unique index of event_specifications (event_year, event_week)
+-- Single column indexes on amount and updated_at are not used by any query, dropping them saves two index insertions on every changed participation
+-- Updates of amount still can't be HOT (in place without new index entries) because both indexes above include it for index only scans, these matter more
+drop index concurrently if exists public.ix_event_participations_amount;
+drop index concurrently if exists public.ix_event_participations_updated_at;
+
+-- Copy of event year in participations, partition key of optional yearly partitioned layout (partition_event_participations.sql)
+-- Statements are split so none of them holds lock of whole table for duration of rewrite or scan (run them outside of transaction block)
+-- Bot has to stay stopped until its new version is started, participations inserted by old version after backfill would fail validation
+alter table public.event_participations
+    add column if not exists event_year integer;
+
+-- Backfill committed per event to keep transactions short
+DO $$
+DECLARE
+    specification record;
+BEGIN
+    FOR specification IN SELECT event_id, event_year FROM public.event_specifications ORDER BY event_id LOOP
+        UPDATE public.event_participations SET event_year = specification.event_year
+            WHERE event_id = specification.event_id AND event_year IS NULL;
+        COMMIT;
+    END LOOP;
+END $$;
+
+-- Not null is proven by validated check constraint so setting it doesn't scan table under exclusive lock
+alter table public.event_participations
+    add constraint event_participations_event_year_not_null check (event_year is not null) not valid;
+alter table public.event_participations
+    validate constraint event_participations_event_year_not_null;
+alter table public.event_participations
+    alter column event_year set not null;
+alter table public.event_participations
+    drop constraint event_participations_event_year_not_null;
+
+-- Year of participation can't differ from year of its event
+alter table public.event_specifications
+    add constraint event_specifications_event_id_event_year_key unique (event_id, event_year);
+
+alter table public.event_participations
+    add constraint event_participations_event_id_event_year_fkey foreign key (event_id, event_year)
+        references public.event_specifications (event_id, event_year) on update cascade on delete cascade not valid;
+alter table public.event_participations
+    validate constraint event_participations_event_id_event_year_fkey;
+alter table public.event_participations
+    drop constraint event_participations_event_id_fkey;
+
+-- Primary key of partitioned table has to contain partition key, index is built concurrently and then only swapped
+create unique index concurrently if not exists event_participations_pkey_new
+    on public.event_participations (event_id, dt_guild_id, dt_user_id, event_year);
+
+alter table public.event_participations
+    drop constraint event_participations_pkey,
+    add constraint event_participations_pkey primary key using index event_participations_pkey_new;
+
+-- Tables archived_event_years and dt_member_archived_stats are created on startup
+
+-- Active users are counted by range of last online time
+create index concurrently if not exists ix_dt_users_last_online
+    on public.dt_users (last_online);
+
+-- Tables dt_event_user_ranks and dt_event_guild_ranks are created on startup, leaderboards of past events are built on first read
+
+-- Denormalized level rank and member count of guilds, filled on startup of data downloader
+alter table public.dt_guilds
+    add column if not exists level_rank integer,
+    add column if not exists member_count integer not null default 0;
+
+create index concurrently if not exists ix_dt_guilds_level_rank
+    on public.dt_guilds (level_rank);
+
+-- Memberships are looked up and counted by guild
+create index concurrently if not exists ix_dt_guild_members_dt_guild_id
+    on public.dt_guild_members (dt_guild_id);
+
+-- Trigram indexes of names for substring and similarity search (search_guilds, get_all_users, search_tracked_guilds), search falls back to ILIKE without pg_trgm
+create extension if not exists pg_trgm;
+
+create index concurrently if not exists ix_dt_guilds_name_trgm
+    on public.dt_guilds using gin (name gin_trgm_ops);
+
+create index concurrently if not exists ix_dt_users_username_trgm
+    on public.dt_users using gin (username gin_trgm_ops);
@@ -0,0 +1,41 @@
+-- Optional, convert event_participations to table partitioned by event year (requires migration__18_10_2026.sql)
+-- Partitions of current and next year are then created by data downloader, closed years can be archived by `/data_update archive_year`
+-- Table is rewritten, run it during maintenance window with bot stopped
+BEGIN;
+create table public.event_participations_partitioned
+(
+    event_id    bigint    not null,
+    dt_guild_id bigint    not null constraint event_participations_dt_guild_id_fkey references public.dt_guilds (id) on update cascade on delete cascade,
+    dt_user_id  bigint    not null constraint event_participations_dt_user_id_fkey references public.dt_users (id) on update cascade on delete cascade,
+    event_year  integer   not null,
+    updated_at  timestamp not null,
+    amount      bigint    not null,
+    primary key (event_id, dt_guild_id, dt_user_id, event_year),
+    constraint event_participations_event_id_event_year_fkey foreign key (event_id, event_year) references public.event_specifications (event_id, event_year) on update cascade on delete cascade
+) partition by range (event_year);
+
+-- Partition of every year with participations, rows of years without partition end in default partition
+DO $$
+DECLARE
+    year integer;
+BEGIN
+    FOR year IN SELECT DISTINCT event_year FROM public.event_participations ORDER BY event_year LOOP
+        EXECUTE format('create table public.event_participations_%s partition of public.event_participations_partitioned for values from (%s) to (%s)', year, year, year + 1);
+    END LOOP;
+END $$;
+
+create table public.event_participations_default
+    partition of public.event_participations_partitioned default;
+
+insert into public.event_participations_partitioned (event_id, dt_guild_id, dt_user_id, event_year, updated_at, amount)
+    select event_id, dt_guild_id, dt_user_id, event_year, updated_at, amount from public.event_participations;
+
+drop table public.event_participations;
+alter table public.event_participations_partitioned rename to event_participations;
+alter index public.event_participations_partitioned_pkey rename to event_participations_pkey;
+
+create index ix_event_participations_dt_guild_id_event_id
+    on public.event_participations (dt_guild_id, event_id, dt_user_id) include (amount);
+create index ix_event_participations_dt_user_id_event_id
+    on public.event_participations (dt_user_id, event_id) include (dt_guild_id, amount);
+END;
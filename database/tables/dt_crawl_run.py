@@ -0,0 +1,46 @@
+import enum
+import datetime
+from sqlalchemy import Column, ForeignKey, Integer, String, DateTime, Enum, Index
+from sqlalchemy.orm import relationship
+
+import database
+
+class CrawlRunKind(enum.Enum):
+  SCHEDULED = 1
+  ALL_GUILDS = 2
+  TRACKED_GUILDS = 3
+
+  def __str__(self):
+    return self.name
+
+class CrawlItemStatus(enum.Enum):
+  PENDING = 1
+  DONE = 2
+  FAILED = 3
+
+  def __str__(self):
+    return self.name
+
+class DTCrawlRun(database.base):
+  __tablename__ = "dt_crawl_runs"
+
+  id = Column(Integer, primary_key=True, autoincrement=True)
+  kind = Column(Enum(CrawlRunKind), index=True, nullable=False)
+  started_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+  finished_at = Column(DateTime, nullable=True, index=True)
+
+  items = relationship("DTCrawlRunItem", uselist=True, back_populates="run", cascade="all, delete-orphan", passive_deletes=True)
+
+class DTCrawlRunItem(database.base):
+  __tablename__ = "dt_crawl_run_items"
+  __table_args__ = (Index("ix_dt_crawl_run_items_run_id_status", "run_id", "status"),)
+
+  run_id = Column(Integer, ForeignKey("dt_crawl_runs.id", ondelete="CASCADE"), primary_key=True)
+  guild_id = Column(database.BigIntegerType, primary_key=True)
+
+  status = Column(Enum(CrawlItemStatus), default=CrawlItemStatus.PENDING, nullable=False)
+  attempts = Column(Integer, default=0, nullable=False)
+  last_error = Column(String, nullable=True)
+  updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, nullable=False)
+
+  run = relationship("DTCrawlRun", uselist=False, back_populates="items")
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, ForeignKey, Index
+
+import database
+
+class DTEventUserRank(database.base):
+  """
+  Snapshot of users leaderboard of event, rebuilt while event is running and kept after it ends
+  """
+  __tablename__ = "dt_event_user_ranks"
+  __table_args__ = (Index("ix_dt_event_user_ranks_event_id_dt_user_id", "event_id", "dt_user_id"),)
+
+  event_id = Column(database.BigIntegerType, ForeignKey("event_specifications.event_id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+  rank = Column(database.BigIntegerType, primary_key=True, autoincrement=False)
+
+  dt_user_id = Column(database.BigIntegerType, ForeignKey("dt_users.id", ondelete="CASCADE", onupdate="CASCADE"), nullable=False)
+  dt_guild_id = Column(database.BigIntegerType, ForeignKey("dt_guilds.id", ondelete="CASCADE", onupdate="CASCADE"), nullable=False)
+  total = Column(database.BigIntegerType, default=0, nullable=False)
+
+class DTEventGuildRank(database.base):
+  """
+  Snapshot of guilds leaderboard of event, rebuilt while event is running and kept after it ends
+  """
+  __tablename__ = "dt_event_guild_ranks"
+  __table_args__ = (Index("ix_dt_event_guild_ranks_event_id_dt_guild_id", "event_id", "dt_guild_id"),)
+
+  event_id = Column(database.BigIntegerType, ForeignKey("event_specifications.event_id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+  rank = Column(database.BigIntegerType, primary_key=True, autoincrement=False)
+
+  dt_guild_id = Column(database.BigIntegerType, ForeignKey("dt_guilds.id", ondelete="CASCADE", onupdate="CASCADE"), nullable=False)
+  total = Column(database.BigIntegerType, default=0, nullable=False)
+  top_amount = Column(database.BigIntegerType, default=0, nullable=False)
@@ -14,6 +14,13 @@ class DTGuild(database.base):
 
   is_active = Column(Boolean, index=True, default=True)
 
+  # Denormalized for profile and leaderboard, level_rank is None for inactive guilds
+  level_rank = Column(Integer, nullable=True, index=True)
+  member_count = Column(Integer, default=0, nullable=False)
+
+  # Fingerprint of last ingested API payload, used to skip unchanged guilds
+  data_fingerprint = Column(String, nullable=True)
+
   members = relationship("DTGuildMember", uselist=True, back_populates="guild")
   event_participations = relationship("EventParticipation", uselist=True, back_populates="dt_guild")
 
@@ -0,0 +1,32 @@
+import datetime
+from sqlalchemy import Column, ForeignKey, Integer, Float, DateTime, Index
+from sqlalchemy.orm import relationship
+
+import database
+
+class DTGuildEventStats(database.base):
+  """
+  Aggregates of event participations of guild in one event, maintained together with participations
+  """
+  __tablename__ = "dt_guild_event_stats"
+  __table_args__ = (Index("ix_dt_guild_event_stats_event_id_total", "event_id", "total"),)
+
+  dt_guild_id = Column(database.BigIntegerType, ForeignKey("dt_guilds.id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+  event_id = Column(database.BigIntegerType, ForeignKey("event_specifications.event_id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+
+  total = Column(database.BigIntegerType, default=0, nullable=False)
+  average = Column(Float, default=0, nullable=False)
+  median = Column(Float, default=0, nullable=False)
+  nonzero_average = Column(Float, default=0, nullable=False)
+  nonzero_median = Column(Float, default=0, nullable=False)
+  nonzero_count = Column(Integer, default=0, nullable=False)
+  member_count = Column(Integer, default=0, nullable=False)
+
+  top_user_id = Column(database.BigIntegerType, ForeignKey("dt_users.id", ondelete="SET NULL", onupdate="CASCADE"), nullable=True)
+  top_amount = Column(database.BigIntegerType, default=0, nullable=False)
+
+  updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, nullable=False)
+
+  event_specification = relationship("EventSpecification", uselist=False)
+  dt_guild = relationship("DTGuild", uselist=False)
+  top_user = relationship("DTUser", uselist=False)
@@ -7,7 +7,7 @@ class DTGuildMember(database.base):
   __tablename__ = "dt_guild_members"
 
   dt_user_id = Column(database.BigIntegerType, ForeignKey("dt_users.id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
-  dt_guild_id = Column(database.BigIntegerType, ForeignKey("dt_guilds.id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+  dt_guild_id = Column(database.BigIntegerType, ForeignKey("dt_guilds.id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True, index=True)
   created_at = Column(DateTime, nullable=False, default=func.now())
 
   user = relationship("DTUser", uselist=False, back_populates="members")
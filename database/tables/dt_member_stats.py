@@ -0,0 +1,31 @@
+import datetime
+from sqlalchemy import Column, ForeignKey, Integer, Float, String, DateTime, Index
+from sqlalchemy.orm import relationship
+
+import database
+
+class DTMemberStats(database.base):
+  """
+  Running statistics of all event participations of user in guild, maintained together with participations
+  """
+  __tablename__ = "dt_member_stats"
+  __table_args__ = (Index("ix_dt_member_stats_dt_guild_id_average", "dt_guild_id", "average"),)
+
+  dt_user_id = Column(database.BigIntegerType, ForeignKey("dt_users.id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+  dt_guild_id = Column(database.BigIntegerType, ForeignKey("dt_guilds.id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+
+  participation_count = Column(Integer, default=0, nullable=False)
+  nonzero_count = Column(Integer, default=0, nullable=False)
+  total = Column(database.BigIntegerType, default=0, nullable=False)
+  average = Column(Float, default=0, nullable=False)
+
+  # Serialized features.quantile_sketch.QuantileSketch of amounts, medians are derived from it on every write
+  quantile_sketch = Column(String, nullable=False)
+  median = Column(Float, default=0, nullable=False)
+  nonzero_median = Column(Float, default=0, nullable=False)
+
+  last_event_id = Column(database.BigIntegerType, ForeignKey("event_specifications.event_id", ondelete="SET NULL", onupdate="CASCADE"), nullable=True)
+  updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, nullable=False)
+
+  dt_user = relationship("DTUser", uselist=False)
+  dt_guild = relationship("DTGuild", uselist=False)
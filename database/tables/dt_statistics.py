@@ -2,7 +2,7 @@ from sqlalchemy import Column, Integer, Date
 import datetime
 
 import database
-from database import dt_user_repo, dt_guild_repo, run_commit_in_thread
+from database import dt_entity_counters_repo, run_commit_in_thread
 
 class DTActiveEntitiesData(database.base):
   __tablename__ = "dt_active_entities_statistics"
@@ -15,18 +15,20 @@ class DTActiveEntitiesData(database.base):
 
   @classmethod
   async def generate(cls, session, today: datetime.date):
+    counters = await dt_entity_counters_repo.get_entity_counters(session, recount=True)
     item = cls(date=today,
-               active_guilds=(await dt_guild_repo.get_number_of_active_guilds(session)),
-               active_users=(await dt_user_repo.get_number_of_active_users(session)),
-               all_guilds=(await dt_guild_repo.get_number_of_all_guilds(session)),
-               all_users=(await dt_user_repo.get_number_of_all_users(session)))
+               active_guilds=counters.active_guilds,
+               active_users=counters.active_users,
+               all_guilds=counters.all_guilds,
+               all_users=counters.all_users)
     session.add(item)
     await run_commit_in_thread(session)
     return item
 
   async def update(self, session):
-    self.active_guilds = (await dt_guild_repo.get_number_of_active_guilds(session))
-    self.active_users = (await dt_user_repo.get_number_of_active_users(session))
-    self.all_guilds = (await dt_guild_repo.get_number_of_all_guilds(session))
-    self.all_users = (await dt_user_repo.get_number_of_all_users(session))
+    counters = await dt_entity_counters_repo.get_entity_counters(session, recount=True)
+    self.active_guilds = counters.active_guilds
+    self.active_users = counters.active_users
+    self.all_guilds = counters.all_guilds
+    self.all_users = counters.all_users
     await run_commit_in_thread(session)
@@ -14,7 +14,7 @@ class DTUser(database.base):
   username = Column(String, index=True, default="*Unknown*")
   level = Column(Integer, default=-1)
   depth = Column(Integer, default=-1)
-  last_online = Column(DateTime, nullable=True)
+  last_online = Column(DateTime, nullable=True, index=True)
   created_at = Column(DateTime, nullable=False, default=func.now())
 
   mines = Column(Integer, default=0)
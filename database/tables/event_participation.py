@@ -1,5 +1,5 @@
 import datetime
-from sqlalchemy import Column, ForeignKey, Integer, DateTime, UniqueConstraint
+from sqlalchemy import Column, ForeignKey, ForeignKeyConstraint, Integer, DateTime, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 
 import database
@@ -7,7 +7,9 @@ from utils.dt_helpers import DTUserData
 
 class EventSpecification(database.base):
   __tablename__ = "event_specifications"
-  __table_args__ = (UniqueConstraint('event_year', 'event_week'),)
+  # Pair of id and year is referenced by participations so their copy of year can't differ
+  __table_args__ = (UniqueConstraint('event_year', 'event_week'),
+                    UniqueConstraint('event_id', 'event_year'))
 
   event_id = Column(database.BigIntegerType, primary_key=True, autoincrement=True)
 
@@ -19,17 +21,23 @@ class EventSpecification(database.base):
 
 class EventParticipation(database.base):
   __tablename__ = "event_participations"
+  # Participations of guild in event and of user across events, amount is included for index only scans of aggregates
+  __table_args__ = (Index("ix_event_participations_dt_guild_id_event_id", "dt_guild_id", "event_id", "dt_user_id", postgresql_include=["amount"]),
+                    Index("ix_event_participations_dt_user_id_event_id", "dt_user_id", "event_id", postgresql_include=["dt_guild_id", "amount"]),
+                    ForeignKeyConstraint(["event_id", "event_year"], ["event_specifications.event_id", "event_specifications.event_year"], ondelete="CASCADE", onupdate="CASCADE"))
 
-  event_id = Column(database.BigIntegerType, ForeignKey("event_specifications.event_id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+  event_id = Column(database.BigIntegerType, primary_key=True)
   dt_guild_id = Column(database.BigIntegerType, ForeignKey("dt_guilds.id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
   dt_user_id = Column(database.BigIntegerType, ForeignKey("dt_users.id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
-  updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True, nullable=False)
+  # Copy of year of event specification kept same by foreign key with event id, partition key of optional partitioned layout (database/migrations/partition_event_participations.sql)
+  event_year = Column(Integer, primary_key=True, autoincrement=False)
+  updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, nullable=False)
 
   event_specification = relationship("EventSpecification", uselist=False, back_populates="event_participations")
   dt_user = relationship("DTUser", uselist=False, back_populates="event_participations")
   dt_guild = relationship("DTGuild", uselist=False, back_populates="event_participations")
 
-  amount = Column(database.BigIntegerType, default=0, index=True, nullable=False)
+  amount = Column(database.BigIntegerType, default=0, nullable=False)
 
   def to_DTUserData(self) -> DTUserData:
     return DTUserData(self.dt_user.username,
@@ -0,0 +1,31 @@
+import datetime
+from sqlalchemy import Column, ForeignKey, Integer, String, DateTime
+
+import database
+
+class ArchivedEventYear(database.base):
+  """
+  Closed event year whose participations were exported to compressed file and removed from event_participations
+  """
+  __tablename__ = "archived_event_years"
+
+  event_year = Column(Integer, primary_key=True, autoincrement=False)
+  participations = Column(database.BigIntegerType, default=0, nullable=False)
+  archive_path = Column(String, nullable=False)
+  archived_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=False)
+
+class DTMemberArchivedStats(database.base):
+  """
+  Statistics of archived participations of user in guild in one year, merged into dt_member_stats when they are recalculated
+  """
+  __tablename__ = "dt_member_archived_stats"
+
+  event_year = Column(Integer, ForeignKey("archived_event_years.event_year", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True)
+  dt_user_id = Column(database.BigIntegerType, ForeignKey("dt_users.id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True, index=True)
+  dt_guild_id = Column(database.BigIntegerType, ForeignKey("dt_guilds.id", ondelete="CASCADE", onupdate="CASCADE"), primary_key=True, index=True)
+
+  participation_count = Column(Integer, default=0, nullable=False)
+  total = Column(database.BigIntegerType, default=0, nullable=False)
+  # Serialized features.quantile_sketch.QuantileSketch of amounts
+  quantile_sketch = Column(String, nullable=False)
+  last_event_id = Column(database.BigIntegerType, ForeignKey("event_specifications.event_id", ondelete="SET NULL", onupdate="CASCADE"), nullable=True)
@@ -1,8 +1,8 @@
 import disnake
 from typing import Optional, List, AsyncIterator
-from sqlalchemy import select, delete, or_
+from sqlalchemy import select, delete
 
-from database import run_query_in_thread, run_commit_in_thread, dt_guild_repo
+from database import run_query_in_thread, run_commit_in_thread, dt_guild_repo, dt_name_search_repo
 from database.tables.tracking_settings import TrackingSettings
 from database.discord_objects_repo import get_or_create_discord_guild
 
@@ -12,10 +12,8 @@ async def get_tracking_settings(session, guild_id: int, dt_guild_id: int) -> Opt
 
 async def search_tracked_guilds(session, guild_id: int, search: Optional[str]=None, limit: int=25) -> List[dt_guild_repo.DTGuild]:
   if search is not None:
-    if search.isnumeric():
-      result = await run_query_in_thread(session, select(dt_guild_repo.DTGuild).join(TrackingSettings).filter(or_(dt_guild_repo.DTGuild.name.ilike(f"%{search}%"), dt_guild_repo.DTGuild.id == int(search)), TrackingSettings.guild_id == str(guild_id)).order_by(dt_guild_repo.DTGuild.name).limit(limit))
-    else:
-      result = await run_query_in_thread(session, select(dt_guild_repo.DTGuild).join(TrackingSettings).filter(dt_guild_repo.DTGuild.name.ilike(f"%{search}%"), TrackingSettings.guild_id == str(guild_id)).order_by(dt_guild_repo.DTGuild.name).limit(limit))
+    search_filter, order_by = await dt_name_search_repo.get_name_search_clauses(session, dt_guild_repo.DTGuild.name, search, dt_guild_repo.DTGuild.id)
+    result = await run_query_in_thread(session, select(dt_guild_repo.DTGuild).join(TrackingSettings).filter(search_filter, TrackingSettings.guild_id == str(guild_id)).order_by(*order_by).limit(limit))
   else:
     result = await run_query_in_thread(session, select(dt_guild_repo.DTGuild).join(TrackingSettings).filter(TrackingSettings.guild_id == str(guild_id)).order_by(dt_guild_repo.DTGuild.name).limit(limit))
   return result.scalars().all()
@@ -3,7 +3,6 @@ from disnake.ext import commands
 from typing import Optional, Tuple
 import asyncio
 import math
-from Levenshtein import ratio
 import datetime
 
 from features.base_cog import Base_Cog
@@ -123,8 +122,7 @@ class DTDynamicDataManager(Base_Cog):
     if number_of_lines < 5 or number_of_lines > 6: return False
 
     with session_maker() as session:
-      all_item_names = await dt_items_repo.get_all_item_names(session)
-      all_item_names_processes = [(name, name.lower()) for name in all_item_names]
+      item_catalogue = await dt_items_repo.get_item_catalogue(session)
 
     identifier = None
     level = 0
@@ -143,23 +141,9 @@ class DTDynamicDataManager(Base_Cog):
         else:
           item_name = line
 
-        item_name = item_name.lower()
-
-        max_score = 0
-        guessed_item_name = None
-        for true_item_name, true_item_name_lower in all_item_names_processes:
-          score = ratio(item_name, true_item_name_lower)
-          if score <= 0.1: continue
-
-          if score > max_score:
-            max_score = score
-            guessed_item_name = true_item_name
-
-          if max_score > 0.9:
-            break
-
-        if max_score > 0.5:
-          item_data.append([guessed_item_name, amount])
+        match = item_catalogue.match(item_name, 0.5)
+        if match is not None and match[1] > 0.5:
+          item_data.append([match[0], amount])
 
     if len(item_data) != 4:
       return await message_utils.generate_error_message(message, Strings.data_manager_set_event_items_prompt_not_enough_items)
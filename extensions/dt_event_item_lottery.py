@@ -3,7 +3,6 @@ import datetime
 import disnake
 from typing import Optional
 from disnake.ext import commands, tasks
-from Levenshtein import ratio
 import math
 from table2ascii import table2ascii, Alignment
 from sqlalchemy import exc
@@ -59,8 +58,8 @@ async def make_guess(session, inter: disnake.CommandInteraction | commands.Conte
   await message_utils.generate_success_message(inter, Strings.lottery_guess_registered(event_year=guess.event_specification.event_year, event_week=guess.event_specification.event_week, items=guessed_item_names_string))
 
 async def handle_quess_data(message: disnake.Message, guess_data_list: list[str]) -> bool:
-  async def already_guessed(session, event_spec):
-    already_existing_guess = await dt_event_item_lottery_repo.get_guess(session, message.guild.id, message.author.id, event_spec.event_id)
+  async def already_guessed(session, event_id):
+    already_existing_guess = await dt_event_item_lottery_repo.get_guess(session, message.guild.id, message.author.id, event_id)
 
     if already_existing_guess is not None:
       already_existing_guessed_names = [guessed_item.item_name for guessed_item in already_existing_guess.guessed_lotery_items]
@@ -71,27 +70,12 @@ async def handle_quess_data(message: disnake.Message, guess_data_list: list[str]
 
   guessed_items_data = []
   with session_maker() as session:
-    all_item_names = await dt_items_repo.get_all_item_names(session)
-    all_item_names = [(name, name.lower()) for name in all_item_names]
+    item_catalogue = await dt_items_repo.get_item_catalogue(session)
 
-    for guess_data_item in guess_data_list:
-      guess_data_item = guess_data_item.lower()
-
-      max_score = 0
-      guessed_item_name = None
-      for item_name, item_name_lower in all_item_names:
-        score = ratio(guess_data_item, item_name_lower)
-        if score <= 0.1: continue
-
-        if score > max_score:
-          max_score = score
-          guessed_item_name = item_name
-
-        if max_score > 0.9:
-          break
-
-      if max_score > 0.7:
-        guessed_items_data.append((guessed_item_name, max_score * 100))
+  for guess_data_item in guess_data_list:
+    match = item_catalogue.match(guess_data_item, 0.7)
+    if match is not None and match[1] > 0.7:
+      guessed_items_data.append((match[0], match[1] * 100))
 
   if not guessed_items_data: return False
 
@@ -111,8 +95,8 @@ async def handle_quess_data(message: disnake.Message, guess_data_list: list[str]
   year, week = dt_helpers.get_event_index(datetime.datetime.now(datetime.UTC).replace(tzinfo=None) + datetime.timedelta(days=7))
 
   with session_maker() as session:
-    event_spec = await event_participation_repo.get_or_create_event_specification(session, year, week)
-    if await already_guessed(session, event_spec):
+    event_id = await event_participation_repo.get_or_create_event_id(session, year, week)
+    if await already_guessed(session, event_id):
       return True
 
   if len(item_names) == 4 and all_sure:
@@ -131,8 +115,8 @@ async def handle_quess_data(message: disnake.Message, guess_data_list: list[str]
 
       with session_maker() as session:
         if confirmation_view.get_result():
-          event_spec = await event_participation_repo.get_or_create_event_specification(session, year, week)
-          if not (await already_guessed(session, event_spec)):
+          event_id = await event_participation_repo.get_or_create_event_id(session, year, week)
+          if not (await already_guessed(session, event_id)):
             await make_guess(session, message, message.author, *item_names)
       return True
     return False
@@ -320,9 +304,9 @@ class DTEventItemLottery(Base_Cog):
 
     with session_maker() as session:
       year, week = dt_helpers.get_event_index(datetime.datetime.now(datetime.UTC).replace(tzinfo=None) + datetime.timedelta(days=7))
-      event_specification = await event_participation_repo.get_or_create_event_specification(session, year, week)
+      event_id = await event_participation_repo.get_or_create_event_id(session, year, week)
 
-      if await dt_event_item_lottery_repo.remove_guess(session, inter.guild_id, inter.author.id, event_specification.event_id):
+      if await dt_event_item_lottery_repo.remove_guess(session, inter.guild_id, inter.author.id, event_id):
         await message_utils.generate_success_message(inter, Strings.lottery_guess_removed_sucessfully)
       else:
         await message_utils.generate_error_message(inter, Strings.lottery_guess_no_guess_to_remove)
@@ -353,9 +337,9 @@ class DTEventItemLottery(Base_Cog):
 
     with session_maker() as session:
       year, week = dt_helpers.get_event_index(datetime.datetime.now(datetime.UTC).replace(tzinfo=None) + datetime.timedelta(days=7))
-      event_specification = await event_participation_repo.get_or_create_event_specification(session, year, week)
+      event_id = await event_participation_repo.get_or_create_event_id(session, year, week)
 
-      if await dt_event_item_lottery_repo.remove_guess(session, inter.guild_id, author.id, event_specification.event_id):
+      if await dt_event_item_lottery_repo.remove_guess(session, inter.guild_id, author.id, event_id):
         await message_utils.generate_success_message(inter, Strings.lottery_guess_removed_sucessfully)
       else:
         await message_utils.generate_error_message(inter, Strings.lottery_guess_no_guess_to_remove)
@@ -1,6 +1,3 @@
-import collections
-import copy
-
 import disnake
 from disnake.ext import commands, tasks
 import math
@@ -153,52 +150,26 @@ class DTEventReportAnnouncer(Base_Cog):
     text_announced = []
     csv_announced = []
     full_announced = []
-    updated_guilds = []
+    updated_guilds = set()
 
     logger.info("Starting Announcement")
 
     year, week = dt_helpers.get_event_index(datetime.datetime.now(datetime.UTC).replace(tzinfo=None))
 
+    async def process_guild_data(writer_session, data: dt_helpers.DTGuildData) -> bool:
+      return await event_participation_repo.generate_or_update_event_participations_if_changed(writer_session, data)
+
+    def guild_data_committed(data: dt_helpers.DTGuildData, _: bool):
+      updated_guilds.add(data.id)
+
     while True:
       try:
         with session_maker() as session:
-          not_updated_guilds_queue = collections.deque(await tracking_settings_repo.get_tracked_guild_ids(session))
-
-          number_of_failed_updates = 0
-          while not_updated_guilds_queue:
-            working_copy_of_not_updated_guilds = copy.deepcopy(not_updated_guilds_queue)
-            not_updated_guilds_queue.clear()
-
-            while working_copy_of_not_updated_guilds:
-              guild_id = working_copy_of_not_updated_guilds.popleft()
-
-              if guild_id in updated_guilds:
-                continue
-
-              data = await dt_helpers.get_dt_guild_data(guild_id, True)
-
-              if data is None:
-                await asyncio.sleep(20)
-                data = await dt_helpers.get_dt_guild_data(guild_id, True)
-
-              await asyncio.sleep(0.5)
-              if data is None:
-                await asyncio.sleep(20)
-                not_updated_guilds_queue.append(guild_id)
-                continue
+          not_updated_guild_ids = [guild_id for guild_id in await tracking_settings_repo.get_tracked_guild_ids(session) if guild_id not in updated_guilds]
 
-              await event_participation_repo.generate_or_update_event_participations(session, data)
-              updated_guilds.append(guild_id)
-
-            if not_updated_guilds_queue:
-              if number_of_failed_updates >= 60:
-                # Give up after 60 attempts
-                logger.warning(f"{list(not_updated_guilds_queue)} guilds not updated for report (already failed {number_of_failed_updates}x), giving up")
-                break
-              else:
-                logger.warning(f"{list(not_updated_guilds_queue)} guilds not updated for report (already failed {number_of_failed_updates}x), retrying")
-                number_of_failed_updates += 1
-                await asyncio.sleep(120)
+          # Give up after 60 attempts
+          stats = await self.bot.dt_guild_crawler.crawl(not_updated_guild_ids, process_guild_data, committed_callback=guild_data_committed, update=True, max_retries=60)
+          logger.info(f"Tracked guilds refreshed for announcement: {stats}")
 
           trackers = tracking_settings_repo.get_all_trackers(session)
           async for tracker in trackers:
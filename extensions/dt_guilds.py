@@ -2,7 +2,6 @@ import disnake
 from disnake.ext import commands
 from table2ascii import table2ascii, Alignment
 from functools import partial
-import sqlalchemy
 import datetime
 import asyncio
 
@@ -11,7 +10,7 @@ from utils.logger import setup_custom_logger
 from config import cooldowns, Strings
 from utils import message_utils, dt_autocomplete, dt_report_generators, dt_helpers, string_manipulation
 from utils.humanize_wrapper import hum_naturaltime
-from database import event_participation_repo, dt_guild_repo, dt_guild_member_repo, session_maker
+from database import event_participation_repo, dt_guild_repo, dt_member_stats_repo, session_maker
 from features.views.data_selector import DataSelector
 from features.views.paginator import EmbedView
 
@@ -101,9 +100,9 @@ class DTGuilds(Base_Cog):
       message_utils.add_author_footer(guild_front_page, inter.author)
       guild_front_page.add_field(name="ID", value=str(guild.id))
       guild_front_page.add_field(name="Level", value=str(guild.level))
-      guild_front_page.add_field(name="Members", value=str(len(guild.members)))
+      guild_front_page.add_field(name="Members", value=str(guild.member_count))
       guild_front_page.add_field(name="Active", value=str(guild.is_active))
-      guild_front_page.add_field(name="Position", value=str(await dt_guild_repo.get_guild_position(session, guild.id)))
+      guild_front_page.add_field(name="Position", value=str(guild.level_rank))
       guild_profile_lists.append(guild_front_page)
 
       # Members list
@@ -141,7 +140,7 @@ class DTGuilds(Base_Cog):
       await asyncio.sleep(0.1)
 
       # Event best contributors
-      top_event_contributors = await event_participation_repo.get_event_participants_data(session, guild.id, limit=10, ignore_zero_participation_median=True, only_current_members=True, order_by=[sqlalchemy.func.avg(event_participation_repo.EventParticipation.amount).desc()])
+      top_event_contributors = await dt_member_stats_repo.get_member_rankings(session, guild.id, limit=10, only_current_members=True, ignore_zero_participation_median=True)
       top_event_contributors_data = [(string_manipulation.truncate_string(contributor[1], 14), string_manipulation.format_number(contributor[4]), string_manipulation.format_number(contributor[5])) for idx, contributor in enumerate(top_event_contributors)]
       event_best_contributors_table_strings = table2ascii(body=top_event_contributors_data, header=["Name", "Total", "Average"], alignments=[Alignment.LEFT, Alignment.RIGHT, Alignment.RIGHT]).split("\n")
 
@@ -154,7 +153,7 @@ class DTGuilds(Base_Cog):
       await asyncio.sleep(0.1)
 
       # Worst event contributors
-      worst_event_contributors = await event_participation_repo.get_event_participants_data(session, guild.id, limit=10, ignore_zero_participation_median=True, only_current_members=True, order_by=[sqlalchemy.func.avg(event_participation_repo.EventParticipation.amount)])
+      worst_event_contributors = await dt_member_stats_repo.get_member_rankings(session, guild.id, limit=10, ascending=True, only_current_members=True, ignore_zero_participation_median=True)
       worst_event_contributors_data = [(string_manipulation.truncate_string(contributor[1], 14), string_manipulation.format_number(contributor[4]), string_manipulation.format_number(contributor[5])) for idx, contributor in enumerate(worst_event_contributors)]
       event_worst_contributors_table_strings = table2ascii(body=worst_event_contributors_data, header=["Name", "Total", "Average"], alignments=[Alignment.LEFT, Alignment.RIGHT, Alignment.RIGHT]).split("\n")
 
@@ -203,8 +202,7 @@ class DTGuilds(Base_Cog):
       if not guild_leaderboard_data:
         return await message_utils.generate_error_message(inter, Strings.public_interface_guild_leaderboard_no_guilds)
 
-      for standing, guild_id, guild_name, level in guild_leaderboard_data:
-        member_number = await dt_guild_member_repo.get_number_of_members(session, guild_id)
+      for standing, _, guild_name, level, member_number in guild_leaderboard_data:
         standing_table_data.append((standing, string_manipulation.truncate_string(guild_name, 20), level, member_number))
 
     standing_table_strings = table2ascii(["No°", "Name", "Level", "Members"], standing_table_data, alignments=[Alignment.RIGHT, Alignment.LEFT, Alignment.RIGHT, Alignment.RIGHT], first_col_heading=True).split("\n")
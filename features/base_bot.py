@@ -10,6 +10,8 @@ from config import config
 from utils.logger import setup_custom_logger
 from features.presence_handler import PresenceHandler
 from features.error_logger import ErrorLogger
+from features.dt_guild_crawler import DTGuildCrawler
+from features.rate_limiter import AdaptiveRateLimiter
 
 logger = setup_custom_logger(__name__)
 
@@ -33,6 +35,12 @@ class BaseAutoshardedBot(commands.AutoShardedBot):
 
     self.presence_handler = PresenceHandler(self, config.presence.status_messages, config.presence.cycle_interval_s)
     self.error_logger = ErrorLogger(self)
+    self.dt_api_rate_limiter = AdaptiveRateLimiter(config.rate_limiter.initial_rate, config.rate_limiter.min_rate, config.rate_limiter.max_rate,
+                                                   config.rate_limiter.additive_increase, config.rate_limiter.multiplicative_decrease,
+                                                   config.rate_limiter.latency_spike_factor, config.rate_limiter.error_window_size,
+                                                   config.rate_limiter.min_retry_delay_seconds, config.rate_limiter.max_retry_delay_seconds)
+    self.dt_guild_crawler = DTGuildCrawler(config.data_manager.crawler_concurrency, self.dt_api_rate_limiter,
+                                           config.data_manager.crawler_writers, config.data_manager.crawler_write_batch_size, config.data_manager.crawler_queue_size)
 
     self.event(self.on_ready)
 
@@ -77,5 +85,9 @@ class BaseAutoshardedBot(commands.AutoShardedBot):
     if self.initialized:
       await self.presence_handler.update_message()
 
+  async def close(self):
+    await self.dt_guild_crawler.close()
+    await super(BaseAutoshardedBot, self).close()
+
   async def on_error(self, event, *args, **kwargs):
     return await self.error_logger.default_error_handling(event, args, kwargs)
@@ -0,0 +1,102 @@
+# Dedicated thread pool for blocking database calls with per caller metrics of waiting for worker and execution
+
+import asyncio
+import collections
+import concurrent.futures
+import dataclasses
+import time
+from typing import Callable, Any, Dict, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+@dataclasses.dataclass
+class DBCallStats:
+  calls: int = 0
+  failures: int = 0
+  in_flight: int = 0
+  max_in_flight: int = 0
+  queue_wait_seconds: float = 0.0
+  max_queue_wait_seconds: float = 0.0
+  execution_seconds: float = 0.0
+  max_execution_seconds: float = 0.0
+
+  @property
+  def average_queue_wait(self) -> float:
+    return self.queue_wait_seconds / self.calls if self.calls else 0.0
+
+  @property
+  def average_execution(self) -> float:
+    return self.execution_seconds / self.calls if self.calls else 0.0
+
+class DBExecutor:
+  def __init__(self, max_workers: int):
+    self.max_workers = max(max_workers, 1)
+    self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="database")
+
+    self.stats: Dict[str, DBCallStats] = collections.defaultdict(DBCallStats)
+    self.in_flight = 0
+    self.max_in_flight = 0
+    self.started_at = time.time()
+
+  async def run(self, caller: str, function: Callable[..., T], *args: Any) -> T:
+    """
+    Run blocking function in database thread pool
+
+    :param caller: Name of function the call is accounted to
+    """
+    stats = self.stats[caller]
+    stats.in_flight += 1
+    stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+    self.in_flight += 1
+    self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    # Written by worker thread, read after the call finished so stats are only ever updated from event loop
+    timing = [None, None]
+    def timed_call():
+      timing[0] = time.perf_counter()
+      try:
+        return function(*args)
+      finally:
+        timing[1] = time.perf_counter()
+
+    submitted_at = time.perf_counter()
+    failed = False
+    try:
+      return await asyncio.get_running_loop().run_in_executor(self.executor, timed_call)
+    except BaseException:
+      failed = True
+      raise
+    finally:
+      # Looked up again because stats could be reset in the meantime
+      stats = self.stats[caller]
+      stats.in_flight -= 1
+      self.in_flight -= 1
+
+      started_at, finished_at = timing
+      if started_at is not None:
+        queue_wait = started_at - submitted_at
+        execution = (finished_at if finished_at is not None else time.perf_counter()) - started_at
+
+        stats.calls += 1
+        stats.failures += 1 if failed else 0
+        stats.queue_wait_seconds += queue_wait
+        stats.max_queue_wait_seconds = max(stats.max_queue_wait_seconds, queue_wait)
+        stats.execution_seconds += execution
+        stats.max_execution_seconds = max(stats.max_execution_seconds, execution)
+
+  def get_stats(self) -> List[Tuple[str, DBCallStats]]:
+    """
+    :return: caller, stats ordered by total time spent in queue and execution
+    """
+    return sorted(self.stats.items(), key=lambda item: item[1].queue_wait_seconds + item[1].execution_seconds, reverse=True)
+
+  def reset_stats(self):
+    self.stats = collections.defaultdict(DBCallStats, {caller: DBCallStats(in_flight=stats.in_flight) for caller, stats in self.stats.items() if stats.in_flight > 0})
+    self.max_in_flight = self.in_flight
+    self.started_at = time.time()
+
+  def shutdown(self):
+    self.executor.shutdown(wait=False)
+
+  def __str__(self):
+    return f"{self.in_flight} calls in flight on {self.max_workers} workers (max {self.max_in_flight})"
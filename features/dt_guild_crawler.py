@@ -0,0 +1,308 @@
+# Concurrent crawler for pulling Deep Town guild data over one shared HTTP connection pool
+# Fetching and writing run as separate pipeline stages connected by bounded queue
+
+import asyncio
+import dataclasses
+import datetime
+import time
+import traceback
+from typing import Optional, List, Iterable, Callable, Awaitable
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, ClientError
+from sqlalchemy.orm import Session
+
+import database
+from features.rate_limiter import AdaptiveRateLimiter
+from utils import dt_helpers
+from utils.logger import setup_custom_logger
+
+logger = setup_custom_logger(__name__)
+
+@dataclasses.dataclass
+class CrawlStats:
+  total: int = 0
+  pulled: int = 0
+  unchanged: int = 0
+  failed_ids: List[int] = dataclasses.field(default_factory=list)
+  started_at: datetime.datetime = dataclasses.field(default_factory=lambda: datetime.datetime.now(datetime.UTC).replace(tzinfo=None))
+  finished_at: Optional[datetime.datetime] = None
+
+  # Pipeline stage timings
+  fetched: int = 0
+  fetch_seconds: float = 0.0
+  backpressure_seconds: float = 0.0 # Time fetchers waited for space in full queue
+  batches: int = 0
+  write_seconds: float = 0.0
+  batch_write_seconds: List[float] = dataclasses.field(default_factory=list)
+  writer_idle_seconds: float = 0.0 # Time writers waited for data in empty queue
+  queue_depth: int = 0
+  max_queue_depth: int = 0
+
+  @property
+  def processed(self) -> int:
+    return self.pulled + len(self.failed_ids)
+
+  @property
+  def elapsed_seconds(self) -> float:
+    end = self.finished_at if self.finished_at is not None else datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+    return max((end - self.started_at).total_seconds(), 0.0)
+
+  @property
+  def guilds_per_second(self) -> float:
+    elapsed = self.elapsed_seconds
+    if elapsed <= 0: return 0.0
+    return self.pulled / elapsed
+
+  def get_write_latency_percentile(self, percentile: float) -> float:
+    if not self.batch_write_seconds: return 0.0
+    latencies = sorted(self.batch_write_seconds)
+    return latencies[min(int(len(latencies) * percentile / 100), len(latencies) - 1)]
+
+  @property
+  def pipeline_summary(self) -> str:
+    average_fetch = (self.fetch_seconds / self.fetched * 1000) if self.fetched else 0.0
+    average_write = (self.write_seconds / self.batches * 1000) if self.batches else 0.0
+    return f"fetch {average_fetch:.0f}ms/guild, write {average_write:.0f}ms/batch (p95 {self.get_write_latency_percentile(95) * 1000:.0f}ms, {self.batches} batches), queue depth {self.queue_depth} (max {self.max_queue_depth}), " \
+           f"fetchers blocked {self.backpressure_seconds:.1f}s, writers idle {self.writer_idle_seconds:.1f}s"
+
+  def __str__(self):
+    return f"{self.pulled}/{self.total} guilds pulled ({self.unchanged} unchanged), {len(self.failed_ids)} failed in {self.elapsed_seconds:.1f}s ({self.guilds_per_second:.2f} guilds/s), {self.pipeline_summary}"
+
+@dataclasses.dataclass
+class FetchResult:
+  guild_id: int
+  data: Optional[dt_helpers.DTGuildData] = None
+  error: Optional[str] = None
+
+class DTGuildCrawler:
+  def __init__(self, concurrency: int, rate_limiter: AdaptiveRateLimiter, writers: int=1, write_batch_size: int=1, queue_size: int=100, request_timeout_seconds: float=60.0):
+    self.concurrency = max(concurrency, 1)
+    self.rate_limiter = rate_limiter
+    self.writers = max(writers, 1)
+    if self.writers > 1 and database.engine.dialect.name == "sqlite":
+      # sqlite allows only one writing transaction at a time, other writers would fail with "database is locked"
+      logger.warning(f"Crawler writers limited from {self.writers} to 1 because sqlite doesn't support concurrent writers")
+      self.writers = 1
+    self.write_batch_size = max(write_batch_size, 1)
+    self.queue_size = max(queue_size, 1)
+    self.request_timeout = request_timeout_seconds
+
+    self.http_session: Optional[ClientSession] = None
+    self.current_stats: Optional[CrawlStats] = None
+
+  def get_http_session(self) -> ClientSession:
+    # Created lazily because aiohttp session needs running event loop
+    if self.http_session is None or self.http_session.closed:
+      connector = TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency, keepalive_timeout=60)
+      self.http_session = ClientSession(timeout=ClientTimeout(total=self.request_timeout), connector=connector)
+    return self.http_session
+
+  async def close(self):
+    if self.http_session is not None and not self.http_session.closed:
+      await self.http_session.close()
+    self.http_session = None
+
+  async def get_ids_of_all_guilds(self) -> Optional[List[int]]:
+    try:
+      return await dt_helpers.get_ids_of_all_guilds(self.get_http_session(), self.rate_limiter)
+    except (ClientError, asyncio.TimeoutError):
+      logger.warning(f"Failed to get ids of all guilds\n{traceback.format_exc()}")
+      return None
+
+  async def get_dt_guild_data(self, guild_id: int, update: bool=False) -> Optional[dt_helpers.DTGuildData]:
+    try:
+      return await dt_helpers.get_dt_guild_data(guild_id, update, self.get_http_session(), self.rate_limiter)
+    except (ClientError, asyncio.TimeoutError):
+      logger.warning(f"Failed to get data of guild {guild_id}: {traceback.format_exc(limit=1)}")
+      return None
+
+  async def crawl(self, guild_ids: Iterable[int],
+                  handler: Callable[[Session, dt_helpers.DTGuildData], Awaitable[bool]],
+                  failure_callback: Optional[Callable[[Session, int, str], Awaitable[None]]]=None,
+                  committed_callback: Optional[Callable[[dt_helpers.DTGuildData, bool], None]]=None,
+                  update: bool=False,
+                  max_retries: int=0,
+                  progress_callback: Optional[Callable[[CrawlStats], Awaitable[None]]]=None,
+                  progress_interval_seconds: float=60) -> CrawlStats:
+    """
+    Fetch data of guilds with bounded number of requests in flight and pass them through bounded queue to writers
+    Every writer has its own database session and writes guilds in batches, one transaction per batch and one savepoint per guild,
+    so exception raised by handler fails only that guild
+
+    :param guild_ids: IDs of guilds to pull
+    :param handler: Coroutine processing pulled guild data in writer session, returns False when data were unchanged and skipped
+    :param failure_callback: Coroutine called in writer session with guild id and error message on each failed attempt of guild
+    :param committed_callback: Called with guild data and changed flag after batch with guild was committed
+    :param update: Request data update on server side
+    :param max_retries: Number of retry rounds for failed guilds, delay between rounds is driven by rate limiter
+    :param progress_callback: Coroutine periodically called with current stats
+    :param progress_interval_seconds: Interval between progress callback calls
+    :return: Stats of crawl
+    """
+    guild_ids = list(dict.fromkeys(guild_ids))
+    stats = CrawlStats(total=len(guild_ids))
+    self.current_stats = stats
+
+    progress_task = asyncio.create_task(self._progress_reporter(stats, progress_callback, progress_interval_seconds)) if progress_callback is not None else None
+
+    try:
+      pending_ids = guild_ids
+      number_of_retries = 0
+      while pending_ids:
+        failed_ids = await self._crawl_round(pending_ids, handler, failure_callback, committed_callback, update, stats)
+        if not failed_ids:
+          break
+
+        if number_of_retries >= max_retries:
+          if max_retries > 0:
+            logger.warning(f"{failed_ids} guilds not updated (already failed {number_of_retries}x), giving up")
+          stats.failed_ids.extend(failed_ids)
+          break
+
+        retry_delay = self.rate_limiter.get_retry_delay()
+        logger.warning(f"{failed_ids} guilds not updated (already failed {number_of_retries}x), retrying in {retry_delay:.0f}s")
+        number_of_retries += 1
+        pending_ids = failed_ids
+        await asyncio.sleep(retry_delay)
+    finally:
+      stats.finished_at = datetime.datetime.now(datetime.UTC).replace(tzinfo=None)
+      if progress_task is not None:
+        progress_task.cancel()
+
+    logger.info(f"Crawl finished with rate limiter state: {self.rate_limiter}")
+
+    return stats
+
+  async def _crawl_round(self, guild_ids: List[int],
+                         handler: Callable[[Session, dt_helpers.DTGuildData], Awaitable[bool]],
+                         failure_callback: Optional[Callable[[Session, int, str], Awaitable[None]]],
+                         committed_callback: Optional[Callable[[dt_helpers.DTGuildData, bool], None]],
+                         update: bool, stats: CrawlStats) -> List[int]:
+    id_queue = asyncio.Queue()
+    for guild_id in guild_ids:
+      id_queue.put_nowait(guild_id)
+
+    # Bounded so fetchers are slowed down when writers fall behind
+    data_queue: asyncio.Queue[Optional[FetchResult]] = asyncio.Queue(maxsize=self.queue_size)
+    failed_ids = []
+
+    async def fetcher():
+      while not id_queue.empty():
+        guild_id = id_queue.get_nowait()
+
+        fetch_start = time.monotonic()
+        data = await self.get_dt_guild_data(guild_id, update)
+        stats.fetch_seconds += time.monotonic() - fetch_start
+        stats.fetched += 1
+
+        put_start = time.monotonic()
+        await data_queue.put(FetchResult(guild_id, data, None if data is not None else "Failed to download guild data"))
+        stats.backpressure_seconds += time.monotonic() - put_start
+
+        stats.queue_depth = data_queue.qsize()
+        stats.max_queue_depth = max(stats.max_queue_depth, stats.queue_depth)
+
+    async def writer():
+      async with database.writer_session() as session:
+        while True:
+          get_start = time.monotonic()
+          result = await data_queue.get()
+          stats.writer_idle_seconds += time.monotonic() - get_start
+          if result is None: break
+
+          batch = [result]
+          finished = False
+          while len(batch) < self.write_batch_size and not data_queue.empty():
+            result = data_queue.get_nowait()
+            if result is None:
+              finished = True
+              break
+            batch.append(result)
+          stats.queue_depth = data_queue.qsize()
+
+          write_start = time.monotonic()
+          failed_ids.extend(await self._write_batch(session, batch, handler, failure_callback, committed_callback, stats))
+          write_duration = time.monotonic() - write_start
+          stats.write_seconds += write_duration
+          stats.batch_write_seconds.append(write_duration)
+          stats.batches += 1
+
+          if finished: break
+
+    number_of_writers = min(self.writers, len(guild_ids))
+
+    async def fetch_stage():
+      await asyncio.gather(*[fetcher() for _ in range(min(self.concurrency, len(guild_ids)))])
+      for _ in range(number_of_writers):
+        await data_queue.put(None)
+
+    # Gathered together so crash of writer stops fetchers instead of leaving them blocked on full queue
+    tasks = [asyncio.create_task(fetch_stage())] + [asyncio.create_task(writer()) for _ in range(number_of_writers)]
+    try:
+      await asyncio.gather(*tasks)
+    finally:
+      for task in tasks:
+        task.cancel()
+
+    return failed_ids
+
+  @staticmethod
+  async def _write_batch(session: Session, batch: List[FetchResult],
+                         handler: Callable[[Session, dt_helpers.DTGuildData], Awaitable[bool]],
+                         failure_callback: Optional[Callable[[Session, int, str], Awaitable[None]]],
+                         committed_callback: Optional[Callable[[dt_helpers.DTGuildData, bool], None]],
+                         stats: CrawlStats) -> List[int]:
+    """
+    :return: IDs of failed guilds
+    """
+    processed = []
+    failures = [(result.guild_id, result.error) for result in batch if result.data is None]
+
+    try:
+      async with database.batched_transaction(session):
+        for result in batch:
+          if result.data is None: continue
+
+          try:
+            async with database.savepoint(session):
+              changed = await handler(session, result.data)
+            processed.append((result.data, changed))
+          except Exception as e:
+            logger.warning(f"Failed to process data of guild {result.guild_id}\n{traceback.format_exc()}")
+            failures.append((result.guild_id, f"{type(e).__name__}: {e}"[:1000]))
+
+        if failure_callback is not None:
+          for guild_id, error in failures:
+            await failure_callback(session, guild_id, error)
+    except Exception as e:
+      # Whole batch is lost, failures are recorded in new transaction
+      logger.warning(f"Failed to commit batch of {len(batch)} guilds\n{traceback.format_exc()}")
+      processed = []
+      failures = [(result.guild_id, result.error if result.data is None else f"{type(e).__name__}: {e}"[:1000]) for result in batch]
+
+      if failure_callback is not None:
+        try:
+          async with database.batched_transaction(session):
+            for guild_id, error in failures:
+              await failure_callback(session, guild_id, error)
+        except Exception:
+          logger.warning(f"Failed to record failures of batch\n{traceback.format_exc()}")
+
+    for data, changed in processed:
+      stats.pulled += 1
+      if not changed:
+        stats.unchanged += 1
+      if committed_callback is not None:
+        committed_callback(data, changed)
+
+    return [guild_id for guild_id, _ in failures]
+
+  @staticmethod
+  async def _progress_reporter(stats: CrawlStats, progress_callback: Callable[[CrawlStats], Awaitable[None]], interval: float):
+    while True:
+      await asyncio.sleep(interval)
+      try:
+        await progress_callback(stats)
+      except asyncio.CancelledError:
+        raise
+      except Exception:
+        logger.warning(f"Crawl progress callback failed\n{traceback.format_exc()}")
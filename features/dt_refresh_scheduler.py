@@ -0,0 +1,171 @@
+# Priority based scheduler deciding when each Deep Town guild should be refreshed
+
+import dataclasses
+import datetime
+import heapq
+from typing import Optional, List, Dict, Set, Tuple, Iterable
+
+from utils import dt_helpers
+
+@dataclasses.dataclass
+class GuildRefreshState:
+  guild_id: int
+  next_due: datetime.datetime
+  is_active: bool = True
+  change_rate: float = 0.5 # Exponential moving average of changed (1) and unchanged (0) refreshes
+  failures: int = 0
+  last_refresh: Optional[datetime.datetime] = None
+  version: int = 0
+
+class DTRefreshScheduler:
+  def __init__(self, hot_interval: datetime.timedelta, hot_window: datetime.timedelta, tracked_interval: datetime.timedelta,
+               active_interval: datetime.timedelta, inactive_interval: Optional[datetime.timedelta], change_rate_smoothing: float=0.3):
+    """
+    :param hot_interval: Refresh interval of tracked guilds close to end of event
+    :param hot_window: Time before end of event when tracked guilds become hot
+    :param tracked_interval: Refresh interval of tracked guilds
+    :param active_interval: Base refresh interval of active guilds, scaled by their change rate
+    :param inactive_interval: Refresh interval of inactive guilds, None to not refresh them at all
+    :param change_rate_smoothing: Weight of last refresh in change rate
+    """
+    self.hot_interval = hot_interval
+    self.hot_window = hot_window
+    self.tracked_interval = tracked_interval
+    self.active_interval = active_interval
+    self.inactive_interval = inactive_interval
+    self.change_rate_smoothing = change_rate_smoothing
+
+    self.states: Dict[int, GuildRefreshState] = {}
+    self.tracked_guild_ids: Set[int] = set()
+    self.heap: List[Tuple[datetime.datetime, int, int]] = []
+
+  def __len__(self):
+    return len(self.states)
+
+  def _push(self, state: GuildRefreshState, next_due: datetime.datetime):
+    state.version += 1
+    state.next_due = next_due
+    heapq.heappush(self.heap, (next_due, state.version, state.guild_id))
+
+  def _is_hot(self, state: GuildRefreshState, now: datetime.datetime) -> bool:
+    if state.guild_id not in self.tracked_guild_ids: return False
+
+    event_start, event_end = dt_helpers.event_index_to_date_range(*dt_helpers.get_event_index(now))
+    return event_start <= now <= event_end and event_end - now <= self.hot_window
+
+  def get_priority(self, state: GuildRefreshState, now: datetime.datetime) -> float:
+    if self._is_hot(state, now):
+      return 3 + state.change_rate
+    if state.guild_id in self.tracked_guild_ids:
+      return 2 + state.change_rate
+    if state.is_active:
+      return 1 + state.change_rate
+    return state.change_rate
+
+  def get_refresh_interval(self, state: GuildRefreshState, now: datetime.datetime) -> Optional[datetime.timedelta]:
+    if self._is_hot(state, now):
+      return self.hot_interval
+    if state.guild_id in self.tracked_guild_ids:
+      return self.tracked_interval
+    if state.is_active:
+      # Often changing guilds are refreshed up to 2x more often, rarely changing ones up to 1.5x less often
+      return self.active_interval * (1.5 - state.change_rate)
+    return self.inactive_interval
+
+  def sync_guilds(self, guild_ids: Iterable[int], inactive_guild_ids: Iterable[int], now: datetime.datetime):
+    """
+    Add new guilds as due now and remove guilds that no longer exist
+    """
+    guild_ids = set(guild_ids)
+    inactive_guild_ids = set(inactive_guild_ids)
+
+    for guild_id in [gid for gid in self.states.keys() if gid not in guild_ids]:
+      self.remove_guild(guild_id)
+
+    for guild_id in guild_ids:
+      if guild_id in self.states: continue
+
+      state = GuildRefreshState(guild_id, now, is_active=guild_id not in inactive_guild_ids)
+      self.states[guild_id] = state
+
+      if not state.is_active and self.inactive_interval is None and guild_id not in self.tracked_guild_ids:
+        continue
+      self._push(state, now)
+
+  def set_tracked_guilds(self, guild_ids: Iterable[int], now: datetime.datetime):
+    guild_ids = set(guild_ids)
+    newly_tracked = guild_ids - self.tracked_guild_ids
+    self.tracked_guild_ids = guild_ids
+
+    # Pull newly tracked guilds forward to their new interval
+    for guild_id in newly_tracked:
+      state = self.states.get(guild_id)
+      if state is None: continue
+
+      interval = self.get_refresh_interval(state, now)
+      last_refresh = state.last_refresh if state.last_refresh is not None else now
+      self._push(state, min(state.next_due, last_refresh + interval))
+
+  def remove_guild(self, guild_id: int):
+    # Entry in heap is invalidated lazily
+    self.states.pop(guild_id, None)
+
+  def pop_due_guild_ids(self, now: datetime.datetime, limit: int) -> List[int]:
+    """
+    Take due guilds ordered by priority, guilds not returned stay scheduled
+    Returned guilds have to be rescheduled by mark_refreshed or mark_failed
+    """
+    due_states = []
+    while self.heap and self.heap[0][0] <= now:
+      _, version, guild_id = heapq.heappop(self.heap)
+      state = self.states.get(guild_id)
+      if state is None or state.version != version: continue
+      due_states.append(state)
+
+    due_states.sort(key=lambda s: (-self.get_priority(s, now), s.next_due))
+
+    for state in due_states[limit:]:
+      heapq.heappush(self.heap, (state.next_due, state.version, state.guild_id))
+
+    return [state.guild_id for state in due_states[:limit]]
+
+  def mark_refreshed(self, guild_id: int, changed: bool, is_active: bool, now: datetime.datetime):
+    state = self.states.get(guild_id)
+    if state is None: return
+
+    state.change_rate = state.change_rate * (1 - self.change_rate_smoothing) + (1.0 if changed else 0.0) * self.change_rate_smoothing
+    state.is_active = is_active
+    state.failures = 0
+    state.last_refresh = now
+
+    interval = self.get_refresh_interval(state, now)
+    if interval is None:
+      state.version += 1
+      return
+    self._push(state, now + interval)
+
+  def restore_refresh(self, guild_id: int, last_refresh: datetime.datetime, now: datetime.datetime):
+    """
+    Schedule guild refreshed before restart according to its last refresh time
+    """
+    state = self.states.get(guild_id)
+    if state is None: return
+
+    state.last_refresh = last_refresh
+    interval = self.get_refresh_interval(state, now)
+    if interval is None:
+      state.version += 1
+      return
+    self._push(state, last_refresh + interval)
+
+  def mark_failed(self, guild_id: int, now: datetime.datetime):
+    state = self.states.get(guild_id)
+    if state is None: return
+
+    state.failures += 1
+    interval = self.get_refresh_interval(state, now)
+    retry_delay = self.hot_interval * (2 ** min(state.failures - 1, 10))
+    self._push(state, now + (min(retry_delay, interval) if interval is not None else retry_delay))
+
+  def get_number_of_due_guilds(self, now: datetime.datetime) -> int:
+    return len([1 for next_due, version, guild_id in self.heap if next_due <= now and guild_id in self.states and self.states[guild_id].version == version])
@@ -0,0 +1,156 @@
+# Case insensitive substring search over names of entities with integer ids, answered from trigram posting lists without database
+
+import bisect
+import itertools
+from typing import Dict, List, Optional, Tuple, Iterable, Iterator, Set
+
+TRIGRAM_LENGTH = 3
+INTERSECTION_THRESHOLD = 500
+
+def fold_name(name: Optional[str]) -> str:
+  if name is None: return ""
+  folded_name = name.lower()
+  # Most names are already lowercase, their string is shared
+  return name if folded_name == name else folded_name
+
+def get_trigrams(folded_name: str) -> Set[str]:
+  return {folded_name[index:index + TRIGRAM_LENGTH] for index in range(len(folded_name) - TRIGRAM_LENGTH + 1)}
+
+class NameSearchIndex:
+  """
+  Prefix matches are looked up in names sorted by bisection, substring matches of queries with at least 3 characters in trigram posting lists
+  """
+  def __init__(self, short_query_scan_limit: int=50_000):
+    # Substring matches of queries shorter than trigram are only looked for in this number of names, prefix matches are always complete
+    self.short_query_scan_limit = short_query_scan_limit
+
+    self.names: Dict[int, str] = {}
+    self.folded_names: Dict[int, str] = {}
+    self.sorted_names: List[Tuple[str, int]] = []
+    self.postings: Dict[str, List[int]] = {}
+
+  def __len__(self) -> int:
+    return len(self.names)
+
+  def __contains__(self, entity_id: int) -> bool:
+    return entity_id in self.names
+
+  def get_name(self, entity_id: int) -> Optional[str]:
+    return self.names.get(entity_id)
+
+  def _add_postings(self, entity_id: int, name: Optional[str]) -> str:
+    folded_name = fold_name(name)
+    self.names[entity_id] = name if name is not None else ""
+    self.folded_names[entity_id] = folded_name
+    for trigram in get_trigrams(folded_name):
+      posting = self.postings.get(trigram)
+      if posting is None:
+        self.postings[trigram] = [entity_id]
+      else:
+        posting.append(entity_id)
+    return folded_name
+
+  def add_many(self, items: Iterable[Tuple[int, Optional[str]]]):
+    """
+    Bulk load of entities, sorted names are sorted once at the end
+    """
+    for entity_id, name in items:
+      if entity_id in self.names:
+        self.set(entity_id, name)
+      else:
+        self.sorted_names.append((self._add_postings(entity_id, name), entity_id))
+    self.sorted_names.sort()
+
+  def set(self, entity_id: int, name: Optional[str]):
+    """
+    Add entity or update its name
+    """
+    if entity_id in self.names:
+      if self.names[entity_id] == (name if name is not None else ""): return
+      self.remove(entity_id)
+
+    bisect.insort(self.sorted_names, (self._add_postings(entity_id, name), entity_id))
+
+  def remove(self, entity_id: int) -> bool:
+    if entity_id not in self.names: return False
+
+    del self.names[entity_id]
+    folded_name = self.folded_names.pop(entity_id)
+
+    index = bisect.bisect_left(self.sorted_names, (folded_name, entity_id))
+    if index < len(self.sorted_names) and self.sorted_names[index] == (folded_name, entity_id):
+      del self.sorted_names[index]
+
+    for trigram in get_trigrams(folded_name):
+      posting = self.postings.get(trigram)
+      if posting is None: continue
+      posting.remove(entity_id)
+      if not posting:
+        del self.postings[trigram]
+    return True
+
+  def clear(self):
+    self.names.clear()
+    self.folded_names.clear()
+    self.sorted_names.clear()
+    self.postings.clear()
+
+  def _get_prefix_matches(self, folded_query: str, limit: int) -> List[int]:
+    matches = []
+    index = bisect.bisect_left(self.sorted_names, (folded_query,))
+    while index < len(self.sorted_names) and len(matches) < limit and self.sorted_names[index][0].startswith(folded_query):
+      matches.append(self.sorted_names[index][1])
+      index += 1
+    return matches
+
+  def _get_substring_candidates(self, folded_query: str) -> Iterator[int]:
+    if len(folded_query) < TRIGRAM_LENGTH:
+      yield from itertools.islice(self.folded_names, self.short_query_scan_limit)
+      return
+
+    postings = []
+    for trigram in get_trigrams(folded_query):
+      posting = self.postings.get(trigram)
+      if posting is None: return
+      postings.append(posting)
+    postings.sort(key=len)
+
+    # Frequent matches are found in beginning of shortest list, intersection is built only for rare ones
+    yield from postings[0][:INTERSECTION_THRESHOLD]
+    if len(postings[0]) <= INTERSECTION_THRESHOLD: return
+
+    candidates = set(postings[0][INTERSECTION_THRESHOLD:])
+    for posting in postings[1:]:
+      # Substring check of few remaining candidates is cheaper than intersection with much longer list
+      if len(candidates) <= 256 or len(posting) > 16 * len(candidates): break
+      candidates.intersection_update(posting)
+    yield from candidates
+
+  def search(self, query: Optional[str], limit: int=25) -> List[Tuple[int, str]]:
+    """
+    Matching id is first, then names starting with query in alphabetical order, then names containing query
+    Substring matches are collected only until limit is reached so their order is not alphabetical
+
+    :param query: Part of name or id, first names in alphabetical order when empty
+    :return: List[Tuple[id, name]] of best matches
+    """
+    folded_query = fold_name(query.strip()) if query is not None else ""
+    if not folded_query:
+      return [(entity_id, self.names[entity_id]) for _, entity_id in self.sorted_names[:limit]]
+
+    matches = []
+    if folded_query.isnumeric() and int(folded_query) in self.names:
+      matches.append(int(folded_query))
+    matches.extend(entity_id for entity_id in self._get_prefix_matches(folded_query, limit) if entity_id not in matches)
+
+    if len(matches) < limit:
+      found = set(matches)
+      for entity_id in self._get_substring_candidates(folded_query):
+        if entity_id in found: continue
+        folded_name = self.folded_names[entity_id]
+        if folded_query in folded_name and not folded_name.startswith(folded_query):
+          matches.append(entity_id)
+          found.add(entity_id)
+          if len(matches) >= limit: break
+
+    return [(entity_id, self.names[entity_id]) for entity_id in matches[:limit]]
@@ -0,0 +1,97 @@
+# Mergeable quantile sketch with logarithmic buckets (DDSketch), values can be also removed so it can follow changing participations
+
+import json
+import math
+from typing import Dict
+
+class QuantileSketch:
+  def __init__(self, relative_accuracy: float=0.01):
+    self.relative_accuracy = min(max(relative_accuracy, 1e-6), 0.5)
+    self.gamma = (1 + self.relative_accuracy) / (1 - self.relative_accuracy)
+    self.log_gamma = math.log(self.gamma)
+
+    self.zero_count = 0
+    self.buckets: Dict[int, int] = {}
+
+  @property
+  def count(self) -> int:
+    return self.zero_count + self.nonzero_count
+
+  @property
+  def nonzero_count(self) -> int:
+    return sum(self.buckets.values())
+
+  def _get_index(self, value: float) -> int:
+    return math.ceil(math.log(value) / self.log_gamma)
+
+  def _get_value(self, index: int) -> float:
+    # Value with equal relative error to both bounds of bucket
+    return 2 * self.gamma ** index / (self.gamma + 1)
+
+  def add(self, value: float, count: int=1):
+    if value <= 0:
+      self.zero_count += count
+    else:
+      index = self._get_index(value)
+      self.buckets[index] = self.buckets.get(index, 0) + count
+
+  def remove(self, value: float, count: int=1):
+    if value <= 0:
+      self.zero_count = max(self.zero_count - count, 0)
+    else:
+      index = self._get_index(value)
+      remaining = self.buckets.get(index, 0) - count
+      if remaining > 0:
+        self.buckets[index] = remaining
+      else:
+        self.buckets.pop(index, None)
+
+  def merge(self, other: "QuantileSketch"):
+    if not math.isclose(self.gamma, other.gamma):
+      raise ValueError("Only sketches with same relative accuracy can be merged")
+
+    self.zero_count += other.zero_count
+    for index, count in other.buckets.items():
+      self.buckets[index] = self.buckets.get(index, 0) + count
+
+  def _get_value_at_rank(self, rank: int, zero_count: int) -> float:
+    if rank < zero_count:
+      return 0.0
+
+    cumulative = zero_count
+    for index in sorted(self.buckets):
+      cumulative += self.buckets[index]
+      if rank < cumulative:
+        return self._get_value(index)
+    return self._get_value(max(self.buckets))
+
+  def get_quantile(self, quantile: float, ignore_zero: bool=False) -> float:
+    """
+    Value interpolated between neighbouring ranks (same as percentile_cont), relative error is bound by accuracy of sketch
+
+    :param quantile: Quantile in range 0 - 1
+    :param ignore_zero: Ignore zero values
+    """
+    zero_count = 0 if ignore_zero else self.zero_count
+    total = zero_count + self.nonzero_count
+    if total == 0:
+      return 0.0
+
+    rank = min(max(quantile, 0.0), 1.0) * (total - 1)
+    lower_rank = math.floor(rank)
+    lower = self._get_value_at_rank(lower_rank, zero_count)
+    if rank == lower_rank:
+      return lower
+    upper = self._get_value_at_rank(lower_rank + 1, zero_count)
+    return lower + (upper - lower) * (rank - lower_rank)
+
+  def to_string(self) -> str:
+    return json.dumps({"a": self.relative_accuracy, "z": self.zero_count, "b": {str(index): count for index, count in self.buckets.items()}}, separators=(",", ":"))
+
+  @classmethod
+  def from_string(cls, data: str) -> "QuantileSketch":
+    raw_data = json.loads(data)
+    sketch = cls(raw_data["a"])
+    sketch.zero_count = raw_data["z"]
+    sketch.buckets = {int(index): count for index, count in raw_data["b"].items()}
+    return sketch
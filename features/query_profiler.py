@@ -0,0 +1,98 @@
+# Profiler of database statements aggregated per calling function in time buckets
+
+import collections
+import dataclasses
+import time
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Upper bounds of latency histogram buckets in seconds, last bucket is unbounded
+HISTOGRAM_BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+@dataclasses.dataclass
+class QueryStats:
+  calls: int = 0
+  total_seconds: float = 0.0
+  max_seconds: float = 0.0
+  rows: int = 0
+  histogram: List[int] = dataclasses.field(default_factory=lambda: [0] * (len(HISTOGRAM_BOUNDS) + 1))
+
+  def record(self, seconds: float, rows: Optional[int]):
+    self.calls += 1
+    self.total_seconds += seconds
+    self.max_seconds = max(self.max_seconds, seconds)
+    if rows is not None and rows > 0:
+      self.rows += rows
+
+    for index, bound in enumerate(HISTOGRAM_BOUNDS):
+      if seconds <= bound:
+        self.histogram[index] += 1
+        break
+    else:
+      self.histogram[-1] += 1
+
+  def merge(self, other: "QueryStats"):
+    self.calls += other.calls
+    self.total_seconds += other.total_seconds
+    self.max_seconds = max(self.max_seconds, other.max_seconds)
+    self.rows += other.rows
+    self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+
+  def get_percentile(self, percentile: float) -> float:
+    """
+    :return: Upper bound of histogram bucket containing percentile, capped by maximal latency
+    """
+    if self.calls == 0: return 0.0
+
+    threshold = self.calls * percentile / 100
+    cumulative = 0
+    for index, count in enumerate(self.histogram):
+      cumulative += count
+      if cumulative >= threshold:
+        if index < len(HISTOGRAM_BOUNDS):
+          return min(HISTOGRAM_BOUNDS[index], self.max_seconds)
+        break
+    return self.max_seconds
+
+  @property
+  def average_seconds(self) -> float:
+    return self.total_seconds / self.calls if self.calls else 0.0
+
+class QueryProfiler:
+  def __init__(self, retention_minutes: int, bucket_seconds: int=60):
+    self.retention_seconds = max(retention_minutes, 1) * 60
+    self.bucket_seconds = max(bucket_seconds, 1)
+    self.buckets: Deque[Tuple[int, Dict[str, QueryStats]]] = collections.deque()
+
+  def record(self, caller: str, seconds: float, rows: Optional[int]=None):
+    """
+    Has to be called from event loop thread
+    """
+    bucket_index = int(time.time() // self.bucket_seconds)
+    if not self.buckets or self.buckets[-1][0] != bucket_index:
+      self.buckets.append((bucket_index, collections.defaultdict(QueryStats)))
+      oldest_index = bucket_index - self.retention_seconds // self.bucket_seconds
+      while self.buckets and self.buckets[0][0] < oldest_index:
+        self.buckets.popleft()
+
+    self.buckets[-1][1][caller].record(seconds, rows)
+
+  def get_stats(self, window_seconds: float) -> Dict[str, QueryStats]:
+    """
+    :return: Stats of each calling function merged over last `window_seconds`
+    """
+    oldest_index = int((time.time() - window_seconds) // self.bucket_seconds)
+    merged: Dict[str, QueryStats] = collections.defaultdict(QueryStats)
+    for bucket_index, bucket in self.buckets:
+      if bucket_index < oldest_index: continue
+      for caller, stats in bucket.items():
+        merged[caller].merge(stats)
+    return dict(merged)
+
+  def get_top_by_total_time(self, window_seconds: float, limit: int) -> List[Tuple[str, QueryStats]]:
+    return sorted(self.get_stats(window_seconds).items(), key=lambda item: item[1].total_seconds, reverse=True)[:limit]
+
+  def get_top_by_percentile(self, window_seconds: float, limit: int, percentile: float=95) -> List[Tuple[str, QueryStats]]:
+    return sorted(self.get_stats(window_seconds).items(), key=lambda item: (item[1].get_percentile(percentile), item[1].total_seconds), reverse=True)[:limit]
+
+  def reset(self):
+    self.buckets.clear()
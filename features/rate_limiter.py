@@ -0,0 +1,90 @@
+# Token bucket rate limiter with AIMD (additive increase, multiplicative decrease) rate control
+
+import asyncio
+import collections
+import time
+from typing import Optional
+
+class AdaptiveRateLimiter:
+  def __init__(self, initial_rate: float, min_rate: float, max_rate: float,
+               additive_increase: float, multiplicative_decrease: float,
+               latency_spike_factor: float, error_window_size: int,
+               min_retry_delay_seconds: float, max_retry_delay_seconds: float):
+    self.min_rate = max(min_rate, 0.001)
+    self.max_rate = max(max_rate, self.min_rate)
+    self.rate = min(max(initial_rate, self.min_rate), self.max_rate)
+
+    self.additive_increase = additive_increase
+    self.multiplicative_decrease = min(max(multiplicative_decrease, 0.0), 1.0)
+    self.latency_spike_factor = latency_spike_factor
+
+    self.min_retry_delay = min_retry_delay_seconds
+    self.max_retry_delay = max(max_retry_delay_seconds, min_retry_delay_seconds)
+
+    self.tokens = 1.0
+    self.last_refill = time.monotonic()
+    self.last_decrease: Optional[float] = None
+    self.lock = asyncio.Lock()
+
+    self.average_latency: Optional[float] = None
+    self.outcomes = collections.deque(maxlen=max(error_window_size, 1))
+    self.consecutive_failures = 0
+
+  @property
+  def error_ratio(self) -> float:
+    if not self.outcomes: return 0.0
+    return self.outcomes.count(False) / len(self.outcomes)
+
+  def get_retry_delay(self) -> float:
+    """
+    :return: Delay before next retry round, grows exponentially with consecutive failures
+    """
+    if self.consecutive_failures <= 0:
+      return self.min_retry_delay
+    return min(self.min_retry_delay * (2 ** min(self.consecutive_failures - 1, 16)), self.max_retry_delay)
+
+  def _refill(self):
+    now = time.monotonic()
+    self.tokens = min(self.tokens + (now - self.last_refill) * self.rate, 1.0)
+    self.last_refill = now
+
+  async def acquire(self):
+    async with self.lock:
+      while True:
+        self._refill()
+        if self.tokens >= 1.0:
+          self.tokens -= 1.0
+          return
+        await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+  def _decrease(self):
+    # Decrease only once per round trip so burst of failures from requests already in flight is counted once
+    now = time.monotonic()
+    min_interval = max(self.average_latency if self.average_latency is not None else 0.0, 1.0)
+    if self.last_decrease is not None and now - self.last_decrease < min_interval:
+      return
+
+    self._refill()
+    self.rate = max(self.rate * self.multiplicative_decrease, self.min_rate)
+    self.last_decrease = now
+
+  def report_success(self, latency: float):
+    self.outcomes.append(True)
+    self.consecutive_failures = 0
+
+    if self.average_latency is not None and latency > self.average_latency * self.latency_spike_factor:
+      self._decrease()
+    else:
+      self._refill()
+      self.rate = min(self.rate + self.additive_increase, self.max_rate)
+
+    self.average_latency = latency if self.average_latency is None else (self.average_latency * 0.9 + latency * 0.1)
+
+  def report_failure(self):
+    self.outcomes.append(False)
+    self.consecutive_failures += 1
+    self._decrease()
+
+  def __str__(self):
+    average_latency = f"{self.average_latency * 1000:.0f}ms" if self.average_latency is not None else "N/A"
+    return f"{self.rate:.2f} req/s, error ratio {self.error_ratio * 100:.1f}%, average latency {average_latency}"
@@ -1,52 +1,36 @@
 import re
 import datetime
 from typing import Optional, Tuple
-from sqlalchemy import exc
 
-from database import dt_user_repo, dt_guild_repo, dt_items_repo, event_participation_repo, tracking_settings_repo, questions_and_answers_repo, session_maker
+from database import dt_user_repo, dt_guild_repo, dt_name_search_repo, dt_items_repo, event_participation_repo, tracking_settings_repo, questions_and_answers_repo, session_maker
 from utils import string_manipulation, dt_helpers
 from utils.logger import setup_custom_logger
 
 id_in_identifier_regex = re.compile(r"([A-Z]*) .*\((\d*)\).*")
 logger = setup_custom_logger(__name__)
 
-async def autocomplete_identifier_user(_, string: Optional[str]):
-  user_strings = []
+def get_user_identifier_string(user_id: int, username: Optional[str]) -> str:
+  prefix = f"USER ({user_id}) "
+  return prefix + string_manipulation.truncate_string(username, 25 - len(prefix))
 
-  with session_maker() as session:
-    if string is None or not string:
-      all_users = await dt_user_repo.get_all_users(session, limit=25)
-      for user in all_users:
-        prefix = f"USER ({user.id}) "
-        prefix_len = len(prefix)
-        user_strings.append(prefix + string_manipulation.truncate_string(user.username, 25 - prefix_len))
-      return user_strings
-
-  all_users = await dt_user_repo.get_all_users(session, limit=25, search=string)
-  for user in all_users:
-    prefix = f"USER ({user.id}) "
-    prefix_len = len(prefix)
-    user_strings.append(prefix + string_manipulation.truncate_string(user.username, 25 - prefix_len))
-  return user_strings
+def get_guild_identifier_string(guild_id: int, name: Optional[str]) -> str:
+  prefix = f"GUILD ({guild_id}) "
+  return prefix + string_manipulation.truncate_string(name, 25 - len(prefix))
 
-async def autocomplete_identifier_guild(_, string: Optional[str]):
-  guild_strings = []
+async def autocomplete_identifier_user(_, string: Optional[str]):
+  # Database is searched only when name search index is disabled or not loaded yet
+  users = dt_name_search_repo.search_users(string, limit=25)
+  if users is None:
+    with session_maker() as session:
+      users = [(user.id, user.username) for user in await dt_user_repo.get_all_users(session, limit=25, search=string if string else None)]
+  return [get_user_identifier_string(user_id, username) for user_id, username in users]
 
-  with session_maker() as session:
-    if string is None or not string:
-      all_guilds = await dt_guild_repo.search_guilds(session, limit=25)
-      for guild in all_guilds:
-        prefix = F"GUILD ({guild.id}) "
-        prefix_length = len(prefix)
-        guild_strings.append(prefix + string_manipulation.truncate_string(guild.name, 25 - prefix_length))
-      return guild_strings
-
-    all_guilds = await dt_guild_repo.search_guilds(session, limit=25, search=string)
-    for guild in all_guilds:
-      prefix = F"GUILD ({guild.id}) "
-      prefix_length = len(prefix)
-      guild_strings.append(prefix + string_manipulation.truncate_string(guild.name, 25 - prefix_length))
-    return guild_strings
+async def autocomplete_identifier_guild(_, string: Optional[str]):
+  guilds = dt_name_search_repo.search_guilds(string, limit=25)
+  if guilds is None:
+    with session_maker() as session:
+      guilds = [(guild.id, guild.name) for guild in await dt_guild_repo.search_guilds(session, limit=25, search=string if string else None)]
+  return [get_guild_identifier_string(guild_id, name) for guild_id, name in guilds]
 
 async def autocomplete_identifier_guild_and_user(_, string: Optional[str]):
   result = await autocomplete_identifier_user(None, string)
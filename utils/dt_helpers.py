@@ -1,12 +1,17 @@
 import asyncio
 import datetime
 import dataclasses
+import hashlib
+import json
 from typing import List, Optional, Tuple
 import traceback
+import time
+import pandas as pd
 from dateutil import tz
-from aiohttp import ClientSession, ClientTimeout
+from aiohttp import ClientSession, ClientTimeout, ClientError
 
 from config import config
+from features.rate_limiter import AdaptiveRateLimiter
 from utils.logger import setup_custom_logger
 
 logger = setup_custom_logger(__name__)
@@ -52,6 +57,9 @@ class DTGuildData:
   level: int
   players: List[DTUserData]
 
+  # Hash of API payload, None when data were not created from API response
+  payload_hash: Optional[str]=None
+
   @property
   def is_active(self):
     for player in self.players:
@@ -80,6 +88,82 @@ def get_event_index(date:datetime.datetime):
 
   return event_year, week_number
 
+def get_event_indexes(dates: pd.Series) -> Tuple[pd.Series, pd.Series]:
+  """
+  Column-wise version of get_event_index for series of naive datetimes
+
+  :return: series of event years, series of event weeks
+  """
+  event_years = dates.dt.year.astype("int64")
+  week_numbers = dates.dt.isocalendar().week.astype("int64")
+
+  event_years = event_years.mask((dates.dt.month == 1) & (week_numbers > 5), event_years - 1)
+
+  weekdays = dates.dt.weekday
+  before_event_start = ((weekdays < config.event_tracker.event_start_day) |
+                        ((weekdays == config.event_tracker.event_start_day) & (dates.dt.hour < config.event_tracker.event_start_hour)) |
+                        ((weekdays == config.event_tracker.event_start_day) & (dates.dt.hour == config.event_tracker.event_start_hour) & (dates.dt.minute < config.event_tracker.event_start_minute)))
+  week_numbers = week_numbers.mask(before_event_start, week_numbers - 1)
+
+  previous_year = week_numbers <= 0
+  event_years = event_years.mask(previous_year, event_years - 1)
+  last_weeks = pd.to_datetime(event_years.astype(str) + "-12-28").dt.isocalendar().week.astype("int64")
+  week_numbers = week_numbers.mask(previous_year, last_weeks)
+
+  return event_years, week_numbers
+
+def normalize_event_data(dataframe: pd.DataFrame, guild_id: int) -> Optional[pd.DataFrame]:
+  """
+  Normalize event data exported from other trackers, amount can be in `amount` or `donate` column
+  and event in `week` and `year`, `date` or `timestamp` columns, rows with invalid values are dropped
+
+  :return: dataframe with columns guild_id, user_id, event_year, event_week, amount and username or None if file is missing required columns
+  """
+  columns = set(dataframe.columns)
+  if "user_id" not in columns:
+    logger.warning("User id not found")
+    return None
+
+  if "amount" in columns:
+    amounts = dataframe["amount"]
+  elif "donate" in columns:
+    amounts = dataframe["donate"]
+  else:
+    logger.warning("Donate amount not found")
+    return None
+
+  if "week" in columns and "year" in columns:
+    event_years = pd.to_numeric(dataframe["year"], errors="coerce")
+    event_weeks = pd.to_numeric(dataframe["week"], errors="coerce")
+  else:
+    if "date" in columns:
+      # UTC offsets are dropped to keep local time of each date same as datetime.fromisoformat does
+      date_strings = dataframe["date"].astype("string").str.strip().str.replace(r"(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)(?:Z|[+-]\d{2}:?\d{2})$", r"\1", regex=True)
+      dates = pd.to_datetime(date_strings, errors="coerce", format="ISO8601")
+    elif "timestamp" in columns:
+      dates = pd.to_datetime(pd.to_numeric(dataframe["timestamp"], errors="coerce"), unit="s", utc=True).dt.tz_convert(tz.gettz()).dt.tz_localize(None)
+    else:
+      logger.warning("Invalid event identifier")
+      return None
+
+    event_years = pd.Series(pd.NA, index=dataframe.index, dtype="Int64")
+    event_weeks = pd.Series(pd.NA, index=dataframe.index, dtype="Int64")
+    valid_dates = dates.notna()
+    if valid_dates.any():
+      years, weeks = get_event_indexes(dates[valid_dates])
+      event_years[valid_dates] = years
+      event_weeks[valid_dates] = weeks
+
+  normalized = pd.DataFrame({"guild_id": guild_id,
+                             "user_id": pd.to_numeric(dataframe["user_id"], errors="coerce"),
+                             "event_year": event_years,
+                             "event_week": event_weeks,
+                             "amount": pd.to_numeric(amounts, errors="coerce"),
+                             "username": dataframe["username"].astype("string") if "username" in columns else pd.Series(pd.NA, index=dataframe.index, dtype="string")})
+  normalized = normalized.dropna(subset=["user_id", "event_year", "event_week", "amount"])
+  normalized = normalized.astype({"user_id": "int64", "event_year": "int64", "event_week": "int64", "amount": "int64"})
+  return normalized
+
 def event_index_to_date_range(year: int, week: int, with_timezone: bool=False) -> Tuple[datetime.datetime, datetime.datetime]:
   # Week started in previous year but event started in new year
   if datetime.datetime.strptime(f"{year}-1-{(config.event_tracker.event_start_day + 1) % 7}", "%Y-%W-%w").replace(hour=config.event_tracker.event_start_hour, minute=config.event_tracker.event_start_minute).day > 7:
@@ -93,25 +177,50 @@ def event_index_to_date_range(year: int, week: int, with_timezone: bool=False) -
 
   return start_date, start_date + datetime.timedelta(days=config.event_tracker.event_length_days, hours=config.event_tracker.event_length_hours, minutes=config.event_tracker.event_length_minutes)
 
-async def get_dt_guild_data(guild_id:int, update: bool=False) -> Optional[DTGuildData]:
-  async with ClientSession(timeout=ClientTimeout(total=60)) as session:
-# Not functioning URL
-#    if update:
-#      async with session.get(f"http://dtat.hampl.space/data/donations/current/guild/id/{guild_id}") as response:
-#        if response.status != 200:
-#          return None
-
-#    await asyncio.sleep(0.1)
+async def get_api_json(http_session: ClientSession, url: str, rate_limiter: Optional[AdaptiveRateLimiter]=None) -> Optional[dict]:
+  if rate_limiter is not None:
+    await rate_limiter.acquire()
 
-    async with session.get(f"http://dtat.hampl.space/data/guild/{guild_id}") as response:
+  start_time = time.perf_counter()
+  try:
+    async with http_session.get(url) as response:
       if response.status != 200:
+        if rate_limiter is not None:
+          rate_limiter.report_failure()
         return None
 
       try:
-        guild_data_json = await response.json(content_type="text/html")
+        json_data = await response.json(content_type="text/html")
       except Exception:
         logger.error(traceback.format_exc())
+        if rate_limiter is not None:
+          rate_limiter.report_failure()
         return None
+  except (ClientError, asyncio.TimeoutError):
+    if rate_limiter is not None:
+      rate_limiter.report_failure()
+    raise
+
+  if rate_limiter is not None:
+    rate_limiter.report_success(time.perf_counter() - start_time)
+  return json_data
+
+async def get_dt_guild_data(guild_id:int, update: bool=False, http_session: Optional[ClientSession]=None, rate_limiter: Optional[AdaptiveRateLimiter]=None) -> Optional[DTGuildData]:
+  if http_session is None:
+    async with ClientSession(timeout=ClientTimeout(total=60)) as http_session:
+      return await get_dt_guild_data(guild_id, update, http_session, rate_limiter)
+
+# Not functioning URL
+#  if update:
+#    async with http_session.get(f"http://dtat.hampl.space/data/donations/current/guild/id/{guild_id}") as response:
+#      if response.status != 200:
+#        return None
+
+#  await asyncio.sleep(0.1)
+
+  guild_data_json = await get_api_json(http_session, f"{config.data_manager.dt_api_url}/data/guild/{guild_id}", rate_limiter)
+  if guild_data_json is None:
+    return None
 
   if config.data_manager.ignore_empty_guilds:
     if len(guild_data_json["players"]["data"]) == 0:
@@ -121,19 +230,17 @@ async def get_dt_guild_data(guild_id:int, update: bool=False) -> Optional[DTGuil
   for player_data in guild_data_json["players"]["data"]:
     players.append(DTUserData.from_api_data(player_data))
 
-  return DTGuildData(guild_data_json["name"] if guild_data_json["name"] is not None else "*Unknown*", guild_data_json["id"], guild_data_json["level"], players)
+  payload_hash = hashlib.sha256(json.dumps(guild_data_json, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+  return DTGuildData(guild_data_json["name"] if guild_data_json["name"] is not None else "*Unknown*", guild_data_json["id"], guild_data_json["level"], players, payload_hash)
 
-async def get_ids_of_all_guilds() -> Optional[List[int]]:
-  async with ClientSession(timeout=ClientTimeout(total=30)) as session:
-    async with session.get("http://dtat.hampl.space/data/guilds") as response:
-      if response.status != 200:
-        return None
+async def get_ids_of_all_guilds(http_session: Optional[ClientSession]=None, rate_limiter: Optional[AdaptiveRateLimiter]=None) -> Optional[List[int]]:
+  if http_session is None:
+    async with ClientSession(timeout=ClientTimeout(total=30)) as http_session:
+      return await get_ids_of_all_guilds(http_session, rate_limiter)
 
-      try:
-        json_data = await response.json(content_type="text/html")
-      except Exception:
-        logger.error(traceback.format_exc())
-        return None
+  json_data = await get_api_json(http_session, f"{config.data_manager.dt_api_url}/data/guilds", rate_limiter)
+  if json_data is None:
+    return None
 
   ids = []
   for guild_data in json_data["data"]: